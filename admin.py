@@ -1,7 +1,13 @@
 # admin.py
+import io
+import json
 from discord.ext import commands
 import discord
 
+from metrics import command_metrics, query_tracer
+from deadline import defer_ephemeral
+import shardstate
+
 # Define a set of administrative Discord IDs
 ADMIN_USER_IDS = {
     230773943240228864,  # gimmic
@@ -41,6 +47,7 @@ class AdminCommands(commands.Cog):
 
     @commands.slash_command(name='admin_list_guilds', description="List all guilds the bot is part of.")
     @is_admin()
+    @defer_ephemeral
     async def admin_list_guilds_command(self, interaction: discord.Interaction):
         # Check if the command user is an admin
         if interaction.user.id not in ADMIN_USER_IDS:
@@ -86,17 +93,59 @@ class AdminCommands(commands.Cog):
     @is_admin()
     async def admin_notice_command(self, interaction, title: str, message: str):
         embed = discord.Embed(title=title, description=message, color=discord.Color.blue())
-        channels_sent = 0
-        for guild in self.bot.guilds:
-            channel = discord.utils.get(guild.text_channels, name="chivstats-ranked")
-            if channel:
-                try:
-                    await channel.send(embed=embed)
-                    channels_sent += 1
-                except Exception as e:
-                    print(f"Failed to send message to {channel.name} in {guild.name}: {e}")
+        channels_sent = len(await shardstate.broadcast(self.bot, "chivstats-ranked", embed=embed))
         await interaction.response.send_message(f"Notice sent to {channels_sent} channels.")
 
+    @commands.slash_command(name='admin_metrics', description="Show per-command latency, DB and REST usage.")
+    @is_admin()
+    @defer_ephemeral
+    async def admin_metrics_command(self, interaction: discord.Interaction):
+        lines = command_metrics.summary_lines()
+        if not lines:
+            await interaction.response.send_message("No commands have been measured yet.", ephemeral=True)
+            return
+        cache = self.bot.response_cache
+        lines.append(f"Response cache: {cache.hits} hits, {cache.misses} misses, {len(cache.entries)} entries")
+        pubsub = self.bot.pubsub
+        if pubsub is not None:
+            state = "connected" if pubsub.connected.is_set() else "disconnected"
+            lines.append(f"Change listener: {state}, {pubsub.received} notifications, {pubsub.reconnects} reconnects")
+        profiles = self.bot.profiles
+        lines.append(f"Player profiles: {len(profiles.by_discordid)} by discord id, {len(profiles.by_playfabid)} by playfab id, "
+                     f"~{profiles.memory_bytes() / 1024 / 1024:.1f} MiB")
+
+        # Send in chunks to stay under Discord's 2000 character limit per message
+        chunks = [""]
+        for line in lines:
+            if len(chunks[-1]) + len(line) + 1 > 1990:
+                chunks.append("")
+            chunks[-1] += line + "\n"
+        await interaction.response.send_message(f"```{chunks[0]}```", ephemeral=True)
+        for chunk in chunks[1:]:
+            await interaction.followup.send(f"```{chunk}```", ephemeral=True)
+
+    @commands.slash_command(name='admin_query_report', description="Show the database statements that took the most time.")
+    @is_admin()
+    @defer_ephemeral
+    async def admin_query_report_command(self, interaction: discord.Interaction, limit: int = 10):
+        summary = query_tracer.report_text(limit)
+        if not summary:
+            await interaction.response.send_message("No queries have been traced yet.", ephemeral=True)
+            return
+        # The full report goes along as JSON for offline digging
+        report = discord.File(io.BytesIO(json.dumps(query_tracer.report(len(query_tracer.statements)), indent=2).encode()), filename="query_report.json")
+        await interaction.response.send_message(f"```{summary[:1990 - 6]}```", file=report, ephemeral=True)
+
+    @commands.slash_command(name='admin_loop_lag', description="Show event loop lag and the code that blocked it.")
+    @is_admin()
+    @defer_ephemeral
+    async def admin_loop_lag_command(self, interaction: discord.Interaction):
+        if self.bot.loop_monitor is None:
+            await interaction.response.send_message("The loop lag monitor is disabled.", ephemeral=True)
+            return
+        report = "\n".join(self.bot.loop_monitor.report_lines())
+        await interaction.response.send_message(f"```{report[:1990]}```", ephemeral=True)
+
     @commands.slash_command(name='admin_register', description="Administratively correct user registration.")
     @is_admin()
     async def admin_register(self, interaction, member: discord.Member, playfabid: str):
@@ -105,7 +154,7 @@ class AdminCommands(commands.Cog):
             await interaction.response.send_message("You do not have permissions to use this command.", delete_after=10)
             return
 
-        conn = await create_db_connection()  # Ensure you have this function defined or imported
+        conn = await self.bot.db_pool.acquire()
 
         try:
             player_id = await conn.fetchval("SELECT id FROM players WHERE playfabid = $1", playfabid)
@@ -132,7 +181,7 @@ class AdminCommands(commands.Cog):
             await interaction.response.send_message("An error occurred while processing the request.")
             print(f"An error occurred: {e}")
         finally:
-            await close_db_connection(conn)
+            await self.bot.db_pool.release(conn)
 
 def setup(bot):
     bot.add_cog(AdminCommands(bot))
\ No newline at end of file
@@ -0,0 +1,113 @@
+#audit.py
+import asyncio
+import json
+from datetime import datetime, timezone
+
+# Discord rejects messages over 2000 characters
+MESSAGE_LIMIT = 2000
+
+
+class AuditEvent:
+    __slots__ = ('created_at', 'command', 'discord_id', 'playfabid', 'guild_id', 'details', 'message')
+
+    def __init__(self, command, discord_id, playfabid, guild_id, details, message):
+        self.created_at = datetime.now(timezone.utc)
+        self.command = command
+        self.discord_id = discord_id
+        self.playfabid = playfabid
+        self.guild_id = guild_id
+        self.details = details
+        self.message = message
+
+
+class AuditLog:
+    """Audit events queued off the command path, then written and posted in batches.
+
+    record() only enqueues. A background task wakes every `flush_interval`
+    seconds and writes everything pending to audit_log with one COPY. It then
+    posts the same lines to the audit channel as a few multi-line messages, not
+    one message per command.
+    """
+
+    def __init__(self, guild_id, channel_id, flush_interval=3.0, max_pending=10000):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self._channel = None
+        self._task = None
+
+    def record(self, interaction, command, message, playfabid=None, details=None):
+        event = AuditEvent(
+            command,
+            interaction.user.id if interaction.user else None,
+            playfabid,
+            interaction.guild.id if interaction.guild else None,
+            details,
+            message,
+        )
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            print(f"Audit queue full, dropping: {message}")
+
+    def start(self, bot, create_db_connection, close_db_connection):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(bot, create_db_connection, close_db_connection))
+
+    def _drain(self):
+        events = []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+    async def _run(self, bot, create_db_connection, close_db_connection):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                events = self._drain()
+                if events:
+                    await self._persist(events, create_db_connection, close_db_connection)
+                    await self._post(bot, events)
+        finally:
+            # Shutting down: keep whatever is still queued in the table at least
+            events = self._drain()
+            if events:
+                await self._persist(events, create_db_connection, close_db_connection)
+
+    async def _persist(self, events, create_db_connection, close_db_connection):
+        try:
+            conn = await create_db_connection()
+            try:
+                await conn.copy_records_to_table(
+                    'audit_log',
+                    columns=['created_at', 'command', 'discord_id', 'playfabid', 'guild_id', 'details', 'message'],
+                    records=[
+                        (event.created_at, event.command, event.discord_id, event.playfabid, event.guild_id,
+                         json.dumps(event.details) if event.details is not None else None, event.message)
+                        for event in events
+                    ],
+                )
+            finally:
+                await close_db_connection(conn)
+        except Exception as e:
+            print(f"Failed to write {len(events)} audit events: {e}")
+
+    async def _post(self, bot, events):
+        if self._channel is None:
+            guild = bot.get_guild(self.guild_id)
+            self._channel = guild.get_channel(self.channel_id) if guild else None
+            if self._channel is None:
+                return
+
+        chunks = [""]
+        for event in events:
+            line = event.message[:MESSAGE_LIMIT - 1]
+            if len(chunks[-1]) + len(line) + 1 > MESSAGE_LIMIT:
+                chunks.append("")
+            chunks[-1] += line + "\n"
+        for chunk in chunks:
+            try:
+                await self._channel.send(chunk)
+            except Exception as e:
+                print(f"Failed to post audit messages: {e}")
@@ -1,27 +1,48 @@
+import time
+PROCESS_START = time.perf_counter()  # Measured from here to on_ready for the startup breakdown
+
 import os
 import asyncio
 import discord
 from discord.ext import commands
 from discord.ext.commands import check, CheckFailure
 from datetime import datetime, timedelta, timezone
-import time
 import asyncpg
 import traceback
 import pytz
 import json
+from collections import OrderedDict
 from discord.ui import Button, View
 from discord.ext import commands
 
-from lts import LTSCog
-from coin import CoinCog
-from admin import AdminCommands
-from privateservers import PrivateServers
-
-
-# Database connection credentials
-DATABASE = "chivstats"
-USER = "webchiv"
-HOST = "/var/run/postgresql"
+from leaderboard_stats import LeaderboardStatsCache
+from startup import StartupOrchestrator, apply_migrations
+import metrics
+from querytrace import TracedPool
+from loopmonitor import LoopLagMonitor
+from deadline import DeadlineGuard, defer_ephemeral
+from audit import AuditLog
+from matchmaking import Matchmaker
+from readypool import ReadyPools, DUEL_ROLE, DUO_ROLE
+from network import NetworkMembership
+from playfabfilter import PlayFabIdFilter
+from profiles import ProfileStore
+from pubsub import PubSub
+import shardstate
+from shardstate import SharedState, parse_shard_ids
+import responsecache
+from responsecache import ResponseCache
+
+
+# Database connection credentials (overridable for local testing)
+DATABASE = os.getenv('CHIVBOT_DB_NAME', "chivstats")
+USER = os.getenv('CHIVBOT_DB_USER', "webchiv")
+HOST = os.getenv('CHIVBOT_DB_HOST', "/var/run/postgresql")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# Cogs are loaded as extensions during startup rather than imported up front
+COG_EXTENSIONS = ["admin", "lts", "coin", "privateservers"]
 
 # URL for the duels leaderboard and list of Discord guild IDs where the bot is active.
 # Not including guild ids causes a delay in command update replication.
@@ -40,36 +61,63 @@ GUILD_IDS = [1111684756896239677, #unchained @gimmic
 
 target_guild_id = 1111684756896239677  # ID of the 'Chivalry Unchained' guild
 audit_channel_id = 1196358290066640946  # ID of the '#chivstats-audit' channel
+audit_log = AuditLog(target_guild_id, audit_channel_id)  # batched writes to audit_log and #chivstats-audit
 
 
 TOKEN = os.getenv('CHIVBOT_KEY') # Fetch the Discord bot token from environment variables
 
+# Sharding: CHIVBOT_SHARD_COUNT=auto (or a number) runs an AutoShardedBot. Adding CHIVBOT_SHARD_IDS=0-3
+# runs only those of the shards in this process, with other processes running the rest and sharing
+# state through Postgres (see shardstate.py). The process owning shard 0 leads, e.g. runs matchmaking.
+SHARD_COUNT = os.getenv('CHIVBOT_SHARD_COUNT', '')
+SHARD_IDS = parse_shard_ids(os.getenv('CHIVBOT_SHARD_IDS', ''))
+SHARD_LEADER = not SHARD_IDS or 0 in SHARD_IDS
+if SHARD_IDS and not SHARD_COUNT.isdigit():
+    raise SystemExit("CHIVBOT_SHARD_IDS needs a numeric CHIVBOT_SHARD_COUNT.")
+
 # Initialize the bot with command prefix and defined intents
 intents = discord.Intents.default()
 intents.messages = True
 intents.guilds = True
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-    
-
-# Indicate bot startup in console
-print("Bot is starting up...")
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(command_prefix='!', intents=intents, auto_sync_commands=SHARD_LEADER,
+                                  shard_count=None if SHARD_COUNT == 'auto' else int(SHARD_COUNT),
+                                  shard_ids=SHARD_IDS or None)
+else:
+    bot = commands.Bot(command_prefix='!', intents=intents)
+bot.db_pool = None
+bot.pubsub = None  # LISTEN/NOTIFY connection, set up in prepare_startup
+bot.shared_state = None  # set up in prepare_startup when this process owns only some of the shards
+bot.config = {}
+bot.startup = StartupOrchestrator(PROCESS_START)
+bot.loop_monitor = None
+bot.deadline_guard = deadline_guard = DeadlineGuard()  # defers slow commands before Discord's 3s deadline
+bot.response_cache = response_cache = ResponseCache()  # rendered /elo, /help, /house, leaderboards etc.
 
 # Global variables and constants
-duel_queue = []
-duo_queue = []
+duo_team_cache = {}  # duo_pair_key(playfabid1, playfabid2) -> (team_id, elo_rating)
+duo_team_keys = {}  # team_id -> duo_pair_key, to update cached ELO after a match
+player_name_cache = OrderedDict()  # LRU of playfabid -> common name, see get_common_names_from_ranked_players
+PLAYER_NAME_CACHE_SIZE = 4096
 
 leaderboard_classes = ["GlobalXp", "experienceknight"] # List of leaderboards (todo)
+leaderboard_stats = LeaderboardStatsCache(leaderboard_classes)
 
-# Async function to establish a database connection
+# Async function to take a database connection from the shared pool
 async def create_db_connection():
-    return await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+    return await bot.db_pool.acquire()
 
-# Async function to close a database connection
+# Async function to hand a database connection back to the pool
 async def close_db_connection(conn):
-    await conn.close()
+    await bot.db_pool.release(conn)
+
+matchmaker = Matchmaker(bot, create_db_connection, close_db_connection)  # 1v1/2v2 queues, paired by ELO
+ready_pools = ReadyPools()  # live holders of the 1v1/2v2 ping roles, deduplicated across guilds
+network = NetworkMembership()  # who can see #chivstats-ranked, per guild and network-wide
+playfab_filter = PlayFabIdFilter()  # bloom filter of players.playfabid for /register
+bot.profiles = profiles = ProfileStore()  # every ranked player by discord id and playfab id, with their ranks
 
 async def get_discord_name_from_id(guild, discord_id):
     member = guild.get_member(discord_id)
@@ -78,12 +126,19 @@ async def get_discord_name_from_id(guild, discord_id):
     return "Unknown User"
 
 async def get_player_rank(conn, elo_rating):
-    # This query counts how many players have a higher ELO rating than the given rating
-    rank = await conn.fetchval("""
-        SELECT COUNT(*) + 1 FROM ranked_players
-        WHERE elo_duelsx > $1
-    """, elo_rating)
-    return rank
+    # How many players have a higher ELO rating than the given rating, plus one
+    return profiles.rank('elo', elo_rating)
+
+# Every slash and cog command is measured (see metrics.py); the hooks run around each invocation
+@bot.before_invoke
+async def before_any_command(ctx):
+    await metrics.command_started(ctx)
+    deadline_guard.command_started(ctx)
+
+@bot.after_invoke
+async def after_any_command(ctx):
+    deadline_guard.command_finished(ctx)
+    await metrics.command_finished(ctx)
 
 # Decorator to restrict command usage to specific channels
 def is_channel_named(allowed_channel_names):
@@ -114,8 +169,124 @@ async def on_application_command_error(interaction: discord.Interaction, error):
 
 @bot.event
 async def on_ready():
+    # Events may have been missed while disconnected, so the ready pools and network counts are rebuilt either way
+    ready_pools.seed(bot.guilds)
+    network.seed(bot.guilds)
+    response_cache.invalidate(responsecache.NETWORK)
+    if bot.startup.complete:
+        print("Bot has reconnected.")
+        if bot.shared_state is not None:
+            # Seeding dropped the other processes' ready pools; publish ours and reload theirs
+            await bot.shared_state.resync()
+        return
+    bot.startup.end("connect")
     print("Bot has started up.")
+    if bot.loop_monitor is not None:
+        bot.loop_monitor.start()
+
+    async with bot.startup.phase("view restore"):
+        await restore_pending_confirmations()
+
+    async with bot.startup.phase("matchmaking restore"):
+        conn = await create_db_connection()
+        try:
+            await matchmaker.restore(conn)
+        finally:
+            await close_db_connection(conn)
+    if SHARD_LEADER:
+        matchmaker.start()
+    bot.pubsub.start()  # resyncs caches (and shared ready pools) once listening
+
+    if bot.config.get('warm_caches') == 'background':
+        bot.startup.run_in_background("cache warm-up", warm_caches())
+
+    # Keep leaderboard ranks for /stats cached per snapshot
+    leaderboard_stats.start(create_db_connection, close_db_connection)
+    audit_log.start(bot, create_db_connection, close_db_connection)
+    playfab_filter.start(create_db_connection, close_db_connection)
+
+    bot.startup.report()
+
+
+@bot.event
+async def on_member_update(before, after):
+    ready_pools.member_updated(before, after)
+    if before.roles != after.roles:
+        network.recheck_member(after)
+        response_cache.invalidate(responsecache.NETWORK)
+
+
+@bot.event
+async def on_member_join(member):
+    network.recheck_member(member)
+    response_cache.invalidate(responsecache.NETWORK)
+
+
+@bot.event
+async def on_member_remove(member):
+    ready_pools.member_removed(member)
+    network.member_removed(member)
+    response_cache.invalidate(responsecache.NETWORK)
+
+
+@bot.event
+async def on_guild_join(guild):
+    ready_pools.seed_guild(guild)
+    network.recount_guild(guild)
+    response_cache.invalidate(responsecache.NETWORK)
+    if bot.shared_state is not None:
+        await bot.shared_state.guild_changed(guild.id)
+
+
+@bot.event
+async def on_guild_remove(guild):
+    ready_pools.drop_guild(guild.id)
+    network.drop_guild(guild.id)
+    response_cache.invalidate(responsecache.NETWORK)
+    if bot.shared_state is not None:
+        await bot.shared_state.guild_changed(guild.id)
+
+
+@bot.event
+async def on_guild_update(before, after):
+    if before.name != after.name:
+        response_cache.invalidate(responsecache.NETWORK)
+
+
+# Channel and role changes can change who sees #chivstats-ranked; recount just that guild
+@bot.event
+async def on_guild_channel_create(channel):
+    network.recount_guild(channel.guild)
+    response_cache.invalidate(responsecache.NETWORK)
 
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    network.recount_guild(channel.guild)
+    response_cache.invalidate(responsecache.NETWORK)
+
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    if before.name != after.name or before.overwrites != after.overwrites:
+        network.recount_guild(after.guild)
+        response_cache.invalidate(responsecache.NETWORK)
+
+
+@bot.event
+async def on_guild_role_update(before, after):
+    if before.permissions != after.permissions:
+        network.recount_guild(after.guild)
+        response_cache.invalidate(responsecache.NETWORK)
+
+
+@bot.event
+async def on_guild_role_delete(role):
+    network.recount_guild(role.guild)
+    response_cache.invalidate(responsecache.NETWORK)
+
+
+async def restore_pending_confirmations():
     # Load outstanding confirmation requests from the database
     conn = await create_db_connection()
     try:
@@ -179,33 +350,31 @@ async def on_interaction_error(interaction, error):
 # Ensure the bot has the necessary permissions to edit messages and manage messages in the channels it operates in.
 
 async def send_audit_message(interaction):
-    target_guild_id = 1111684756896239677  # ID of the 'Chivalry Unchained' guild
-    audit_channel_id = 1196358290066640946  # ID of the '#chivstats-audit' channel
-    target_guild = bot.get_guild(target_guild_id)
-    audit_channel = target_guild.get_channel(audit_channel_id) if target_guild else None
-
-    if audit_channel:
-        user_id = interaction.user.id
-        user_display_name = interaction.user.display_name
+    user_id = interaction.user.id
+    user_display_name = interaction.user.display_name
 
-        # Reconstruct the command from the interaction
-        command_name = interaction.command.name
-        entered_command = f"/{command_name}"
+    # Reconstruct the command from the interaction
+    command_name = interaction.command.name
+    entered_command = f"/{command_name}"
 
-        # Check if the interaction has options and append them to the command
-        if interaction.options:
-            for option in interaction.options:
-                # Append option name and value to the command string
-                entered_command += f" {option.name}={option.value}"
+    # Check if the interaction has options and append them to the command
+    if interaction.options:
+        for option in interaction.options:
+            # Append option name and value to the command string
+            entered_command += f" {option.name}={option.value}"
 
-        # Create and send the audit message
-        audit_message = f"Command executed: {entered_command} by {user_display_name} (ID: {user_id})"
-        await audit_channel.send(audit_message)
+    # Queue the audit message
+    audit_message = f"Command executed: {entered_command} by {user_display_name} (ID: {user_id})"
+    audit_log.record(interaction, command_name, audit_message)
 
 @bot.slash_command(guild_ids=GUILD_IDS, description="Lists the discords the chivbot is in, highlighting those with a chivstats-ranked channel.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
 async def chivstats_network(interaction: discord.Interaction):
     await interaction.response.defer()
+    embed = await response_cache.get_or_build(('chivstats_network',), (responsecache.NETWORK,), build_network_embed)
+    await interaction.followup.send(embed=embed)  # Sends the message to the channel where the command was used
+
+async def build_network_embed():
     # Predefined order for specific guilds
     priority_guilds = {
         'Tournament Grounds': None,
@@ -213,21 +382,12 @@ async def chivstats_network(interaction: discord.Interaction):
     }
     other_guilds = []
 
-    total_unique_members = set()  # Set to store unique member IDs across all servers
-
     for guild in bot.guilds:
-        chivstats_channel = discord.utils.get(guild.text_channels, name="chivstats-ranked")
-        checkmark = "✅" if chivstats_channel else "❌"
-
-        # Count members in the chivstats-ranked channel, if it exists
-        member_count = len(chivstats_channel.members) if chivstats_channel else 0
-
-        # Add unique member IDs to the total count
-        if chivstats_channel:
-            for member in chivstats_channel.members:
-                total_unique_members.add(member.id)
+        # Counts of members that can see chivstats-ranked are kept by the network tracker
+        member_count = network.guild_count(guild.id)
+        checkmark = "✅" if member_count is not None else "❌"
 
-        guild_info = f"{checkmark} {guild.name} - ID: {guild.id} (👥{member_count})"
+        guild_info = f"{checkmark} {guild.name} - ID: {guild.id} (👥{member_count or 0})"
         
         # Place priority guilds in their specific slots
         if guild.name in priority_guilds:
@@ -238,7 +398,7 @@ async def chivstats_network(interaction: discord.Interaction):
     # Build the final server list with priority guilds first
     server_list = [info for info in priority_guilds.values() if info] + other_guilds
     description = "\n".join(server_list)
-    description += f"\n\n🌍 Total unique members with visibility to #chivstats-ranked: 👥{len(total_unique_members)}"
+    description += f"\n\n🌍 Total unique members with visibility to #chivstats-ranked: 👥{network.unique_members}"
 
     embed = discord.Embed(
         title="Chivstats 亗 Ranked Combat 亗 Network",
@@ -248,14 +408,17 @@ async def chivstats_network(interaction: discord.Interaction):
     
     # Set the footer text
     embed.set_footer(text="Add your clan discord to the Ranked Combat Network! Click the chivbot user profile for details or contact gimmic.")
-    
-    await interaction.followup.send(embed=embed)  # Sends the message to the channel where the command was used
+    return embed
 
 
 
 
 @bot.slash_command(guild_ids=GUILD_IDS, description="RANKED COMBAT: Provides help information about chivbot commands.")
 async def help(interaction: discord.Interaction):
+    embed = await response_cache.get_or_build(('help',), (), build_help_embed)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def build_help_embed():
     commands_info = {
         "/register": "Links your Discord account to a PlayFab ID. Usage: `/register [PlayFabID]`",
         "/submit_duel": "Submit the result of a duel between two players. Usage: `/submit_duel @User1 [score1] @User2 [score2]`",
@@ -278,49 +441,61 @@ async def help(interaction: discord.Interaction):
     )
     for cmd, desc in commands_info.items():
         embed.add_field(name=cmd, value=desc, inline=False)
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    return embed
 
 async def get_display_name_from_ranked_players(playfabid):
-    conn = await create_db_connection()
-    try:
-        row = await conn.fetchrow("SELECT gamename, common_name FROM ranked_players WHERE playfabid = $1", playfabid)
-        return row['gamename'] if row and row['gamename'] else (row['common_name'] if row else "Unknown Player")
-    finally:
-        await close_db_connection(conn)
+    profile = profiles.get_by_playfabid(playfabid)
+    return (profile.display_name or "Unknown Player") if profile else "Unknown Player"
 
-async def format_playfab_id_with_url(playfabid):
-    conn = await create_db_connection()
-    try:
-        most_common_alias = await get_most_common_alias(conn, playfabid)
-        alias_display = f"{playfabid} ('{most_common_alias}')"
-        return f"[{alias_display}](https://chivstats.xyz/leaderboards/player/{playfabid}/)"
-    finally:
-        await close_db_connection(conn)
+async def format_playfab_id_with_url(conn, playfabid):
+    most_common_alias = await get_most_common_alias(conn, playfabid)
+    alias_display = f"{playfabid} ('{most_common_alias}')"
+    return f"[{alias_display}](https://chivstats.xyz/leaderboards/player/{playfabid}/)"
 
 async def get_most_common_alias(conn, playfabid):
+    # players.most_common_alias is kept up to date from alias_history by a trigger
+    # (migrations/003_players_most_common_alias.sql)
     try:
-        result = await conn.fetchrow("SELECT alias_history FROM players WHERE playfabid = $1", playfabid)
-        if result and result['alias_history']:
-            alias_history = json.loads(result['alias_history'])
-            most_common_alias = max(alias_history, key=alias_history.get, default="Unknown Alias")
-            return most_common_alias
-        else:
-            return "Unknown Alias"
+        most_common_alias = await conn.fetchval("SELECT most_common_alias FROM players WHERE playfabid = $1", playfabid)
+        return most_common_alias or "Unknown Alias"
     except Exception as e:
         print(f"Error in get_most_common_alias: {e}")
         return "Error"
 
 async def get_playfabid_of_discord_id(conn, discord_id):
-    result = await conn.fetchrow("SELECT playfabid FROM ranked_players WHERE discordid = $1", discord_id)
-    return result[0] if result else None
+    profile = profiles.get(discord_id)
+    return profile.playfabid if profile else None
+
+async def get_common_names_from_ranked_players(conn, playfabids):
+    # Resolve common names for a list of PlayFab IDs. Recently used names come from
+    # player_name_cache; the rest are fetched together in one query, falling back to
+    # the precomputed most common alias for anyone without a common name.
+    names = {}
+    missing = []
+    for playfabid in set(playfabids):
+        if playfabid in player_name_cache:
+            player_name_cache.move_to_end(playfabid)
+            names[playfabid] = player_name_cache[playfabid]
+        else:
+            missing.append(playfabid)
+
+    if missing:
+        rows = await conn.fetch("""
+            SELECT p.playfabid, COALESCE(NULLIF(rp.common_name, ''), p.most_common_alias, 'Unknown Alias') AS name
+            FROM players p
+            LEFT JOIN ranked_players rp ON rp.playfabid = p.playfabid
+            WHERE p.playfabid = ANY($1::text[])
+            """, missing)
+        for row in rows:
+            names[row['playfabid']] = player_name_cache[row['playfabid']] = row['name']
+        while len(player_name_cache) > PLAYER_NAME_CACHE_SIZE:
+            player_name_cache.popitem(last=False)
+
+    return names
 
 async def get_common_name_from_ranked_players(conn, playfabid):
-    result = await conn.fetchrow("SELECT common_name FROM ranked_players WHERE playfabid = $1", playfabid)
-
-    if result and result['common_name']:  # Return the common name if found
-        return result['common_name']
-    else:  # If no common name found in ranked_players, look in the players table
-        return await get_most_common_alias(conn, playfabid)
+    names = await get_common_names_from_ranked_players(conn, [playfabid])
+    return names.get(playfabid, "Unknown Alias")
 
 
 import re
@@ -333,29 +508,21 @@ def remove_mentions(text):
 
 async def echo_to_guilds(interaction, embed, echo_channel_name):
     origin_guild_name = interaction.guild.name
-    guild_names_sent_to = []
-
-    for guild in bot.guilds:
-        echo_channel = discord.utils.get(guild.text_channels, name=echo_channel_name)
-        if echo_channel and echo_channel.id != interaction.channel.id:
-            try:
-                embed_copy = embed.copy()
+    embed_copy = embed.copy()
 
-                # Use the custom remove_mentions function
-                if embed_copy.title:
-                    embed_copy.title = remove_mentions(embed_copy.title)
-                if embed_copy.description:
-                    embed_copy.description = remove_mentions(embed_copy.description)
+    # Use the custom remove_mentions function
+    if embed_copy.title:
+        embed_copy.title = remove_mentions(embed_copy.title)
+    if embed_copy.description:
+        embed_copy.description = remove_mentions(embed_copy.description)
 
-                # Optionally, strip mentions from fields
-                for field in embed_copy.fields:
-                    field.name = remove_mentions(field.name)
-                    field.value = remove_mentions(field.value)
+    # Optionally, strip mentions from fields
+    for field in embed_copy.fields:
+        field.name = remove_mentions(field.name)
+        field.value = remove_mentions(field.value)
 
-                await echo_channel.send(embed=embed_copy)
-                guild_names_sent_to.append(guild.name)
-            except Exception as e:
-                print(f"Failed to send message to {echo_channel.name} in {guild.name}: {e}")
+    # Other shard processes echo to their own guilds
+    guild_names_sent_to = await shardstate.broadcast(bot, echo_channel_name, embed=embed_copy, exclude_channel_id=interaction.channel.id)
 
     if guild_names_sent_to:
         audit_message = f"Message from {origin_guild_name} echoed to the following guilds: {', '.join(guild_names_sent_to)}"
@@ -375,8 +542,9 @@ async def odds(interaction: discord.Interaction, player1: discord.Member, player
         elo_player1, playfabid_player1 = await get_player_data(conn, player1.id)
         elo_player2, playfabid_player2 = await get_player_data(conn, player2.id)
 
-        total_matches_player1 = await conn.fetchval("SELECT COUNT(*) FROM duels WHERE winner_playfabid = $1 OR loser_playfabid = $1", playfabid_player1)
-        total_matches_player2 = await conn.fetchval("SELECT COUNT(*) FROM duels WHERE winner_playfabid = $1 OR loser_playfabid = $1", playfabid_player2)
+        profile_player1, profile_player2 = profiles.get(player1.id), profiles.get(player2.id)
+        total_matches_player1 = profile_player1.duels if profile_player1 else 0
+        total_matches_player2 = profile_player2.duels if profile_player2 else 0
 
         head_to_head_stats, total_kills_deaths = await fetch_head_to_head_detailed(conn, playfabid_player1, playfabid_player2)
 
@@ -447,9 +615,8 @@ def calculate_odds(elo_player1, elo_player2):
     return odds_player1, odds_player2, chance_p1, chance_p2
 
 async def get_player_data(conn, discord_id):
-    elo = await conn.fetchval("SELECT elo_duelsx FROM ranked_players WHERE discordid = $1", discord_id)
-    playfabid = await conn.fetchval("SELECT playfabid FROM ranked_players WHERE discordid = $1", discord_id)
-    return elo, playfabid
+    profile = profiles.get(discord_id)
+    return (profile.elo, profile.playfabid) if profile else (None, None)
 
 async def fetch_head_to_head(conn, playfabid1, playfabid2):
     return await conn.fetch("""
@@ -517,62 +684,68 @@ async def leaderboard(interaction: discord.Interaction, category: str):
 
     await interaction.response.defer()
 
+    if category.lower() in ['duel', 'duels']:
+        embed = await response_cache.get_or_build(('leaderboard', 'duels'), (responsecache.DUELS,), build_duels_leaderboard_embed)
+    else:
+        # Player names are resolved from the guild the command ran in
+        embed = await response_cache.get_or_build(('leaderboard', 'duos', interaction.guild.id), (responsecache.DUOS,),
+                                                  lambda: build_duos_leaderboard_embed(interaction.guild))
+    await interaction.followup.send(embed=embed)
+
+async def build_duels_leaderboard_embed():
     conn = await create_db_connection()
     try:
-        embed = discord.Embed(title=f"{category.title()} Leaderboard", color=discord.Color.blue())
+        players = await conn.fetch("""
+            SELECT discordid, discord_username, elo_duelsx, playfabid FROM ranked_players
+            WHERE retired = FALSE
+            ORDER BY elo_duelsx DESC
+            LIMIT 10
+        """)
 
-        if category.lower() in ['duel', 'duels']:
-            players = await conn.fetch("""
-                SELECT discordid, discord_username, elo_duelsx, playfabid FROM ranked_players
-                WHERE retired = FALSE
-                ORDER BY elo_duelsx DESC
-                LIMIT 10
-            """)
+        tier_assignments = await calculate_tiers(conn)
+        embed = discord.Embed(title="Duels Leaderboard", color=discord.Color.blue())
 
-            tier_assignments = await calculate_tiers(conn)
-            embed = discord.Embed(title=f"{category.title()} Leaderboard", color=discord.Color.blue())
-
-            leaderboard_lines = []
-            for index, player in enumerate(players, 1):
-                discord_id = player['discordid']
-                playfabid = player['playfabid']
-                elo_rating = round(player['elo_duelsx'])  # Round the ELO rating
-                tier_emoji = tier_assignments.get(playfabid, '❓')  # Get tier emoji
-                discord_name = player['discord_username']  # Fetch the display name
-
-                leaderboard_line = f"{index}. {tier_emoji} {discord_name} - {elo_rating}"
-                leaderboard_lines.append(leaderboard_line)
-
-            leaderboard_text = "\n".join(leaderboard_lines)
-            embed.description = leaderboard_text
-
-            await interaction.followup.send(embed=embed)
-
-        elif category.lower() in ['duo', 'duos']:
-            teams = await conn.fetch("""
-                SELECT dt.team_name, dt.elo_rating, rp1.discordid as player1_discordid, rp2.discordid as player2_discordid
-                FROM duo_teams dt
-                JOIN ranked_players rp1 ON dt.player1_id = rp1.playfabid
-                JOIN ranked_players rp2 ON dt.player2_id = rp2.playfabid
-                WHERE dt.retired = FALSE
-                ORDER BY dt.elo_rating DESC
-                LIMIT 10
-            """)
-
-            rank_tier = [f"{index}." for index, _ in enumerate(teams, 1)]
-            team_names = [team['team_name'] for team in teams]
-            elos = [str(team['elo_rating']) for team in teams]
-            player_names = [f"{await get_discord_name_from_id(interaction.guild, team['player1_discordid'])} & {await get_discord_name_from_id(interaction.guild, team['player2_discordid'])}" for team in teams]
-
-            embed.add_field(name="#", value="\n".join(rank_tier), inline=True)
-            embed.add_field(name="Team", value="\n".join(team_names), inline=True)
-            embed.add_field(name="Players", value="\n".join(player_names), inline=True)
-
-            await interaction.followup.send(embed=embed)
+        leaderboard_lines = []
+        for index, player in enumerate(players, 1):
+            playfabid = player['playfabid']
+            elo_rating = round(player['elo_duelsx'])  # Round the ELO rating
+            tier_emoji = tier_assignments.get(playfabid, '❓')  # Get tier emoji
+            discord_name = player['discord_username']  # Fetch the display name
+
+            leaderboard_line = f"{index}. {tier_emoji} {discord_name} - {elo_rating}"
+            leaderboard_lines.append(leaderboard_line)
+
+        embed.description = "\n".join(leaderboard_lines)
+        return embed
     finally:
         await close_db_connection(conn)
 
-async def update_leaderboard_message():
+async def build_duos_leaderboard_embed(guild):
+    conn = await create_db_connection()
+    try:
+        teams = await conn.fetch("""
+            SELECT dt.team_name, dt.elo_rating, rp1.discordid as player1_discordid, rp2.discordid as player2_discordid
+            FROM duo_teams dt
+            JOIN ranked_players rp1 ON dt.player1_id = rp1.playfabid
+            JOIN ranked_players rp2 ON dt.player2_id = rp2.playfabid
+            WHERE dt.retired = FALSE
+            ORDER BY dt.elo_rating DESC
+            LIMIT 10
+        """)
+    finally:
+        await close_db_connection(conn)
+
+    embed = discord.Embed(title="Duos Leaderboard", color=discord.Color.blue())
+    rank_tier = [f"{index}." for index, _ in enumerate(teams, 1)]
+    team_names = [team['team_name'] for team in teams]
+    player_names = [f"{await get_discord_name_from_id(guild, team['player1_discordid'])} & {await get_discord_name_from_id(guild, team['player2_discordid'])}" for team in teams]
+
+    embed.add_field(name="#", value="\n".join(rank_tier), inline=True)
+    embed.add_field(name="Team", value="\n".join(team_names), inline=True)
+    embed.add_field(name="Players", value="\n".join(player_names), inline=True)
+    return embed
+
+async def update_leaderboard_message(notify_shards=True):
     conn = await create_db_connection()
     try:
         embed = discord.Embed(title="Duels Leaderboard", color=discord.Color.blue())
@@ -601,21 +774,43 @@ async def update_leaderboard_message():
         leaderboard_text = "\n".join(leaderboard_lines)
         embed.description = leaderboard_text
 
+        # Edit the message recorded for each guild; fall back to the channel's last message the first time
+        stored = await conn.fetch("SELECT guild_id, channel_id, message_id FROM leaderboard_messages WHERE guild_id = ANY($1::bigint[])",
+                                  [guild.id for guild in bot.guilds])
+        stored = {row['guild_id']: row for row in stored}
         for guild in bot.guilds:
             channel = discord.utils.get(guild.text_channels, name="ranked-leaderboards")
-            if channel:
+            if not channel:
+                continue
+            row = stored.get(guild.id)
+            if row and row['channel_id'] == channel.id:
+                try:
+                    await channel.get_partial_message(row['message_id']).edit(embed=embed)
+                    continue
+                except discord.NotFound:
+                    pass
+            else:
                 last_message = await channel.history(limit=1).flatten()
-                last_message = last_message[0] if last_message else None
-
-                if last_message and last_message.author == bot.user:
-                    await last_message.edit(embed=embed)
-                else:
-                    await channel.send(embed=embed)
-
+                if last_message and last_message[0].author == bot.user:
+                    await last_message[0].edit(embed=embed)
+                    await record_leaderboard_message(conn, guild.id, channel.id, last_message[0].id)
+                    continue
+            message = await channel.send(embed=embed)
+            await record_leaderboard_message(conn, guild.id, channel.id, message.id)
+
+        if notify_shards and bot.shared_state is not None:
+            await bot.shared_state.leaderboard_changed(conn)
     finally:
         await close_db_connection(conn)
 
 
+async def record_leaderboard_message(conn, guild_id, channel_id, message_id):
+    await conn.execute("""
+        INSERT INTO leaderboard_messages (guild_id, channel_id, message_id) VALUES ($1, $2, $3)
+        ON CONFLICT (guild_id) DO UPDATE SET channel_id = EXCLUDED.channel_id, message_id = EXCLUDED.message_id, updated_at = CURRENT_TIMESTAMP
+    """, guild_id, channel_id, message_id)
+
+
 ####################################
 #ELO Duel related code
 async def calculate_tiers(conn):
@@ -710,23 +905,23 @@ def calculate_elo(R, K, games_won, games_played, opponent_rating, c=400):
 async def submit_duel(interaction: discord.Interaction, submitter_score: int, opponent: discord.Member, opponent_score: int):
     await interaction.response.defer() 
     duel_message = None  
+    conn = None
     try:
         # Check if the submitter is trying to submit a duel against themselves
         if interaction.user.id == opponent.id:
             await interaction.followup.send("You cannot duel yourself!", ephemeral=True)
             return
 
-        conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+        conn = await create_db_connection()
 
-        records = await conn.fetch("SELECT discordid, retired FROM ranked_players WHERE discordid = ANY($1::bigint[])", [interaction.user.id, opponent.id])
-        retired_players = {record['discordid']: record['retired'] for record in records if record['retired']}
+        retired_players = [discord_id for discord_id in (interaction.user.id, opponent.id)
+                           if (profile := profiles.get(discord_id)) and profile.retired]
 
         if retired_players:
             message = ""
-            for discord_id, retired in retired_players.items():
-                if retired:
-                    mention = f"<@{discord_id}>"
-                    message += f"{mention} has retired. Please reactivate your account using /reactivate.\n" if discord_id == interaction.user.id else f"Please ask {mention} to reactivate.\n"
+            for discord_id in retired_players:
+                mention = f"<@{discord_id}>"
+                message += f"{mention} has retired. Please reactivate your account using /reactivate.\n" if discord_id == interaction.user.id else f"Please ask {mention} to reactivate.\n"
             await interaction.followup.send(message, ephemeral=True)
             return
 
@@ -740,17 +935,10 @@ async def submit_duel(interaction: discord.Interaction, submitter_score: int, op
         submitter_label = " (submitter)" if interaction.user == winner else ""
         command_text = f"/submit_duel @{interaction.user.display_name} {submitter_score} @{opponent.display_name} {opponent_score}"
 
-        # Send an audit message to a specific guild and channel
-        target_guild_id = 1111684756896239677  # ID of the 'Chivalry Unchained' guild
-        audit_channel_id = 1196358290066640946  # ID of the '#chivstats-audit' channel
-        target_guild = bot.get_guild(target_guild_id)
-        audit_channel = target_guild.get_channel(audit_channel_id) if target_guild else None
-        if audit_channel:
-            # Construct the audit message
-            audit_message = f"Command executed: `/submit_duel {submitter_score} @{opponent.display_name} {opponent_score}` by {interaction.user.display_name} ({interaction.user.id})"
-            
-            # Send the audit message
-            await audit_channel.send(audit_message)
+        # Queue an audit message for the audit channel
+        audit_message = f"Command executed: `/submit_duel {submitter_score} @{opponent.display_name} {opponent_score}` by {interaction.user.display_name} ({interaction.user.id})"
+        audit_log.record(interaction, "submit_duel", audit_message, playfabid=submitter_playfabid,
+                         details={'opponent_id': opponent.id, 'submitter_score': submitter_score, 'opponent_score': opponent_score})
 
         embed = discord.Embed(title="Duel Result (UNVERIFIED)", description=f"Command: `{command_text}`", color=discord.Color.orange())
         embed.add_field(name="Matchup", value=f"{winner.display_name}{winner_label} vs {loser.display_name}{submitter_label}", inline=False)
@@ -758,14 +946,10 @@ async def submit_duel(interaction: discord.Interaction, submitter_score: int, op
 
         duel_message = await interaction.followup.send(embed=embed)
         # Save the confirmation request details to the database
-        conn = await create_db_connection()
-        try:
-            await conn.execute("""
-                INSERT INTO duel_confirmations (message_id, channel_id, submitter_id, opponent_id, winner_id, loser_id, submitter_score, opponent_score, winner_score, loser_score, status) 
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, 'pending')
-            """, duel_message.id, duel_message.channel.id, interaction.user.id, opponent.id, winner.id, loser.id, submitter_score, opponent_score, winner_score, loser_score)
-        finally:
-            await close_db_connection(conn)
+        await conn.execute("""
+            INSERT INTO duel_confirmations (message_id, channel_id, submitter_id, opponent_id, winner_id, loser_id, submitter_score, opponent_score, winner_score, loser_score, status) 
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, 'pending')
+        """, duel_message.id, duel_message.channel.id, interaction.user.id, opponent.id, winner.id, loser.id, submitter_score, opponent_score, winner_score, loser_score)
 
         cst_timezone = pytz.timezone('America/Chicago')
         current_time_cst = datetime.now(pytz.utc).astimezone(cst_timezone)
@@ -788,7 +972,7 @@ async def submit_duel(interaction: discord.Interaction, submitter_score: int, op
         await interaction.followup.send("An error occurred while processing the duel.", ephemeral=True)
     finally:
         if conn:
-            await conn.close()
+            await close_db_connection(conn)
 
 
 class ConfirmationView(discord.ui.View):
@@ -871,12 +1055,6 @@ class ConfirmationView(discord.ui.View):
         await self.clear_buttons()
         conn = await create_db_connection()
 
-        target_guild_id = 1111684756896239677  # ID of the 'Chivalry Unchained' guild
-        audit_channel_id = 1196358290066640946  # ID of the '#chivstats-audit' channel
-
-        target_guild = bot.get_guild(target_guild_id)
-        audit_channel = target_guild.get_channel(audit_channel_id) if target_guild else None
-
         winner_data = await conn.fetchrow("SELECT playfabid, elo_duelsx FROM ranked_players WHERE discordid = $1", self.winner_id)
         loser_data = await conn.fetchrow("SELECT playfabid, elo_duelsx FROM ranked_players WHERE discordid = $1", self.loser_id)
 
@@ -913,12 +1091,14 @@ class ConfirmationView(discord.ui.View):
                     new_house_balance = house_balance - (payout_amount * 2)
                     await conn.execute("UPDATE ranked_players SET coins = coins + $1 WHERE discordid = ANY($2::bigint[])", payout_amount, [self.winner_id, self.loser_id])
                     await conn.execute("UPDATE house_account SET balance = $1", new_house_balance)
+            response_cache.invalidate(responsecache.DUELS, responsecache.HOUSE)
 
-            updated_winner_data = await conn.fetchrow("SELECT elo_duelsx, coins FROM ranked_players WHERE discordid = $1", self.winner_id)
-            updated_loser_data = await conn.fetchrow("SELECT elo_duelsx, coins FROM ranked_players WHERE discordid = $1", self.loser_id)
+            # Only the two players' profiles change; refresh them in one query
+            await profiles.refresh(conn, discordids=[self.winner_id, self.loser_id])
+            updated_winner, updated_loser = profiles.get(self.winner_id), profiles.get(self.loser_id)
 
-            updated_winner_elo, updated_winner_purse = updated_winner_data['elo_duelsx'], updated_winner_data['coins']
-            updated_loser_elo, updated_loser_purse = updated_loser_data['elo_duelsx'], updated_loser_data['coins']
+            updated_winner_elo, updated_winner_purse = updated_winner.elo, updated_winner.coins
+            updated_loser_elo, updated_loser_purse = updated_loser.elo, updated_loser.coins
             tier_assignments = await calculate_tiers(conn)
             winner_tier_emoji = tier_assignments.get(winner_playfabid, ':regional_indicator_d:')
             loser_tier_emoji = tier_assignments.get(loser_playfabid, ':regional_indicator_d:')
@@ -952,9 +1132,10 @@ class ConfirmationView(discord.ui.View):
             # Call echo_to_guilds function to send the message to other guilds
             audit_message = await echo_to_guilds(interaction, updated_embed, echo_channel_name)
 
-            # Send audit message to the audit channel
-            if audit_channel:
-                await audit_channel.send(audit_message)
+            # Queue the audit message for the audit channel
+            audit_log.record(interaction, "submit_duel:confirm", audit_message, playfabid=submitting_playfabid,
+                             details={'winner_playfabid': winner_playfabid, 'loser_playfabid': loser_playfabid,
+                                      'winner_score': self.winner_score, 'loser_score': self.loser_score})
 
             winner_rank = await get_player_rank(conn, updated_winner_elo)
             loser_rank = await get_player_rank(conn, updated_loser_elo)
@@ -964,10 +1145,7 @@ class ConfirmationView(discord.ui.View):
                 f"**Duel**: [{self.winner_score}-{self.loser_score}] **{interaction.guild.get_member(self.winner_id).display_name}** _({round(updated_winner_elo)})_ "
                 f"vs. **{interaction.guild.get_member(self.loser_id).display_name}** _({round(updated_loser_elo)})_ [elo:{winner_elo_change}, coin:{total_reward}]."
             )
-            for guild in bot.guilds:
-                ranked_audit_channel = discord.utils.get(guild.text_channels, name='ranked-audit')
-                if ranked_audit_channel:
-                    await ranked_audit_channel.send(confirmation_message)
+            await shardstate.broadcast(bot, 'ranked-audit', content=confirmation_message)
 
             await self.duel_message.edit(embed=updated_embed)
 
@@ -982,7 +1160,7 @@ class ConfirmationView(discord.ui.View):
                 await interaction.followup.send("Duel confirmed.", ephemeral=True)
         else:
             await interaction.response.send_message("One or both players are not registered in the ranking system.", ephemeral=True)
-        await conn.close()
+        await close_db_connection(conn)
 
 ##############
 # END DUELS
@@ -1122,8 +1300,17 @@ class ChallengeView(discord.ui.View):
 @bot.slash_command(guild_ids=GUILD_IDS, description="Explains how the ELO system works.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
 async def elo(interaction: discord.Interaction, public: bool = False):
+    embed = await response_cache.get_or_build(('elo',), (), build_elo_embed)
+
+    # Decide whether to send the embed as a public or ephemeral message
+    if public:
+        await interaction.response.send_message(embed=embed, ephemeral=False)
+    else:
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+async def build_elo_embed():
     # Create the embed with a detailed explanation of the ELO system
-    embed = discord.Embed(
+    return discord.Embed(
         title="Understanding the Ranked Combat ELO System",
         description=(
             "**Ranked Combat Chivstats ELO System Overview**\n"
@@ -1161,12 +1348,6 @@ async def elo(interaction: discord.Interaction, public: bool = False):
         color=discord.Color.blue()
     )
 
-    # Decide whether to send the embed as a public or ephemeral message
-    if public:
-        await interaction.response.send_message(embed=embed, ephemeral=False)
-    else:
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-
 
 ###################
 #DUOS LOGIC
@@ -1179,38 +1360,56 @@ async def calculate_duo_elo(team1_elo, team2_elo, team1_score, team2_score):
     team2_new_elo = calculate_elo(team2_elo, K, team2_score > team1_score, 1, team1_elo)
     return team1_new_elo, team2_new_elo
 
-# Helper function to check if a duo team exists and create one if not
-async def check_or_create_duo_team(conn, playfabid1, playfabid2):
+# Canonical key for a duo team: the same two players in either order are one team
+def duo_pair_key(playfabid1, playfabid2):
+    return (playfabid1, playfabid2) if playfabid1 <= playfabid2 else (playfabid2, playfabid1)
+
+# Helper function to fetch a duo team (id, elo), creating it if it does not exist yet.
+# Hits are served from duo_team_cache; misses do a single upsert against the
+# duo_teams_pair_key unique index (migrations/001_duo_teams_pair_key.sql).
+async def get_or_create_duo_team(conn, playfabid1, playfabid2):
+    if playfabid1 is None or playfabid2 is None:
+        raise ValueError("Both players must be registered to form a duo team.")
+
+    key = duo_pair_key(playfabid1, playfabid2)
+    cached = duo_team_cache.get(key)
+    if cached:
+        return cached
+
     try:
-        # Check if the team already exists
+        # Team name is the first 4 characters of each player's display name,
+        # generated in the same statement so check-then-insert can't race.
         team = await conn.fetchrow("""
-            SELECT id FROM duo_teams
-            WHERE (player1_id = $1 AND player2_id = $2) OR (player1_id = $2 AND player2_id = $1)
+            INSERT INTO duo_teams (player1_id, player2_id, team_name, elo_rating)
+            SELECT $1, $2,
+                   COALESCE(LEFT((SELECT COALESCE(NULLIF(gamename, ''), common_name) FROM ranked_players WHERE playfabid = $1), 4), 'Unk') ||
+                   COALESCE(LEFT((SELECT COALESCE(NULLIF(gamename, ''), common_name) FROM ranked_players WHERE playfabid = $2), 4), 'Unk'),
+                   1500
+            ON CONFLICT ((LEAST(player1_id, player2_id)), (GREATEST(player1_id, player2_id)))
+                WHERE player1_id IS NOT NULL AND player2_id IS NOT NULL
+            DO UPDATE SET player1_id = duo_teams.player1_id
+            RETURNING id, elo_rating
             """, playfabid1, playfabid2)
-
-        if not team:
-            # Retrieve the display names of both players
-            player1_name = await get_display_name_from_ranked_players(playfabid1)
-            player2_name = await get_display_name_from_ranked_players(playfabid2)
-
-            # Generate team name
-            part1 = player1_name[:4] if player1_name else "Unk"
-            part2 = player2_name[:4] if player2_name else "Unk"
-            team_name = f"{part1}{part2}"
-            # Create the new team with the generated team name and initial ELO rating
-            initial_elo = 1500  # Example initial ELO rating
-            team_id = await conn.fetchval("""
-                INSERT INTO duo_teams (player1_id, player2_id, team_name, elo_rating)
-                VALUES ($1, $2, $3, $4) RETURNING id
-                """, playfabid1, playfabid2, team_name, initial_elo)
-            return team_id
-        else:
-            return team['id']
-
     except Exception as e:
-        print(f"Error in check_or_create_duo_team: {e}")
+        print(f"Error in get_or_create_duo_team: {e}")
         raise e  # Re-raise the exception so that it can be handled by the calling function
 
+    duo_team_cache[key] = (team['id'], team['elo_rating'])
+    duo_team_keys[team['id']] = key
+    response_cache.invalidate(responsecache.DUOS)  # may be a new team
+    return duo_team_cache[key]
+
+# Helper function to check if a duo team exists and create one if not
+async def check_or_create_duo_team(conn, playfabid1, playfabid2):
+    team_id, _ = await get_or_create_duo_team(conn, playfabid1, playfabid2)
+    return team_id
+
+# Keep the cached ELO of a duo team in step with what was written to duo_teams
+def update_cached_duo_elo(team_id, elo_rating):
+    key = duo_team_keys.get(team_id)
+    if key:
+        duo_team_cache[key] = (team_id, elo_rating)
+
 
 
 class ConfirmationViewDuo(discord.ui.View):
@@ -1224,7 +1423,6 @@ class ConfirmationViewDuo(discord.ui.View):
         self.team2_id = team2_id
         self.team1_elo = team1_elo
         self.team2_elo = team2_elo
-        self.conn = None
 
         self.confirm_button = discord.ui.Button(label="Confirm", style=discord.ButtonStyle.green)
         self.confirm_button.callback = self.confirm_button_clicked
@@ -1235,9 +1433,6 @@ class ConfirmationViewDuo(discord.ui.View):
         self.add_item(self.confirm_button)
         self.add_item(self.deny_button)
 
-    async def initialize_connection(self):
-        self.conn = await create_db_connection()
-
     async def confirm_button_clicked(self, interaction: discord.Interaction):
         # Check if the interaction user is one of the opponents
         if interaction.user.id not in [self.opponents[0].id, self.opponents[1].id]:
@@ -1247,29 +1442,33 @@ class ConfirmationViewDuo(discord.ui.View):
         # Calculate new ELO ratings
         team1_new_elo, team2_new_elo = await calculate_duo_elo(self.team1_elo, self.team2_elo, self.team1_score, self.team2_score)
 
-        # Update the duo_teams table with new ELO ratings, increment match counter
-        await self.conn.execute("UPDATE duo_teams SET elo_rating = $1 WHERE id = $2", team1_new_elo, self.team1_id)
-        await self.conn.execute("UPDATE duo_teams SET elo_rating = $1 WHERE id = $2", team2_new_elo, self.team2_id)
-        await self.conn.execute("UPDATE duo_teams SET matches_played = matches_played + 1 WHERE id = ANY($1::bigint[])", [self.team1_id, self.team2_id])
-
-        # Fetch team names
-        team1_name = await self.conn.fetchval("SELECT team_name FROM duo_teams WHERE id = $1", self.team1_id)
-        team2_name = await self.conn.fetchval("SELECT team_name FROM duo_teams WHERE id = $1", self.team2_id)
-
-        # Calculate ELO changes
-        team1_elo_change = int(team1_new_elo - self.team1_elo)
-        team2_elo_change = int(team2_new_elo - self.team2_elo)
-
-                # Round ELO ratings to whole numbers
-        team1_new_elo_rounded = round(team1_new_elo)
-        team2_new_elo_rounded = round(team2_new_elo)
-        team1_elo_change_rounded = round(team1_new_elo - self.team1_elo)
-        team2_elo_change_rounded = round(team2_new_elo - self.team2_elo)
-
-        submitter_playfabid = await get_playfabid_of_discord_id(self.conn, interaction.user.id)
-        # Insert the match data into the "duos" table
-        await self.conn.execute("INSERT INTO duos (submitting_playfabid, winner_team_id, winner_score, winner_elo, loser_team_id, loser_score, loser_elo) VALUES ($1, $2, $3, $4, $5, $6, $7)",
-                        submitter_playfabid, self.team1_id, self.team1_score, team1_new_elo, self.team2_id, self.team2_score, team2_new_elo)
+        async with bot.db_pool.acquire() as conn:
+            # Update the duo_teams table with new ELO ratings, increment match counter
+            await conn.execute("UPDATE duo_teams SET elo_rating = $1 WHERE id = $2", team1_new_elo, self.team1_id)
+            await conn.execute("UPDATE duo_teams SET elo_rating = $1 WHERE id = $2", team2_new_elo, self.team2_id)
+            await conn.execute("UPDATE duo_teams SET matches_played = matches_played + 1 WHERE id = ANY($1::bigint[])", [self.team1_id, self.team2_id])
+            update_cached_duo_elo(self.team1_id, team1_new_elo)
+            update_cached_duo_elo(self.team2_id, team2_new_elo)
+            response_cache.invalidate(responsecache.DUOS)
+
+            # Fetch team names
+            team1_name = await conn.fetchval("SELECT team_name FROM duo_teams WHERE id = $1", self.team1_id)
+            team2_name = await conn.fetchval("SELECT team_name FROM duo_teams WHERE id = $1", self.team2_id)
+
+            # Calculate ELO changes
+            team1_elo_change = int(team1_new_elo - self.team1_elo)
+            team2_elo_change = int(team2_new_elo - self.team2_elo)
+
+            # Round ELO ratings to whole numbers
+            team1_new_elo_rounded = round(team1_new_elo)
+            team2_new_elo_rounded = round(team2_new_elo)
+            team1_elo_change_rounded = round(team1_new_elo - self.team1_elo)
+            team2_elo_change_rounded = round(team2_new_elo - self.team2_elo)
+
+            submitter_playfabid = await get_playfabid_of_discord_id(conn, interaction.user.id)
+            # Insert the match data into the "duos" table
+            await conn.execute("INSERT INTO duos (submitting_playfabid, winner_team_id, winner_score, winner_elo, loser_team_id, loser_score, loser_elo) VALUES ($1, $2, $3, $4, $5, $6, $7)",
+                            submitter_playfabid, self.team1_id, self.team1_score, team1_new_elo, self.team2_id, self.team2_score, team2_new_elo)
 
         # Update the embed to show the match confirmation
         embed = interaction.message.embeds[0]
@@ -1329,24 +1528,25 @@ async def submit_duo(interaction: discord.Interaction, team_member: discord.Memb
         # Verify none of the players are retired
         print("Verifying retired players")
         player_ids = [interaction.user.id, team_member.id, enemy1.id, enemy2.id]
-        results = await conn.fetch("SELECT discordid, retired FROM ranked_players WHERE discordid = ANY($1)", player_ids)
-        retired_players = [discord_id for discord_id, retired in results if retired]
+        retired_players = [discord_id for discord_id in player_ids if (profile := profiles.get(discord_id)) and profile.retired]
         if retired_players:
             message = "The following players are retired: "
             message += ', '.join(f"<@{discord_id}>" for discord_id in retired_players)
             message += "\nPlease reactivate your account using /reactivate."
             await interaction.response.send_message(message, ephemeral=True)
             return
+
+        # Verify all players are registered, a duo team can't be formed otherwise
+        if None in (team1_playfabid1, team1_playfabid2, team2_playfabid1, team2_playfabid2):
+            await interaction.followup.send("All four players must be registered. Use /register to link a PlayFab ID.", ephemeral=True)
+            return
         print("ephemeral message to submitter")
         # Send an ephemeral response to the submitter to indicate the submission was accepted
         await interaction.followup.send("Submission accepted. Please wait for confirmation from the opposing team.", ephemeral=True)
         print("Preparing embed message")
-        # Check for existing teams or create new ones
-        team1_id = await check_or_create_duo_team(conn, team1_playfabid1, team1_playfabid2)
-        team2_id = await check_or_create_duo_team(conn, team2_playfabid1, team2_playfabid2)
-        # Fetch current ELO ratings
-        team1_elo = await conn.fetchval("SELECT elo_rating FROM duo_teams WHERE id = $1", team1_id)
-        team2_elo = await conn.fetchval("SELECT elo_rating FROM duo_teams WHERE id = $1", team2_id)
+        # Check for existing teams or create new ones, along with their current ELO ratings
+        team1_id, team1_elo = await get_or_create_duo_team(conn, team1_playfabid1, team1_playfabid2)
+        team2_id, team2_elo = await get_or_create_duo_team(conn, team2_playfabid1, team2_playfabid2)
 
         embed = discord.Embed(
             title="2v2 Duos Match Submitted (UNVERIFIED)",
@@ -1363,8 +1563,6 @@ async def submit_duo(interaction: discord.Interaction, team_member: discord.Memb
             team1_id, team2_id, team1_elo, team2_elo
         )
         print("Sending follow-up message with embed and view")
-        await view.initialize_connection()
-        
         # Send the follow-up message with the embed and view
         await interaction.followup.send(embed=embed, view=view)
 
@@ -1376,8 +1574,9 @@ async def submit_duo(interaction: discord.Interaction, team_member: discord.Memb
 
 @bot.slash_command(guild_ids=GUILD_IDS, description="Create and or update your duos team name.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
+@defer_ephemeral
 async def duo_setup_team(interaction: discord.Interaction, team_member: discord.Member, team_name: str, debug: bool = False):
-    conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+    conn = await create_db_connection()
 
     # Fetch PlayFab IDs for both members of the team
     playfabid1 = await get_playfabid_of_discord_id(conn, interaction.user.id)  # Assuming this is not an async function
@@ -1389,6 +1588,7 @@ async def duo_setup_team(interaction: discord.Interaction, team_member: discord.
 
         # Update the team name
         await conn.execute("UPDATE duo_teams SET team_name = $1 WHERE id = $2", team_name, team_id)
+        response_cache.invalidate(responsecache.DUOS)
 
         # Announce the update
         announcement_message = f"{interaction.user.display_name} (with {team_member.display_name}) set the duo's name to {team_name}"
@@ -1407,7 +1607,7 @@ async def duo_setup_team(interaction: discord.Interaction, team_member: discord.
         await interaction.response.send_message("An error occurred while processing your request.", ephemeral=True)
 
     finally:
-        await conn.close()
+        await close_db_connection(conn)
 
 
 
@@ -1415,28 +1615,34 @@ async def duo_setup_team(interaction: discord.Interaction, team_member: discord.
 @bot.slash_command(guild_ids=GUILD_IDS, description="List top 25 duo teams that have participated in matches, ranked by ELO.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
 async def duo_teams(interaction: discord.Interaction):
-    conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+    try:
+        embed = await response_cache.get_or_build(('duo_teams',), (responsecache.DUOS, responsecache.DUELS), build_duo_teams_embed)
 
+        if not embed:
+            await interaction.response.send_message("There are currently no active duo teams with match participation.", ephemeral=True)
+            return
+
+        await interaction.response.send_message(embed=embed)
+
+    except Exception as e:
+        print(f"Error in duo_teams: {e}")
+        await interaction.response.send_message("An error occurred while retrieving the duo teams.", ephemeral=True)
+
+async def build_duo_teams_embed():
+    conn = await create_db_connection()
     try:
-        # Query top 25 active duo teams with match participation, ordered by ELO in descending order
+        # Query top 25 active duo teams with match participation, ordered by ELO in descending order.
+        # Served by the duo_teams_ranking partial index (migrations/002_duo_teams_ranking.sql).
         teams = await conn.fetch("""
-            SELECT dt.team_name, dt.player1_id, dt.player2_id, dt.elo_rating, COUNT(d.team_id) AS match_count
-            FROM duo_teams dt
-            LEFT JOIN (
-                SELECT winner_team_id AS team_id FROM duos
-                UNION ALL
-                SELECT loser_team_id AS team_id FROM duos
-            ) AS d ON dt.id = d.team_id
-            WHERE dt.retired = false
-            GROUP BY dt.id
-            HAVING COUNT(d.team_id) > 0
-            ORDER BY dt.elo_rating DESC
+            SELECT team_name, player1_id, player2_id, elo_rating, matches_played
+            FROM duo_teams
+            WHERE retired = FALSE AND matches_played > 0
+            ORDER BY elo_rating DESC
             LIMIT 25;
         """)
 
         if not teams:
-            await interaction.response.send_message("There are currently no active duo teams with match participation.", ephemeral=True)
-            return
+            return None
 
         # Create an embed to list the duo teams
         embed = discord.Embed(
@@ -1445,24 +1651,24 @@ async def duo_teams(interaction: discord.Interaction):
             color=discord.Color.blue()
         )
         
+        # Resolve every player name on the page in one query
+        player_names = await get_common_names_from_ranked_players(
+            conn, [playfabid for team in teams for playfabid in (team['player1_id'], team['player2_id'])]
+        )
+
         # Loop through the teams and add each to the embed
         for team in teams:
             team_name, player1_id, player2_id, elo_rating, match_count = team
-            player1_name = await get_common_name_from_ranked_players(conn, player1_id)
-            player2_name = await get_common_name_from_ranked_players(conn, player2_id)
+            player1_name = player_names.get(player1_id, "Unknown Alias")
+            player2_name = player_names.get(player2_id, "Unknown Alias")
             embed.add_field(
                 name=f"{team_name} - {elo_rating}  (Matches Played: {match_count})",
                 value=f"Players: {player1_name} and {player2_name}",
                 inline=False
             )
-
-        await interaction.response.send_message(embed=embed)
-
-    except Exception as e:
-        print(f"Error in duo_teams: {e}")
-        await interaction.response.send_message("An error occurred while retrieving the duo teams.", ephemeral=True)
+        return embed
     finally:
-        await conn.close()
+        await close_db_connection(conn)
 
 
 ##########END OF DUOS#############
@@ -1473,159 +1679,93 @@ async def duo_teams(interaction: discord.Interaction):
 async def rank(interaction: discord.Interaction, target_member: discord.Member = None):
     discord_id = target_member.id if target_member else interaction.user.id
 
-    try:
-        # Establish an asynchronous connection to the database
-        conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
-
-        # Fetch player's Duels ELO (elo_duelsx), kills, deaths, matches, PlayFab ID, username, and coins
-        result = await conn.fetchrow("""
-            SELECT elo_duelsx, kills, deaths, matches, playfabid, discord_username, common_name, coins 
-            FROM ranked_players 
-            WHERE discordid = $1
-            """, discord_id)
-
-        if result:
-            elo_duelsx, kills, deaths, matches, playfabid, discord_username, common_name, coins = result
-            elo_duelsx_rounded = round(elo_duelsx)  # Round ELO to a whole number
-            kdr = kills / deaths if deaths > 0 else kills  # Avoid division by zero
-
-            # Calculate player's wealth rank based on coins
-            wealth_rank_result = await conn.fetchval("""
-                SELECT COUNT(*) + 1 
-                FROM ranked_players 
-                WHERE coins > $1
-                """, coins)
-            wealth_rank = f"**#{wealth_rank_result}**" if wealth_rank_result else '**N/A**'
-
-            # Calculate the player's ELO rank
-            elo_rank_result = await conn.fetchval("""
-                SELECT COUNT(*) + 1 
-                FROM ranked_players
-                WHERE elo_duelsx > $1
-                """, elo_duelsx)
-            elo_rank = f"**#{elo_rank_result}**" if elo_rank_result else '**N/A**'
-
-            # Calculate the player's KDR rank
-            kdr_rank_result = await conn.fetchval("""
-                SELECT COUNT(*) + 1 
-                FROM ranked_players
-                WHERE (CAST(kills AS FLOAT) / NULLIF(deaths, 0)) > $1
-                """, kdr)
-            kdr_rank = f"**#{kdr_rank_result}**" if kdr_rank_result else '**N/A**'
-
-            # Calculate the player's matches rank
-            matches_rank_result = await conn.fetchval("""
-                SELECT COUNT(*) + 1 
-                FROM ranked_players
-                WHERE matches > $1
-                """, matches)
-            matches_rank = f"**#{matches_rank_result}**" if matches_rank_result else '**N/A**'
-
-            profile_url = f"https://chivstats.xyz/leaderboards/player/{playfabid}/"
-            leaderboard_url = "https://chivstats.xyz/leaderboards/ranked_combat/"
-            
-            # Embed construction
-            embed = discord.Embed(
-                title=f"{common_name} Ranked Statistics",
-                description=(
-                    f"<@{discord_id}>'s Stats:\n"
-                    f"[Duels ELO Rating:]({leaderboard_url}) {round(elo_duelsx)} ({elo_rank})\n"
-                    f"KDR: {kills}:{deaths} ({kdr_rank})\n"
-                    f"Matches: {matches} ({matches_rank})\n"
-                    f"Purse: {coins} coins ({wealth_rank})\n\n"  # Added line for coins and wealth rank
-                    f"[{discord_username} on ChivStats.xyz]({profile_url})"
-                ),
-                color=discord.Color.blue(),
-                url=profile_url
-            )
-            await interaction.response.send_message(embed=embed)
-        else:
-            await interaction.response.send_message("Player not found in the ranking system.", ephemeral=True)
-    except Exception as e:
-        print(f"Database error: {e}")
-        await interaction.response.send_message("An error occurred while fetching the player rank.", ephemeral=True)
-    finally:
-        # Close the connection
-        if conn:
-            await conn.close()
+    # Profile and ranks come precomputed from the profile store
+    profile = profiles.get(discord_id)
+    if profile is None:
+        await interaction.response.send_message("Player not found in the ranking system.", ephemeral=True)
+        return
+
+    ranks = profiles.ranks(profile)
+    rank_text = lambda rank: f"**#{rank}**" if rank else '**N/A**'
+    elo_rank = rank_text(ranks['elo'])
+    kdr_rank = rank_text(ranks['kdr'])
+    matches_rank = rank_text(ranks['matches'])
+    wealth_rank = rank_text(ranks['coins'])
+
+    profile_url = f"https://chivstats.xyz/leaderboards/player/{profile.playfabid}/"
+    leaderboard_url = "https://chivstats.xyz/leaderboards/ranked_combat/"
+
+    # Embed construction
+    embed = discord.Embed(
+        title=f"{profile.common_name} Ranked Statistics",
+        description=(
+            f"<@{discord_id}>'s Stats:\n"
+            f"[Duels ELO Rating:]({leaderboard_url}) {round(profile.elo)} ({elo_rank})\n"
+            f"KDR: {profile.kills}:{profile.deaths} ({kdr_rank})\n"
+            f"Matches: {profile.matches} ({matches_rank})\n"
+            f"Purse: {profile.coins} coins ({wealth_rank})\n\n"  # Added line for coins and wealth rank
+            f"[{profile.discord_username} on ChivStats.xyz]({profile_url})"
+        ),
+        color=discord.Color.blue(),
+        url=profile_url
+    )
+    await interaction.response.send_message(embed=embed)
 
 
 @bot.slash_command(guild_ids=GUILD_IDS, description="1v1 Toggle your active status for the duels ranked combat.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
+@defer_ephemeral
 async def ready_duel(interaction: discord.Interaction):
-    role_name = "1v1 pings"
-    active_duelists = set()  # Set to store unique user IDs
-    sent_channels = set()  # Set to keep track of channels where the message has been sent
+    role_name = DUEL_ROLE
 
     # Update the user's role in the guild where the command was used
     role = discord.utils.get(interaction.guild.roles, name=role_name)
     if role:
-        if role in interaction.user.roles:
-            await interaction.user.remove_roles(role)
-            embed_color = discord.Color.red()
-            action_message = "You are no longer active for 1v1 duels. Waiting 2 seconds for changes to cascade through discords.."
-        else:
-            await interaction.user.add_roles(role)
-            embed_color = discord.Color.green()
-            action_message = "You are now active for 1v1 duels. Waiting 2 seconds for changes to cascade through discords.."
+        conn = await create_db_connection()
+        try:
+            if role in interaction.user.roles:
+                await interaction.user.remove_roles(role)
+                ready_pools.discard(role_name, interaction.user.id, interaction.guild.id)
+                await matchmaker.dequeue(conn, interaction.user.id, 'duel')
+                embed_color = discord.Color.red()
+                action_message = "You are no longer active for 1v1 duels."
+            else:
+                await interaction.user.add_roles(role)
+                ready_pools.add(role_name, interaction.user.id, interaction.guild.id)
+                profile = profiles.get(interaction.user.id)
+                if profile and not profile.retired and profile.elo is not None:
+                    await matchmaker.enqueue(conn, 'duel', (interaction.user.id,), profile.elo, interaction.channel.id)
+                embed_color = discord.Color.green()
+                action_message = "You are now active for 1v1 duels."
+        finally:
+            await close_db_connection(conn)
 
         # Respond to the user's action with an ephemeral message
         await interaction.response.send_message(action_message, ephemeral=True)
 
-    # Wait for the role changes to propagate
-    await asyncio.sleep(2)
-
-    # Clear the set to ensure it's empty before recounting
-    active_duelists.clear()
-
-    # Count active duelists across all guilds
-    for guild in bot.guilds:
-        role = discord.utils.get(guild.roles, name=role_name)
-        if role:
-            active_duelists.update(member.id for member in role.members if not member.bot)
-
     # Prepare the public embed message
     embed = discord.Embed(
         title="1v1 Ranked Pool Status Change",
         description=f"{interaction.user.display_name} is now {'active' if embed_color == discord.Color.green() else 'inactive'} for 1v1 duels.",
         color=embed_color
     )
-    embed.add_field(name="Active Duelists", value=str(len(active_duelists)))
+    embed.add_field(name="Active Duelists", value=str(ready_pools.count(role_name)))
     embed.set_author(name=interaction.user.display_name, icon_url=interaction.user.display_avatar.url)
     embed.set_footer(text=f"Ping `@1v1 pings` to ping these users and arrange a duel.")
 
     # Echo the embed message to all guilds in #chivstats-ranked channel
-    for guild in bot.guilds:
-        chivstats_channel = discord.utils.get(guild.text_channels, name="chivstats-ranked")
-        if chivstats_channel:
-            await chivstats_channel.send(embed=embed)
+    await shardstate.broadcast(bot, "chivstats-ranked", embed=embed)
 
 @bot.slash_command(guild_ids=GUILD_IDS, description="Get the status of active duelists and teams across all guilds.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
+@defer_ephemeral
 async def ready_status(interaction: discord.Interaction):
-    role_name_1v1 = "1v1 pings"
-    role_name_2v2 = "2v2 pings"
-    active_duelists_1v1 = set()  # Set to store unique user IDs for 1v1
-    active_duelists_2v2 = set()  # Set to store unique user IDs for 2v2
-
-    # Count active duelists for 1v1 across all guilds
-    for guild in bot.guilds:
-        role_1v1 = discord.utils.get(guild.roles, name=role_name_1v1)
-        if role_1v1:
-            active_duelists_1v1.update(member.id for member in role_1v1.members if not member.bot)
-
-    # Count active duelists for 2v2 across all guilds
-    for guild in bot.guilds:
-        role_2v2 = discord.utils.get(guild.roles, name=role_name_2v2)
-        if role_2v2:
-            active_duelists_2v2.update(member.id for member in role_2v2.members if not member.bot)
-
     # Prepare the embed message
     embed = discord.Embed(
         title="Active Duelists Status",
         description=(
-            f"Total active duelists for 1v1 across all guilds: {len(active_duelists_1v1)} (`@1v1 pings`)\n"
-            f"Total active duelists for 2v2 across all guilds: {len(active_duelists_2v2)} (`@2v2 pings`)"
+            f"Total active duelists for 1v1 across all guilds: {ready_pools.count(DUEL_ROLE)} (`@1v1 pings`)\n"
+            f"Total active duelists for 2v2 across all guilds: {ready_pools.count(DUO_ROLE)} (`@2v2 pings`)"
         ),
         color=discord.Color.blue()
     )
@@ -1636,9 +1776,13 @@ async def ready_status(interaction: discord.Interaction):
 
 @bot.slash_command(guild_ids=GUILD_IDS, description="2v2 Toggle yourself and an optional teammate for duo ranked combat.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
+@defer_ephemeral
 async def ready_duo(interaction: discord.Interaction, teammate: discord.Member = None):
-    role_name = "2v2 pings"
-    active_duo_teams = set()  # Set to store unique user IDs for duo teams
+    role_name = DUO_ROLE
+
+    if teammate and teammate.id == interaction.user.id:
+        await interaction.response.send_message("You cannot team up with yourself!", ephemeral=True)
+        return
 
     try:
         # Update the user's and optional teammate's role in the guild where the command was used
@@ -1646,35 +1790,48 @@ async def ready_duo(interaction: discord.Interaction, teammate: discord.Member =
         if role:
             if role in interaction.user.roles:
                 await interaction.user.remove_roles(role)
+                ready_pools.discard(role_name, interaction.user.id, interaction.guild.id)
                 message = "You are no longer active for 2v2 duels."
                 embed_color = discord.Color.red()
             else:
                 await interaction.user.add_roles(role)
+                ready_pools.add(role_name, interaction.user.id, interaction.guild.id)
                 message = "You are now active for 2v2 duels."
                 embed_color = discord.Color.green()
 
+            teammate_ready = False
             if teammate:
                 if role in teammate.roles:
                     await teammate.remove_roles(role)
+                    ready_pools.discard(role_name, teammate.id, interaction.guild.id)
                     message += f" {teammate.display_name} is also no longer active for 2v2 duels."
                 else:
                     await teammate.add_roles(role)
+                    ready_pools.add(role_name, teammate.id, interaction.guild.id)
+                    teammate_ready = True
                     message += f" {teammate.display_name} is now active for 2v2 duels."
 
+            # Only complete teams where both players ended up ready are matched; a solo 2v2 ready just joins the ping role
+            conn = await create_db_connection()
+            try:
+                if embed_color == discord.Color.red():
+                    await matchmaker.dequeue(conn, interaction.user.id, 'duo')
+                if teammate and not teammate_ready:
+                    await matchmaker.dequeue(conn, teammate.id, 'duo')
+                if embed_color == discord.Color.green() and teammate_ready:
+                    _, playfabid = await get_player_data(conn, interaction.user.id)
+                    _, teammate_playfabid = await get_player_data(conn, teammate.id)
+                    if playfabid and teammate_playfabid:
+                        _, team_elo = await get_or_create_duo_team(conn, playfabid, teammate_playfabid)
+                        await matchmaker.enqueue(conn, 'duo', (interaction.user.id, teammate.id), team_elo, interaction.channel.id)
+            finally:
+                await close_db_connection(conn)
+
             # Respond to the user's action with an ephemeral message
             await interaction.response.send_message(message, ephemeral=True)
 
-            # Wait for the role changes to propagate
-            await asyncio.sleep(1)
-
-        # Count active duo teams across all guilds after waiting
-        for guild in bot.guilds:
-            role = discord.utils.get(guild.roles, name=role_name)
-            if role:
-                active_duo_teams.update((member.id, member.display_name) for member in role.members if not member.bot)
-
         # Prepare the public embed message
-        active_duo_teams_count = len(active_duo_teams)
+        active_duo_teams_count = ready_pools.count(role_name)
         embed = discord.Embed(
             title="2v2 Ranked Pool Status Change",
             description=message,
@@ -1685,10 +1842,7 @@ async def ready_duo(interaction: discord.Interaction, teammate: discord.Member =
         embed.set_footer(text=f"Ping `@2v2 pings` to ping these users and arrange a duo.")
 
         # Echo the embed message to all guilds in #chivstats-ranked channel
-        for guild in bot.guilds:
-            chivstats_channel = discord.utils.get(guild.text_channels, name="chivstats-ranked")
-            if chivstats_channel:
-                await chivstats_channel.send(embed=embed)
+        await shardstate.broadcast(bot, "chivstats-ranked", embed=embed)
 
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -1701,12 +1855,20 @@ async def ready_duo(interaction: discord.Interaction, teammate: discord.Member =
 
 @bot.slash_command(guild_ids=GUILD_IDS, description="Exit the ready pool for matches.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
+@defer_ephemeral
 async def ready_exit(interaction: discord.Interaction):
-    roles_to_remove = ["1v1 pings", "2v2 pings"]
+    roles_to_remove = [DUEL_ROLE, DUO_ROLE]
     roles = [discord.utils.get(interaction.guild.roles, name=role_name) for role_name in roles_to_remove]
     roles = [role for role in roles if role is not None]  # Filter out None values
+    conn = await create_db_connection()
+    try:
+        await matchmaker.dequeue(conn, interaction.user.id)
+    finally:
+        await close_db_connection(conn)
     if roles:
         await interaction.user.remove_roles(*roles)
+        for role in roles:
+            ready_pools.discard(role.name, interaction.user.id, interaction.guild.id)
         await interaction.response.send_message("You have been removed from the ready pool and the roles have been revoked.", ephemeral=True)
     else:
         await interaction.response.send_message("No relevant roles to remove.", ephemeral=True)
@@ -1727,6 +1889,7 @@ async def update_house_account_balance(conn, amount):
 
         # Update house account with new balance
         await conn.execute("UPDATE house_account SET balance = $1", house_balance)
+        response_cache.invalidate(responsecache.HOUSE)
     except Exception as e:
         print(f"An error occurred while updating house account balance: {e}")
 
@@ -1736,36 +1899,17 @@ async def update_house_account_balance(conn, amount):
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
 async def house(interaction: discord.Interaction):
     try:
-        # Establish an asynchronous connection to the database
-        conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+        embed = await response_cache.get_or_build(('house',), (responsecache.HOUSE,), build_house_embed)
 
-        # Fetch the latest house account entry
-        house_account_entry = await conn.fetchrow("SELECT balance, payout_rate FROM house_account ORDER BY last_updated DESC LIMIT 1")
-
-        if house_account_entry:
-            balance, payout_rate = house_account_entry
-            embed = discord.Embed(
-                title=":bank: House Account",
-                description=f"**Account Balance:** {balance} coins (:coin:)\n**Payout Rate:** {payout_rate}%",
-                color=discord.Color.gold()
-            )
+        if embed:
             await interaction.response.send_message(embed=embed)
 
             # Rebuild the entered slash command for auditing
             command_name = interaction.command.name
             entered_command = f"/{command_name}"
 
-            # Send an audit message to a specific guild and channel
-            target_guild_id = 1111684756896239677  # ID of the 'Chivalry Unchained' guild
-            audit_channel_id = 1196358290066640946  # ID of the '#chivstats-audit' channel
-
-            # Get the target guild and channel
-            target_guild = bot.get_guild(target_guild_id)
-            audit_channel = target_guild.get_channel(audit_channel_id) if target_guild else None
-
-            if audit_channel:
-                audit_message = f"{interaction.user.display_name} (ID: {interaction.user.id}) has executed: {entered_command}"
-                await audit_channel.send(audit_message)
+            audit_message = f"{interaction.user.display_name} (ID: {interaction.user.id}) has executed: {entered_command}"
+            audit_log.record(interaction, command_name, audit_message)
         else:
             await interaction.response.send_message("The house bank information is currently unavailable.", ephemeral=True)
 
@@ -1773,24 +1917,37 @@ async def house(interaction: discord.Interaction):
         await interaction.response.send_message("An error occurred while retrieving the bank information.", ephemeral=True)
         print(f"Database error: {e}")
 
+async def build_house_embed():
+    conn = await create_db_connection()
+    try:
+        # Fetch the latest house account entry
+        house_account_entry = await conn.fetchrow("SELECT balance, payout_rate FROM house_account ORDER BY last_updated DESC LIMIT 1")
     finally:
-        # Close the connection
-        if conn:
-            await conn.close()
+        await close_db_connection(conn)
+
+    if not house_account_entry:
+        return None
+    balance, payout_rate = house_account_entry
+    return discord.Embed(
+        title=":bank: House Account",
+        description=f"**Account Balance:** {balance} coins (:coin:)\n**Payout Rate:** {payout_rate}%",
+        color=discord.Color.gold()
+    )
 
 
 @bot.slash_command(guild_ids=GUILD_IDS, description="Displays stats for a PlayFab ID.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
+@defer_ephemeral
 async def stats(interaction: discord.Interaction, playfabid: str = None):
     discord_id = interaction.user.id
 
     try:
         # Establish an asynchronous connection to the database
-        conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+        conn = await create_db_connection()
 
         # Check if the user's account is retired
-        retired = await conn.fetchval("SELECT retired FROM ranked_players WHERE discordid = $1", discord_id)
-        if retired:
+        own_profile = profiles.get(discord_id)
+        if own_profile and own_profile.retired:
             await interaction.response.send_message("This account is retired. Please reactivate using /reactivate.", ephemeral=True)
             return
 
@@ -1800,8 +1957,8 @@ async def stats(interaction: discord.Interaction, playfabid: str = None):
         if playfabid_option:
             playfabid = playfabid_option.value
         else:
-            # If playfabid is not provided, fetch the user's linked PlayFab ID
-            playfabid = await conn.fetchval("SELECT playfabid FROM ranked_players WHERE discordid = $1", discord_id)
+            # If playfabid is not provided, use the user's linked PlayFab ID
+            playfabid = own_profile.playfabid if own_profile else None
 
             if not playfabid:
                 embed = discord.Embed(
@@ -1812,10 +1969,16 @@ async def stats(interaction: discord.Interaction, playfabid: str = None):
                 await interaction.response.send_message(embed=embed, ephemeral=True)
                 return
 
-        common_name = await get_common_name_from_ranked_players(conn, playfabid)
-        playfab_link = await format_playfab_id_with_url(playfabid)
+        profile = profiles.get_by_playfabid(playfabid)
+        if profile:
+            common_name = profile.common_name or profile.alias or "Unknown Alias"
+            playfab_link = f"[{playfabid} ('{profile.alias or 'Unknown Alias'}')](https://chivstats.xyz/leaderboards/player/{playfabid}/)"
+        else:
+            # Not a ranked player; look the alias up
+            common_name = await get_common_name_from_ranked_players(conn, playfabid)
+            playfab_link = await format_playfab_id_with_url(conn, playfabid)
 
-        stats = await get_player_latest_stats_and_rank(playfabid)
+        stats = await get_player_latest_stats_and_rank(conn, playfabid)
         if stats:
             embed = discord.Embed(
                 title=f"Latest Stats for {common_name}",
@@ -1833,17 +1996,8 @@ async def stats(interaction: discord.Interaction, playfabid: str = None):
             command_name = interaction.command.name
             entered_command = f"/{command_name} playfabid={playfabid}"
 
-            # Send an audit message to a specific guild and channel
-            target_guild_id = 1111684756896239677  # ID of the 'Chivalry Unchained' guild
-            audit_channel_id = 1196358290066640946  # ID of the '#chivstats-audit' channel
-
-            # Get the target guild and channel
-            target_guild = bot.get_guild(target_guild_id)
-            audit_channel = target_guild.get_channel(audit_channel_id) if target_guild else None
-
-            if audit_channel:
-                audit_message = f"Player {common_name} (ID: {interaction.user.id}, PlayFab ID: {playfabid}) has executed: {entered_command}"
-                await audit_channel.send(audit_message)
+            audit_message = f"Player {common_name} (ID: {interaction.user.id}, PlayFab ID: {playfabid}) has executed: {entered_command}"
+            audit_log.record(interaction, command_name, audit_message, playfabid=playfabid)
 
             await interaction.response.send_message(embed=embed, ephemeral=True)
         else:
@@ -1863,51 +2017,19 @@ async def stats(interaction: discord.Interaction, playfabid: str = None):
         await interaction.response.send_message(embed=embed, ephemeral=True)
     finally:
         if conn:
-            await conn.close()
+            await close_db_connection(conn)
 
 
 
 
 
 
-async def get_player_latest_stats_and_rank(playfabid):
-    stats = {}
+async def get_player_latest_stats_and_rank(conn, playfabid):
     try:
-        # Establish an asynchronous connection to the database
-        conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
-
-        for leaderboard in leaderboard_classes:
-            # Get the most recent serialnumber and stat_value for the player
-            query = f"""
-                SELECT stat_value, serialnumber
-                FROM {leaderboard}
-                WHERE playfabid = $1
-                ORDER BY serialnumber DESC
-                LIMIT 1
-                """
-            result = await conn.fetchrow(query, playfabid)
-
-            if result:
-                stat_value, serialnumber = result
-                # Get the rank of the player based on stat_value
-                query = f"""
-                    SELECT COUNT(*) + 1
-                    FROM {leaderboard}
-                    WHERE serialnumber = $1 AND stat_value > $2
-                    """
-                rank = await conn.fetchval(query, serialnumber, stat_value)
-
-                stats[leaderboard] = {'stat_value': stat_value, 'serialnumber': serialnumber, 'rank': rank}
-            else:
-                stats[leaderboard] = {'stat_value': 'No data', 'serialnumber': None, 'rank': None}
-
-        return stats
+        return await leaderboard_stats.get_player_stats(conn, playfabid)
     except Exception as e:
         print(f"Database error: {e}")  # Debugging print
         return None
-    finally:
-        if conn:
-            await conn.close()
 
 import re
 
@@ -1920,28 +2042,18 @@ async def status(interaction: discord.Interaction, player_details: str):
         await interaction.followup.send("No player details provided. Please use the command with a PlayFab ID or Discord mention.", ephemeral=True)
         return
     
-    conn = None  # Initialize conn to None before the try block
-
     try:
-        conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
-        discord_id, playfabid, retired = None, None, None
+        retired = None
 
         if re.match(r"<@!?(\d+)>", player_details):
-            discord_id = re.findall(r'\d+', player_details)[0]
-            query = "SELECT playfabid, retired FROM ranked_players WHERE discordid = $1"
-            result = await conn.fetchrow(query, int(discord_id))
+            profile = profiles.get(int(re.findall(r'\d+', player_details)[0]))
         else:
-            playfabid = player_details
-            query = "SELECT discordid, retired FROM ranked_players WHERE playfabid = $1"
-            result = await conn.fetchrow(query, playfabid)
+            profile = profiles.get_by_playfabid(player_details)
 
-        if result:
-            retired = result['retired']
+        if profile:
+            retired = profile.retired
             retirement_status = "Retired" if retired else "Active"
-            if discord_id:
-                playfabid = result['playfabid']  # Extract PlayFab ID
-            else:
-                discord_id = result['discordid']  # Extract Discord ID
+            discord_id, playfabid = profile.discordid, profile.playfabid
             
             # Embed the PlayFab ID with a hyperlink to the ChivStats profile
             description = (f"Discord account <@{discord_id}> is linked to PlayFab ID "
@@ -1963,10 +2075,6 @@ async def status(interaction: discord.Interaction, player_details: str):
     except Exception as e:
         await interaction.followup.send("An error occurred while processing your request.", ephemeral=True)
 
-    finally:
-        if conn:
-            await conn.close()
-
 
 
 
@@ -1975,42 +2083,33 @@ async def status(interaction: discord.Interaction, player_details: str):
 async def register(interaction: discord.Interaction, playfabid: str):
     await interaction.response.defer()
 
+    conn = None
     try:
-        conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
-
-        query = "SELECT id FROM players WHERE playfabid = $1"
-        player_id = await conn.fetchval(query, playfabid)
-        if player_id is None:
+        # Typos are turned away by the in-memory filter; a miss is rechecked after pulling in the latest players
+        conn = await create_db_connection()
+        if not await playfab_filter.check(conn, playfabid):
             await interaction.followup.send("The provided PlayFab ID does not exist.", ephemeral=True)
             return
 
-        common_name = await get_most_common_alias(conn, playfabid)
-
-        query = "SELECT discordid FROM ranked_players WHERE playfabid = $1"
-        linked_discord_id = await conn.fetchval(query, playfabid)
-        if linked_discord_id and linked_discord_id != interaction.user.id:
+        registration = await conn.fetchrow(REGISTER_QUERY, playfabid, interaction.user.id, interaction.user.display_name)
+        status, common_name = registration['status'], registration['common_name']
+        if status == 'not_found':
+            await interaction.followup.send("The provided PlayFab ID does not exist.", ephemeral=True)
+            return
+        if status == 'playfab_taken':
             error_message = (
                 f"⚠️ {interaction.user.mention}, the provided PlayFab ID `{playfabid}` is already linked to another Discord account. "
                 "If you believe this is an error, please mention it in the #chivstats-ranked channel."
             )
             await interaction.followup.send(error_message, ephemeral=True)
             return
-
-        query = "SELECT playfabid FROM ranked_players WHERE discordid = $1"
-        linked_playfab_id = await conn.fetchval(query, interaction.user.id)
-        if linked_playfab_id:
+        if status == 'discord_linked':
             await interaction.followup.send("Your Discord account is already linked to a PlayFab ID.", ephemeral=True)
             return
 
-        query = "UPDATE players SET discordid = $1 WHERE id = $2"
-        await conn.execute(query, interaction.user.id, player_id)
-
-        query = """
-            INSERT INTO ranked_players (player_id, playfabid, discordid, discord_username, common_name, elo_rating)
-            VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (playfabid) DO 
-            UPDATE SET discordid = EXCLUDED.discordid, discord_username = EXCLUDED.discord_username, common_name = EXCLUDED.common_name
-        """
-        await conn.execute(query, player_id, playfabid, interaction.user.id, interaction.user.display_name, common_name, 1500)
+        player_name_cache.pop(playfabid, None)
+        response_cache.invalidate(responsecache.DUELS)
+        await profiles.refresh(conn, discordids=[interaction.user.id], playfabids=[playfabid])
 
         role = discord.utils.get(interaction.guild.roles, name="Ranked Combatant")
         if role:
@@ -2031,35 +2130,53 @@ async def register(interaction: discord.Interaction, playfabid: str):
                         f"View [ChivStats.xyz player profile](https://chivstats.xyz/leaderboards/player/{playfabid}/)\n\n{role_message}",
             color=discord.Color.green()
         )
+        embed.set_footer(text="Use /status anytime to check your registration status.")
         await interaction.followup.send(embed=embed)
 
-        confirmation_message = (
-            f"✅ {interaction.user.mention}, you have successfully registered with the PlayFab ID `{playfabid}`. "
-            "You are now ready to participate in ranked matches! "
-            "Use `/status` anytime to check your registration status."
-        )
-        await interaction.followup.send(confirmation_message, ephemeral=True)
-
-
         command_name = interaction.command.name
         command_options = " ".join([f"{opt.name}={opt.value}" for opt in interaction.command.options])
         entered_command = f"/{command_name} {command_options}"
-        target_guild_id = 1111684756896239677  # ID of the 'Chivalry Unchained' guild
-        audit_channel_id = 1196358290066640946  # ID of the '#chivstats-audit' channel
-        target_guild = bot.get_guild(target_guild_id)
-        audit_channel = target_guild.get_channel(audit_channel_id) if target_guild else None
-
-        if audit_channel:
-            audit_message = f"Player (ID: {interaction.user.id}) has executed: {entered_command}"
-            await audit_channel.send(audit_message)
+        audit_message = f"Player (ID: {interaction.user.id}) has executed: {entered_command}"
+        audit_log.record(interaction, command_name, audit_message, playfabid=playfabid)
 
     except Exception as e:
         await interaction.followup.send("An error occurred while processing your request. Please try again.", ephemeral=True)
         print(f"Database error: {e}")
     finally:
         if conn:
-            await conn.close()
+            await close_db_connection(conn)
+
 
+# Validates, conflict-checks and links a registration in one statement. status is
+# 'not_found', 'playfab_taken', 'discord_linked' or 'registered'. The upsert only
+# claims a row with no discordid, so a concurrent claim reports playfab_taken.
+REGISTER_QUERY = """
+    WITH player AS (
+        SELECT id, COALESCE(most_common_alias, 'Unknown Alias') AS common_name FROM players WHERE playfabid = $1
+    ), conflict AS (
+        SELECT CASE
+            WHEN NOT EXISTS (SELECT 1 FROM player) THEN 'not_found'
+            WHEN EXISTS (SELECT 1 FROM ranked_players WHERE playfabid = $1 AND discordid IS NOT NULL AND discordid <> $2) THEN 'playfab_taken'
+            WHEN EXISTS (SELECT 1 FROM ranked_players WHERE discordid = $2) THEN 'discord_linked'
+        END AS status
+    ), registered AS (
+        INSERT INTO ranked_players (player_id, playfabid, discordid, discord_username, common_name, elo_rating)
+        SELECT player.id, $1, $2, $3, player.common_name, 1500 FROM player, conflict WHERE conflict.status IS NULL
+        ON CONFLICT (playfabid) DO UPDATE
+            SET discordid = EXCLUDED.discordid, discord_username = EXCLUDED.discord_username, common_name = EXCLUDED.common_name
+            WHERE ranked_players.discordid IS NULL
+        RETURNING player_id, common_name
+    ), linked AS (
+        UPDATE players SET discordid = $2 FROM registered WHERE players.id = registered.player_id
+    )
+    SELECT CASE
+               WHEN conflict.status IS NOT NULL THEN conflict.status
+               WHEN registered.common_name IS NULL THEN 'playfab_taken'
+               ELSE 'registered'
+           END AS status,
+           registered.common_name
+    FROM conflict LEFT JOIN registered ON TRUE
+"""
 
 @bot.slash_command(guild_ids=GUILD_IDS, description="Reactivate your account for ranked matches.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
@@ -2067,13 +2184,15 @@ async def reactivate(interaction: discord.Interaction):
     conn = None
     try:
         # Establish an asynchronous connection
-        conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+        conn = await create_db_connection()
 
         # Execute the query asynchronously and fetch the result
         result = await conn.fetchrow(
             "UPDATE ranked_players SET retired = FALSE WHERE discordid = $1 RETURNING playfabid, common_name, elo_rating", 
             interaction.user.id
         )
+        response_cache.invalidate(responsecache.DUELS)
+        await profiles.refresh(conn, discordids=[interaction.user.id])
         playfabid, common_name, elo_rating = result
 
         # Find the "Ranked Combatant" role in the guild
@@ -2100,22 +2219,15 @@ async def reactivate(interaction: discord.Interaction):
         command_name = interaction.command.name
         command_options = " ".join([f"{opt.name}={opt.value}" for opt in interaction.command.options])
         entered_command = f"/{command_name} {command_options}"
-        target_guild_id = 1111684756896239677  # ID of the 'Chivalry Unchained' guild
-        audit_channel_id = 1196358290066640946  # ID of the '#chivstats-audit' channel
-
-        target_guild = bot.get_guild(target_guild_id)
-        audit_channel = target_guild.get_channel(audit_channel_id) if target_guild else None
-
-        if audit_channel:
-            audit_message = f"Player {common_name} (ID: {interaction.user.id}, PlayFab ID: {playfabid}) has executed: {entered_command}"
-            await audit_channel.send(audit_message)
+        audit_message = f"Player {common_name} (ID: {interaction.user.id}, PlayFab ID: {playfabid}) has executed: {entered_command}"
+        audit_log.record(interaction, command_name, audit_message, playfabid=playfabid)
 
     except Exception as e:
         await interaction.response.send_message("An error occurred while processing your request. Please try again.", ephemeral=True)
         print(f"Database error: {e}")
     finally:
         if conn is not None:
-            await conn.close()
+            await close_db_connection(conn)
 
 
 
@@ -2125,13 +2237,15 @@ async def retire(interaction: discord.Interaction):
     conn = None
     try:
         # Establish an asynchronous connection
-        conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+        conn = await create_db_connection()
 
         # Execute the query asynchronously and fetch the result
         result = await conn.fetchrow(
             "UPDATE ranked_players SET retired = TRUE WHERE discordid = $1 RETURNING playfabid, common_name, elo_rating", 
             interaction.user.id
         )
+        response_cache.invalidate(responsecache.DUELS)
+        await profiles.refresh(conn, discordids=[interaction.user.id])
         playfabid, common_name, elo_rating = result
 
         # Find the "Ranked Combatant" role in the guild
@@ -2158,29 +2272,22 @@ async def retire(interaction: discord.Interaction):
         command_name = interaction.command.name
         command_options = " ".join([f"{opt.name}={opt.value}" for opt in interaction.command.options])
         entered_command = f"/{command_name} {command_options}"
-
-        target_guild_id = 1111684756896239677  # ID of the 'Chivalry Unchained' guild
-        audit_channel_id = 1196358290066640946  # ID of the '#chivstats-audit' channel
-
-        target_guild = bot.get_guild(target_guild_id)
-        audit_channel = target_guild.get_channel(audit_channel_id) if target_guild else None
-
-        if audit_channel:
-            audit_message = f"Player {common_name} (ID: {interaction.user.id}, PlayFab ID: {playfabid}) has executed: {entered_command}"
-            await audit_channel.send(audit_message)
+        audit_message = f"Player {common_name} (ID: {interaction.user.id}, PlayFab ID: {playfabid}) has executed: {entered_command}"
+        audit_log.record(interaction, command_name, audit_message, playfabid=playfabid)
 
     except Exception as e:
         await interaction.response.send_message("An error occurred while processing your request. Please try again.", ephemeral=True)
         print(f"Database error: {e}")
     finally:
         if conn is not None:
-            await conn.close()
+            await close_db_connection(conn)
 
 @bot.slash_command(guild_ids=GUILD_IDS, description="Set your in-game name.")
 @is_channel_named(['chivstats-ranked', 'chivstats-test'])
+@defer_ephemeral
 async def setname(interaction: discord.Interaction, name: str):
     try:
-        conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+        conn = await create_db_connection()
 
         query = """
             UPDATE ranked_players
@@ -2188,23 +2295,15 @@ async def setname(interaction: discord.Interaction, name: str):
             WHERE discordid = $2
         """
         await conn.execute(query, name, interaction.user.id)
+        await profiles.refresh(conn, discordids=[interaction.user.id])
 
         await interaction.response.send_message(f"Your in-game name has been set to: {name}", ephemeral=True)
 
         command_name = interaction.command.name
         entered_command = f"/{command_name} name={name}"
 
-        # Send an audit message to a specific guild and channel
-        target_guild_id = 1111684756896239677  # ID of the 'Chivalry Unchained' guild
-        audit_channel_id = 1196358290066640946  # ID of the '#chivstats-audit' channel
-
-        target_guild = bot.get_guild(target_guild_id)
-        audit_channel = target_guild.get_channel(audit_channel_id) if target_guild else None
-
-        if audit_channel:
-            audit_message = f"Player (ID: {interaction.user.id}) has executed: {entered_command}"
-            await audit_channel.send(audit_message)
-        await send_audit_message(interaction)
+        audit_message = f"Player (ID: {interaction.user.id}) has executed: {entered_command}"
+        audit_log.record(interaction, command_name, audit_message, details={'name': name})
 
     except Exception as e:
         print(f"Database error: {e}")
@@ -2214,16 +2313,165 @@ async def setname(interaction: discord.Interaction, name: str):
             await interaction.followup.send("An error occurred while updating your in-game name.", ephemeral=True)
     finally:
         if conn:
-            await conn.close()
+            await close_db_connection(conn)
+
+
+#### CHANGE NOTIFICATIONS ###
+
+# chivstats.xyz and admin SQL write ranked_players, duo_teams and lts_teams too. Triggers from
+# migrations/008_change_notifications.sql send the keys of changed rows on this channel, and
+# migrations/011_players_alias_defensive.sql the playfab ids of players whose alias changed.
+CHANGES_CHANNEL = 'chivbot_changes'
+
+async def on_table_change(message):
+    keys = message['keys']  # None when too many rows changed to list
+    if message['table'] == 'ranked_players':
+        if keys is None:
+            player_name_cache.clear()
+        else:
+            for row in keys:
+                player_name_cache.pop(row['playfabid'], None)
+        response_cache.invalidate(responsecache.DUELS)
+        conn = await create_db_connection()
+        try:
+            if keys is None:
+                await profiles.load(conn)
+            else:
+                await profiles.refresh(conn, [row['discordid'] for row in keys], [row['playfabid'] for row in keys])
+        finally:
+            await close_db_connection(conn)
+    elif message['table'] == 'duo_teams':
+        if keys is None:
+            duo_team_cache.clear()
+            duo_team_keys.clear()
+        else:
+            for row in keys:
+                duo_team_cache.pop(duo_team_keys.pop(row['id'], None), None)
+                if row['player1_id'] is not None and row['player2_id'] is not None:
+                    duo_team_cache.pop(duo_pair_key(row['player1_id'], row['player2_id']), None)
+        response_cache.invalidate(responsecache.DUOS)
+    elif message['table'] == 'lts_teams':
+        response_cache.invalidate(responsecache.LTS)
+    elif message['table'] == 'players':
+        # A most_common_alias changed (migrations/011_players_alias_defensive.sql)
+        for row in keys:
+            player_name_cache.pop(row['playfabid'], None)
+        response_cache.invalidate(responsecache.DUELS)
+        conn = await create_db_connection()
+        try:
+            await profiles.refresh(conn, playfabids=[row['playfabid'] for row in keys if profiles.get_by_playfabid(row['playfabid'])])
+        finally:
+            await close_db_connection(conn)
 
+async def resync_caches():
+    # Anything may have changed while the listener was disconnected
+    player_name_cache.clear()
+    duo_team_cache.clear()
+    duo_team_keys.clear()
+    response_cache.clear()
+    conn = await create_db_connection()
+    try:
+        await profiles.load(conn)
+    finally:
+        await close_db_connection(conn)
 
-def setup():
-    bot.add_cog(AdminCommands(bot))
-    bot.add_cog(LTSCog(bot))
-    bot.add_cog(CoinCog(bot))
-    bot.add_cog(PrivateServers(bot))
+
+#### STARTUP ###
+
+def load_config():
+    if not TOKEN:
+        raise SystemExit("CHIVBOT_KEY is not set.")
+    return {
+        'warm_caches': os.getenv('CHIVBOT_WARM_CACHES', 'foreground'),  # 'foreground', 'background' or 'off'
+        'run_migrations': os.getenv('CHIVBOT_RUN_MIGRATIONS', '1') == '1',
+        'pool_min_size': int(os.getenv('CHIVBOT_DB_POOL_MIN', '2')),
+        'pool_max_size': int(os.getenv('CHIVBOT_DB_POOL_MAX', '10')),
+        'metrics_port': int(os.getenv('CHIVBOT_METRICS_PORT', '0')),  # 0 disables the /metrics endpoint
+        'slow_query_ms': float(os.getenv('CHIVBOT_SLOW_QUERY_MS', '250')),
+        'query_report_path': os.getenv('CHIVBOT_QUERY_REPORT_PATH', ''),  # written on shutdown if set
+        'loop_lag_ms': float(os.getenv('CHIVBOT_LOOP_LAG_MS', '100')),  # 0 disables the loop lag monitor
+        'auto_defer_ms': float(os.getenv('CHIVBOT_AUTO_DEFER_MS', '2000')),  # 0 disables automatic defers
+        'shard_count': SHARD_COUNT,  # '' for an unsharded bot; read at import, since it decides the bot class
+        'shard_ids': SHARD_IDS,  # shards run by this process; [] for all of them
+    }
+
+async def warm_caches():
+    conn = await create_db_connection()
+    try:
+        await leaderboard_stats.refresh(conn)
+    finally:
+        await close_db_connection(conn)
+
+async def create_pool(config):
+    metrics.query_tracer.slow_threshold = config['slow_query_ms'] / 1000
+    # Same arguments as asyncpg.create_pool, which just builds and awaits a Pool
+    return await TracedPool(
+        database=DATABASE, user=USER, host=HOST,
+        min_size=config['pool_min_size'], max_size=config['pool_max_size'],
+        connection_class=metrics.InstrumentedConnection,
+        tracer=metrics.query_tracer, command_name=metrics.current_command_name
+    )
+
+async def prepare_startup():
+    # Everything that has to happen before connecting to the gateway, in order.
+    # The connect and view restore phases are finished off in on_ready.
+    startup = bot.startup
+    print("Bot is starting up...")
+
+    async with startup.phase("config"):
+        bot.config = load_config()
+
+    async with startup.phase("pool"):
+        bot.db_pool = await create_pool(bot.config)
+
+    if bot.config['run_migrations']:
+        async with startup.phase("migrations"):
+            async with bot.db_pool.acquire() as conn:
+                await apply_migrations(conn, MIGRATIONS_DIR)
+
+    # Commands read profiles from memory, so they are loaded before connecting
+    async with startup.phase("profiles"):
+        async with bot.db_pool.acquire() as conn:
+            await profiles.load(conn)
+
+    if bot.config['warm_caches'] == 'foreground':
+        async with startup.phase("cache warm-up"):
+            await warm_caches()
+
+    # Dedicated connection for LISTEN; started in on_ready
+    bot.pubsub = PubSub(lambda: asyncpg.connect(database=DATABASE, user=USER, host=HOST))
+    bot.pubsub.subscribe(CHANGES_CHANNEL, on_table_change)
+    bot.pubsub.on_resync(resync_caches)
+    if bot.config['shard_ids']:
+        # Only some of the shards run here: share ready pools, queues and broadcasts with the other processes
+        bot.shared_state = SharedState(bot, bot.pubsub, ready_pools, matchmaker, create_db_connection, close_db_connection)
+        bot.shared_state.refresh_leaderboard = lambda: update_leaderboard_message(notify_shards=False)
+        bot.shared_state.attach()
+
+    async with startup.phase("cogs"):
+        for extension in COG_EXTENSIONS:
+            bot.load_extension(extension)
+
+    metrics.install(bot)
+    deadline_guard.budget = bot.config['auto_defer_ms'] / 1000
+    if bot.config['loop_lag_ms']:
+        # Started in on_ready: until bot.run drives the loop, the probe would record the gap as a stall
+        bot.loop_monitor = LoopLagMonitor(threshold=bot.config['loop_lag_ms'] / 1000)
+    if bot.config['metrics_port']:
+        await metrics.start_metrics_server("127.0.0.1", bot.config['metrics_port'])
+
+    startup.begin("connect")
+
+def main():
+    bot.loop.run_until_complete(prepare_startup())
+    # Run the Chivalry 2 discord ranked combat bot, maaan
+    try:
+        bot.run(TOKEN)
+    finally:
+        if bot.config.get('query_report_path'):
+            metrics.query_tracer.export(bot.config['query_report_path'])
+            print(f"Query report written to {bot.config['query_report_path']}")
 
 
-setup()
-# Run the Chivalry 2 discord ranked combat bot, maaan
-bot.run(TOKEN)
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,15 @@
 import discord
 from discord.ext import commands
-import asyncpg
 import json
 from datetime import datetime
 
-# Assuming DATABASE, USER, and HOST are defined as before
-DATABASE = "chivstats"
-USER = "webchiv"
-HOST = "/var/run/postgresql"
+import responsecache
+from deadline import defer_ephemeral
+import shardstate
 
 class CoinCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        # Ensure the database details are correctly set for the bot instance
-        self.db_details = {
-            'database': DATABASE,
-            'user': USER,
-            'host': HOST
-        }
 
     async def update_house_account_balance(self, conn, amount):
         try:
@@ -36,11 +28,13 @@ class CoinCog(commands.Cog):
                     INSERT INTO house_account (balance, last_updated, payout_rate) 
                     VALUES ($1, CURRENT_TIMESTAMP, 5.00)
                 """, amount)
+            self.bot.response_cache.invalidate(responsecache.HOUSE)
         except Exception as e:
             print(f"Error updating house account balance: {e}")
 
 
     @commands.slash_command(name='coin_clown', description="Toggle clown status for a user at a cost")
+    @defer_ephemeral
     async def coin_clown_command(self, ctx: discord.ApplicationContext, member: discord.Member):
         cost = 50
         clown_emoji = "🤡"
@@ -81,6 +75,7 @@ class CoinCog(commands.Cog):
             await ctx.respond(f"{member.display_name} has been {global_action}ed globally by you. Cost: {cost} coins. Your remaining balance is {new_balance} coins.", ephemeral=True)
 
     @commands.slash_command(name='coin_mass_declown', description="Remove the clown emoji from all users for 200 coins.")
+    @defer_ephemeral
     async def coin_mass_declown_command(self, ctx: discord.ApplicationContext):
         cost = 200  # Cost for the mass declowning
         clown_emoji = "🤡"
@@ -122,7 +117,6 @@ class CoinCog(commands.Cog):
         cost = 10  # Cost for the announcement
         await ctx.defer()
 
-        channels_sent_to = 0  # Initialize the counter for the number of channels
         async with self.bot.db_pool.acquire() as conn:
             user_coins = await conn.fetchval("""
                 SELECT coins FROM ranked_players 
@@ -145,22 +139,11 @@ class CoinCog(commands.Cog):
             embed = discord.Embed(title=title, description=message_content, color=discord.Color.yellow())
             embed.set_author(name=ctx.user.display_name, icon_url=ctx.user.display_avatar.url)
 
-            for guild in self.bot.guilds:
-                chivstats_channel = discord.utils.get(guild.text_channels, name=echo_channel_name)
-                if chivstats_channel:
-                    await chivstats_channel.send(embed=embed)
-                    channels_sent_to += 1
+            channels_sent_to = len(await shardstate.broadcast(self.bot, echo_channel_name, embed=embed))
 
             footer_text = f"{ctx.user.display_name} spent {cost} coins to send this to {channels_sent_to} channels ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})"
             embed.set_footer(text=footer_text)
             await ctx.followup.send(f"Your announcement has been sent to {channels_sent_to} channels.", ephemeral=True)
 
-    # Initialization and DB pool setup
-    @commands.Cog.listener()
-    async def on_ready(self):
-        if not hasattr(self.bot, 'db_pool'):
-            self.bot.db_pool = await asyncpg.create_pool(database=DATABASE, user=USER, host=HOST)
-            print("Database connection pool created for CoinCog")
-
 def setup(bot):
     bot.add_cog(CoinCog(bot))
\ No newline at end of file
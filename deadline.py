@@ -0,0 +1,108 @@
+#deadline.py
+import asyncio
+
+import discord
+from discord.interactions import InteractionResponse
+
+from metrics import command_metrics
+
+_EPHEMERAL_DEFER = '_chivbot_defer_ephemeral'
+
+
+def defer_ephemeral(func):
+    """Marks a command whose replies are ephemeral, so an automatic defer is ephemeral too.
+
+    Discord fixes a deferred reply's visibility at defer time. A public defer
+    would turn an ephemeral reply public, and an ephemeral one would hide a
+    public reply.
+    """
+    setattr(func, _EPHEMERAL_DEFER, True)
+    return func
+
+
+class GuardedResponse(InteractionResponse):
+    """InteractionResponse that still works after DeadlineGuard deferred on the command's behalf.
+
+    The automatic defer and the command's own send_message/defer take the same
+    lock, so one of them finishes before the other decides what to do. Once
+    auto-deferred, send_message goes to a followup, where the first followup
+    replaces the "thinking..." message, and defer becomes a no-op.
+    """
+
+    __slots__ = ('auto_deferred', 'timer', 'lock')
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.auto_deferred = False
+        self.timer = None
+        self.lock = asyncio.Lock()
+
+    async def send_message(self, content=None, **kwargs):
+        async with self.lock:
+            if not self.auto_deferred:
+                return await super().send_message(content, **kwargs)
+        return await self._parent.followup.send(content, wait=True, **kwargs)
+
+    async def defer(self, **kwargs):
+        async with self.lock:
+            if not self.auto_deferred:
+                await super().defer(**kwargs)
+
+    async def auto_defer(self, ephemeral):
+        """Defers unless the command responded first; returns whether it deferred."""
+        async with self.lock:
+            if self.is_done():
+                return False
+            await super().defer(ephemeral=ephemeral)
+            # Only set once Discord has acknowledged, so followups never go out before the defer exists
+            self.auto_deferred = True
+            return True
+
+
+class DeadlineGuard:
+    """Defers slash commands that haven't responded within `budget` seconds.
+
+    Discord fails an interaction with no response or defer within 3 seconds.
+    Commands that do DB or REST work before replying can miss that under load.
+    Installed from the global before/after invoke hooks, the guard swaps in a
+    GuardedResponse and starts a timer for every command. When the timer fires
+    before the command has responded, the guard defers for it and counts an
+    auto-defer for the command in command_metrics. The budget runs from when
+    the command starts, so keep it well under 3 seconds to leave room for
+    gateway and loop delays.
+    """
+
+    def __init__(self, budget=2.0):
+        self.budget = budget
+
+    def command_started(self, ctx):
+        interaction = getattr(ctx, 'interaction', None)
+        if not self.budget or interaction is None or interaction.type is not discord.InteractionType.application_command:
+            return
+        response = interaction.response
+        if response.is_done():
+            return
+        guarded = GuardedResponse(interaction)
+        interaction._cs_response = guarded  # the slot behind Interaction.response
+        ephemeral = getattr(getattr(ctx.command, 'callback', None), _EPHEMERAL_DEFER, False)
+        guarded.timer = asyncio.create_task(self._defer_later(ctx.command.qualified_name, guarded, ephemeral))
+
+    def command_finished(self, ctx):
+        interaction = getattr(ctx, 'interaction', None)
+        response = getattr(interaction, '_cs_response', None)
+        if isinstance(response, GuardedResponse) and response.timer is not None:
+            response.timer.cancel()
+            response.timer = None
+
+    async def _defer_later(self, name, response, ephemeral):
+        await asyncio.sleep(self.budget)
+        try:
+            deferred = await response.auto_defer(ephemeral)
+        except discord.InteractionResponded:
+            return  # answered through a method the guard doesn't wrap, e.g. send_modal
+        except discord.HTTPException as e:
+            # auto_deferred stays False, so the command's replies still go to the response
+            print(f"Automatic defer failed for {name}: {e}")
+            return
+        if deferred:
+            command_metrics.record_auto_defer(name)
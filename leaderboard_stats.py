@@ -0,0 +1,88 @@
+#leaderboard_stats.py
+import asyncio
+
+
+class LeaderboardStatsCache:
+    """Per-player value and rank for the latest snapshot of each leaderboard class.
+
+    Leaderboard tables hold one row per player per snapshot (serialnumber). Ranks for
+    a snapshot are computed once, in bulk, when it first shows up; after that a /stats
+    lookup is a dict hit per leaderboard class.
+    """
+
+    def __init__(self, leaderboard_classes, refresh_interval=60):
+        self.leaderboard_classes = leaderboard_classes
+        self.refresh_interval = refresh_interval
+        # leaderboard -> (serialnumber, {playfabid: (stat_value, rank)})
+        self.snapshots = {}
+        self._refresh_task = None
+
+    async def refresh(self, conn):
+        """Loads any leaderboard whose latest serialnumber differs from the cached one."""
+        for leaderboard in self.leaderboard_classes:
+            serialnumber = await conn.fetchval(f"SELECT MAX(serialnumber) FROM {leaderboard}")
+            current = self.snapshots.get(leaderboard)
+            if serialnumber is None or (current and current[0] == serialnumber):
+                continue
+
+            # RANK() gives ties the same position, matching COUNT(stat_value > x) + 1
+            rows = await conn.fetch(f"""
+                SELECT playfabid, stat_value, RANK() OVER (ORDER BY stat_value DESC) AS rank
+                FROM {leaderboard}
+                WHERE serialnumber = $1
+                """, serialnumber)
+            self.snapshots[leaderboard] = (
+                serialnumber,
+                {row['playfabid']: (row['stat_value'], row['rank']) for row in rows},
+            )
+            print(f"Leaderboard {leaderboard}: cached {len(rows)} ranks for serial {serialnumber}")
+
+    def start(self, create_db_connection, close_db_connection):
+        """Starts polling for new snapshots in the background, once per process."""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(create_db_connection, close_db_connection))
+
+    async def _refresh_loop(self, create_db_connection, close_db_connection):
+        # The first load happens in the startup cache warm-up phase
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            conn = await create_db_connection()
+            try:
+                await self.refresh(conn)
+            except Exception as e:
+                print(f"Error refreshing leaderboard stats: {e}")
+            finally:
+                await close_db_connection(conn)
+
+    async def get_player_stats(self, conn, playfabid):
+        stats = {}
+        for leaderboard in self.leaderboard_classes:
+            snapshot = self.snapshots.get(leaderboard)
+            if snapshot and playfabid in snapshot[1]:
+                serialnumber, ranks = snapshot
+                stat_value, rank = ranks[playfabid]
+                stats[leaderboard] = {'stat_value': stat_value, 'serialnumber': serialnumber, 'rank': rank}
+                continue
+
+            # Player isn't in the latest snapshot (or it hasn't loaded yet):
+            # fall back to their most recent row and rank it within that snapshot.
+            result = await conn.fetchrow(f"""
+                SELECT stat_value, serialnumber
+                FROM {leaderboard}
+                WHERE playfabid = $1
+                ORDER BY serialnumber DESC
+                LIMIT 1
+                """, playfabid)
+
+            if result:
+                stat_value, serialnumber = result
+                rank = await conn.fetchval(f"""
+                    SELECT COUNT(*) + 1
+                    FROM {leaderboard}
+                    WHERE serialnumber = $1 AND stat_value > $2
+                    """, serialnumber, stat_value)
+                stats[leaderboard] = {'stat_value': stat_value, 'serialnumber': serialnumber, 'rank': rank}
+            else:
+                stats[leaderboard] = {'stat_value': 'No data', 'serialnumber': None, 'rank': None}
+
+        return stats
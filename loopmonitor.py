@@ -0,0 +1,119 @@
+#loopmonitor.py
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+from metrics import Histogram, SECONDS_BUCKETS, running_commands
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stall:
+    __slots__ = ('command', 'location', 'stack')
+
+    def __init__(self, command, location, stack):
+        self.command = command
+        self.location = location
+        self.stack = stack
+
+
+class Offender:
+    __slots__ = ('count', 'total', 'worst', 'stack')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.stack = ""
+
+
+class LoopLagMonitor:
+    """Measures event loop lag and catches whatever is holding the loop when it stalls.
+
+    A probe task sleeps for `interval` and records how late it wakes up. A
+    watchdog thread checks the probe's heartbeat. When the loop has been stuck
+    for longer than `threshold`, the watchdog samples the loop thread's stack and
+    notes the command running in the current task. Once the loop frees up, the
+    stall is charged to that command and the repo code line it was stuck in.
+    """
+
+    def __init__(self, threshold=0.1, interval=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = Histogram(SECONDS_BUCKETS)
+        self.offenders = {}  # (command, location) -> Offender
+        self._heartbeat = time.perf_counter()
+        self._stall = None
+        self._loop = None
+        self._loop_thread = None
+        self._task = None
+
+    def start(self):
+        """Starts the probe and watchdog; call from the event loop thread once it is running the bot."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._task = asyncio.create_task(self._probe())
+        threading.Thread(target=self._watchdog, name="loop-lag-watchdog", daemon=True).start()
+
+    async def _probe(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._heartbeat = now
+            lag = max(0.0, now - started - self.interval)
+            self.lag.observe(lag)
+
+            stall, self._stall = self._stall, None
+            if stall is not None:
+                self._record(stall, lag)
+
+    def _watchdog(self):
+        while True:
+            time.sleep(self.interval / 2)
+            if self._stall is None and time.perf_counter() - self._heartbeat > self.threshold + self.interval:
+                self._stall = self._sample()
+
+    def _sample(self):
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame)
+        # Blame the innermost frame in the bot's own code, not the library it called into
+        location = next(
+            (f"{os.path.basename(entry.filename)}:{entry.lineno} {entry.name}" for entry in reversed(stack) if entry.filename.startswith(REPO_DIR)),
+            f"{os.path.basename(stack[-1].filename)}:{stack[-1].lineno} {stack[-1].name}" if stack else "unknown",
+        )
+        task = asyncio.current_task(self._loop)
+        command = running_commands.get(task) if task is not None else None
+        if command is None:
+            command = task.get_name() if task is not None else "loop callback"
+        return Stall(command, location, "".join(traceback.format_list(stack[-8:])))
+
+    def _record(self, stall, lag):
+        offender = self.offenders.get((stall.command, stall.location))
+        if offender is None:
+            offender = self.offenders[(stall.command, stall.location)] = Offender()
+        offender.count += 1
+        offender.total += lag
+        if lag >= offender.worst:
+            offender.worst = lag
+            offender.stack = stall.stack
+        print(f"Event loop blocked for {lag * 1000:.0f}ms by {stall.command} at {stall.location}")
+
+    def report_lines(self, limit=10):
+        """Worst offenders by total time they held the loop."""
+        lines = [
+            f"Loop lag: n={self.lag.count} p50<={self.lag.quantile(0.5)}s p99<={self.lag.quantile(0.99)}s "
+            f"avg {self.lag.sum / self.lag.count * 1000 if self.lag.count else 0:.1f}ms"
+        ]
+        ranked = sorted(self.offenders.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+        for (command, location), offender in ranked:
+            lines.append(f"{command} at {location}: {offender.count} stalls, {offender.total * 1000:.0f}ms total, worst {offender.worst * 1000:.0f}ms")
+        return lines
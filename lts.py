@@ -1,14 +1,14 @@
 import discord
 from discord.ext import commands
-import asyncpg
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
 import re
 
-DATABASE = "chivstats"
-USER = "webchiv"
-HOST = "/var/run/postgresql"
+import responsecache
+from deadline import defer_ephemeral
+import lts_rating
+import shardstate
 
 def calculate_elo(R, K, games_won, games_played, opponent_rating, c=400):
     expected_score = 1 / (1 + 10 ** ((opponent_rating - R) / c))
@@ -31,29 +31,21 @@ def remove_mentions(text):
 
 async def echo_to_guilds(bot, interaction, embed, echo_channel_name):
     origin_guild_name = interaction.guild.name
-    guild_names_sent_to = []
+    embed_copy = embed.copy()
 
-    for guild in bot.guilds:
-        echo_channel = discord.utils.get(guild.text_channels, name=echo_channel_name)
-        if echo_channel and echo_channel.id != interaction.channel.id:
-            try:
-                embed_copy = embed.copy()
-
-                # Use the custom remove_mentions function
-                if embed_copy.title:
-                    embed_copy.title = remove_mentions(embed_copy.title)
-                if embed_copy.description:
-                    embed_copy.description = remove_mentions(embed_copy.description)
+    # Use the custom remove_mentions function
+    if embed_copy.title:
+        embed_copy.title = remove_mentions(embed_copy.title)
+    if embed_copy.description:
+        embed_copy.description = remove_mentions(embed_copy.description)
 
-                # Optionally, strip mentions from fields
-                for field in embed_copy.fields:
-                    field.name = remove_mentions(field.name)
-                    field.value = remove_mentions(field.value)
+    # Optionally, strip mentions from fields
+    for field in embed_copy.fields:
+        field.name = remove_mentions(field.name)
+        field.value = remove_mentions(field.value)
 
-                await echo_channel.send(embed=embed_copy)
-                guild_names_sent_to.append(guild.name)
-            except Exception as e:
-                print(f"Failed to send message to {echo_channel.name} in {guild.name}: {e}")
+    # Other shard processes echo to their own guilds
+    guild_names_sent_to = await shardstate.broadcast(bot, echo_channel_name, embed=embed_copy, exclude_channel_id=interaction.channel.id)
 
     if guild_names_sent_to:
         audit_message = f"Message from {origin_guild_name} echoed to the following guilds: {', '.join(guild_names_sent_to)}"
@@ -61,193 +53,212 @@ async def echo_to_guilds(bot, interaction, embed, echo_channel_name):
         audit_message = f"Message from {origin_guild_name} was not echoed to any other guilds."
     return audit_message
 
+# Submissions nobody confirms or denies within this long expire
+PENDING_MATCH_EXPIRY = timedelta(days=7)
+EXPIRY_CHECK_INTERVAL = 3600
+
+# Locks the match and both teams so concurrent confirmations settle one at a time
+PENDING_MATCH_QUERY = """
+    SELECT m.submitting_discordid, m.winner_team_id, m.winner_score, m.loser_team_id, m.loser_score,
+           w.team_name AS winner_name, w.elo_rating AS winner_elo, w.roster AS winner_roster,
+           l.team_name AS loser_name, l.elo_rating AS loser_elo, l.roster AS loser_roster
+    FROM lts_matches m
+    JOIN lts_teams w ON w.id = m.winner_team_id
+    JOIN lts_teams l ON l.id = m.loser_team_id
+    WHERE m.id = $1 AND m.confirmed = FALSE AND m.confirming_discordid IS NULL AND m.expired = FALSE
+    FOR UPDATE OF m, w, l
+"""
+
+# Both teams and the match in one statement
+SETTLE_MATCH_QUERY = """
+    WITH winner AS (
+        UPDATE lts_teams SET elo_rating = $3, matches_played = matches_played + 1, wins = wins + $5 WHERE id = $6
+    ), loser AS (
+        UPDATE lts_teams SET elo_rating = $4, matches_played = matches_played + 1, losses = losses + $5 WHERE id = $7
+    )
+    UPDATE lts_matches SET confirmed = TRUE, confirming_discordid = $2, winner_elo = $3, loser_elo = $4 WHERE id = $1
+"""
+
+def roster_ids(roster):
+    return [int(member_id) for member_id in json.loads(roster)] if roster else []
+
 class ConfirmationViewLTS(discord.ui.View):
-    def __init__(self, bot, db_pool, submitter, opponent_team, team1_score, team2_score, team1_id, team2_id, team1_elo, team2_elo, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    # Persistent: no timeout, and the match id lives in the custom_ids, so
+    # LTSCog.restore_pending_matches can re-register it after a restart.
+    def __init__(self, bot, match_id):
+        super().__init__(timeout=None)
         self.bot = bot
-        self.db_pool = db_pool
-        self.submitter = submitter
-        self.opponent_team = opponent_team
-        self.team1_score = team1_score
-        self.team2_score = team2_score
-        self.team1_id = team1_id
-        self.team2_id = team2_id
-        self.team1_elo = team1_elo
-        self.team2_elo = team2_elo
-
-        self.confirm_button = discord.ui.Button(label="Confirm", style=discord.ButtonStyle.green)
+        self.match_id = match_id
+
+        self.confirm_button = discord.ui.Button(label="Confirm", style=discord.ButtonStyle.green, custom_id=f"lts_confirm:{match_id}")
         self.confirm_button.callback = self.confirm_button_clicked
         self.add_item(self.confirm_button)
 
-        self.deny_button = discord.ui.Button(label="Deny", style=discord.ButtonStyle.red)
+        self.deny_button = discord.ui.Button(label="Deny", style=discord.ButtonStyle.red, custom_id=f"lts_deny:{match_id}")
         self.deny_button.callback = self.deny_button_clicked
         self.add_item(self.deny_button)
 
     async def confirm_button_clicked(self, interaction: discord.Interaction):
-        async with self.db_pool.acquire() as conn:
-            opponent_ids = [int(member_id) for member_id in json.loads(self.opponent_team['roster'])]
-            if interaction.user.id not in opponent_ids:
-                await interaction.response.send_message("You are not authorized to confirm this match.", ephemeral=True)
-                return
-
-            # Update the match to confirmed status
-            await conn.execute("""
-                UPDATE lts_matches
-                SET confirmed = TRUE, confirming_discordid = $1
-                WHERE submitting_discordid = $2 AND winner_team_id = $3 AND loser_team_id = $4
-            """, interaction.user.id, self.submitter.id, self.team1_id, self.team2_id)
-
-            # Fetch current ELOs directly before calculating new ELOs
-            team1_elo = await conn.fetchval("SELECT elo_rating FROM lts_teams WHERE id = $1", self.team1_id)
-            team2_elo = await conn.fetchval("SELECT elo_rating FROM lts_teams WHERE id = $1", self.team2_id)
-            # Fetch team names and current ELOs for embed update
-            team1_info = await conn.fetchrow("SELECT team_name, elo_rating FROM lts_teams WHERE id = $1", self.team1_id)
-            team2_info = await conn.fetchrow("SELECT team_name, elo_rating FROM lts_teams WHERE id = $1", self.team2_id)
-            team1_name = team1_info['team_name']
-            team2_name = team2_info['team_name']
-            
-            # Calculate new ELO ratings for both teams based on the match outcome
-            team1_new_elo, team2_new_elo = await calculate_duo_elo(team1_elo, team2_elo, self.team1_score, self.team2_score)
-            
-            # Determine winning and losing team names, scores, and ELOs
-            if self.team1_score > self.team2_score:
-                winning_team_name, winners_score, winner_new_elo = team1_name, self.team1_score, team1_new_elo
-                losing_team_name, losers_score, loser_new_elo = team2_name, self.team2_score, team2_new_elo
-            else:
-                winning_team_name, winners_score, winner_new_elo = team2_name, self.team2_score, team2_new_elo
-                losing_team_name, losers_score, loser_new_elo = team1_name, self.team1_score, team1_new_elo
-
-
-            # Update database with new ELO ratings and match counts for both teams
-            await conn.execute("""
-                UPDATE lts_teams SET elo_rating = $1, matches_played = matches_played + 1, 
-                wins = wins + $2, losses = losses + $3 WHERE id = $4
-            """, team1_new_elo, 1 if self.team1_score > self.team2_score else 0, 1 if self.team1_score < self.team2_score else 0, self.team1_id)
-
-            await conn.execute("""
-                UPDATE lts_teams SET elo_rating = $1, matches_played = matches_played + 1, 
-                wins = wins + $2, losses = losses + $3 WHERE id = $4
-            """, team2_new_elo, 1 if self.team2_score > self.team1_score else 0, 1 if self.team2_score < self.team1_score else 0, self.team2_id)
-
-            # Fetch the embed from the original message
-            embed = interaction.message.embeds[0]
-            
-            # Prepare the embed with updated information
-            # Prepare the updated embed with all necessary information
-            embed = discord.Embed(
-                title="LTS Match Confirmed",
-                description=f"Winners: **{winning_team_name} ({winners_score})**\nLosers: {losing_team_name} ({losers_score})\n\n**New ELO Ratings:**\n- {winning_team_name}: {round(team1_new_elo)}\n- {losing_team_name}: {round(team2_new_elo)}",
-                color=discord.Color.green()
-            )
-            embed.set_footer(text=f"Match submitted by {self.submitter.display_name}, confirmed by {interaction.user.display_name}")
-            embed.timestamp = datetime.now()
-
-            origin_channel_name = interaction.channel.name
-            await echo_to_guilds(self.bot, interaction, embed, origin_channel_name)
-            # Edit the message with the new embed and remove the view (buttons)
-            await interaction.message.edit(embed=embed, view=None)
+        # Replies go out after the transaction, so Discord latency never holds the row locks
+        rejection = None
+        async with self.bot.db_pool.acquire() as conn:
+            async with conn.transaction():
+                match = await conn.fetchrow(PENDING_MATCH_QUERY, self.match_id)
+                if not match:
+                    rejection = "This match has already been confirmed, denied or has expired."
+                else:
+                    # The confirming side is whichever team the submitter is not on
+                    winner_roster, loser_roster = roster_ids(match['winner_roster']), roster_ids(match['loser_roster'])
+                    opponent_ids = loser_roster if match['submitting_discordid'] in winner_roster else winner_roster
+                    if interaction.user.id not in opponent_ids:
+                        rejection = "You are not authorized to confirm this match."
+                if rejection is None:
+                    # A drawn score is recorded with the opponent as "winner"; it moves ELO but counts as neither a win nor a loss
+                    winner_new_elo, loser_new_elo = await calculate_duo_elo(match['winner_elo'], match['loser_elo'], match['winner_score'], match['loser_score'])
+                    winner_new_elo, loser_new_elo = round(winner_new_elo), round(loser_new_elo)
+                    decided = 1 if match['winner_score'] > match['loser_score'] else 0
+                    await conn.execute(SETTLE_MATCH_QUERY, self.match_id, interaction.user.id, winner_new_elo, loser_new_elo,
+                                       decided, match['winner_team_id'], match['loser_team_id'])
+                    player_ratings = await lts_rating.settle_participants(conn, self.match_id, match['winner_team_id'], match['winner_score'], match['loser_score'])
+        if rejection is not None:
+            await interaction.response.send_message(rejection, ephemeral=True)
+            return
+        self.bot.response_cache.invalidate(responsecache.LTS)
+
+        submitter = self.bot.get_user(match['submitting_discordid'])
+        embed = discord.Embed(
+            title="LTS Match Confirmed",
+            description=f"Winners: **{match['winner_name']} ({match['winner_score']})**\nLosers: {match['loser_name']} ({match['loser_score']})\n\n**New ELO Ratings:**\n- {match['winner_name']}: {winner_new_elo}\n- {match['loser_name']}: {loser_new_elo}",
+            color=discord.Color.green()
+        )
+        if player_ratings:
+            embed.add_field(name="Player Ratings", value="\n".join(
+                f"<@{discord_id}>: {round(after)} ({after - before:+.0f})" for discord_id, (before, after) in player_ratings.items()
+            )[:1024], inline=False)
+        embed.set_footer(text=f"Match submitted by {submitter.display_name if submitter else match['submitting_discordid']}, confirmed by {interaction.user.display_name}")
+        embed.timestamp = datetime.now()
+
+        # Answer the click by editing the message with the new embed and removing the view (buttons), then broadcast
+        await interaction.response.edit_message(embed=embed, view=None)
+        origin_channel_name = interaction.channel.name
+        await echo_to_guilds(self.bot, interaction, embed, origin_channel_name)
 
 
     async def deny_button_clicked(self, interaction: discord.Interaction):
-        async with self.db_pool.acquire() as conn:
-            # Fetch the rosters for both teams to check if the user is authorized
-            submitting_team_roster = await conn.fetchval("SELECT roster FROM lts_teams WHERE id = $1", self.team1_id)
-            opponent_team_roster = await conn.fetchval("SELECT roster FROM lts_teams WHERE id = $1", self.team2_id)
-            
-            # Ensure rosters are loaded correctly and convert JSON strings to Python lists
-            submitting_team_roster = json.loads(submitting_team_roster) if submitting_team_roster else []
-            opponent_team_roster = json.loads(opponent_team_roster) if opponent_team_roster else []
-
-            # Convert roster IDs to integers for comparison
-            combined_roster_ids = [int(member_id) for member_id in submitting_team_roster + opponent_team_roster]
-            user_id = interaction.user.id
-
-            # Check if the user is in either roster
-            if user_id not in combined_roster_ids:
-                await interaction.response.send_message("You are not authorized to deny this match.", ephemeral=True)
-                return
-
-            # If authorized, proceed to mark the match as denied or disputed
-            await conn.execute("""
-                UPDATE lts_matches
-                SET confirmed = FALSE, confirming_discordid = $1
-                WHERE submitting_discordid = $2 AND winner_team_id = $3 AND loser_team_id = $4
-            """, user_id, self.submitter.id, self.team1_id, self.team2_id)
-            
-            embed = discord.Embed(title="LTS Match Denied",
-                                description="The match result submission has been denied.",
-                                color=discord.Color.red())
-            embed.timestamp = datetime.now()
-            embed.set_footer(text=f"Match submitted by {self.submitter.display_name}, denied by {interaction.user.display_name}")
-            try:
-                await interaction.message.edit(embed=embed, view=None)  # Attempt to edit the message to reflect denial
-
-            except discord.NotFound:
-                await interaction.followup.send("Unable to find the original message to edit. It may have been deleted.", ephemeral=True)
+        rejection = None
+        async with self.bot.db_pool.acquire() as conn:
+            async with conn.transaction():
+                match = await conn.fetchrow(PENDING_MATCH_QUERY, self.match_id)
+                if not match:
+                    rejection = "This match has already been confirmed, denied or has expired."
+                # Anyone on either roster may deny
+                elif interaction.user.id not in roster_ids(match['winner_roster']) + roster_ids(match['loser_roster']):
+                    rejection = "You are not authorized to deny this match."
+                else:
+                    # Denied matches stay unconfirmed with the denier recorded
+                    await conn.execute("UPDATE lts_matches SET confirming_discordid = $1 WHERE id = $2", interaction.user.id, self.match_id)
+        if rejection is not None:
+            await interaction.response.send_message(rejection, ephemeral=True)
+            return
+        # Acknowledge the click; the message is edited separately so a deleted message can still be reported
+        await interaction.response.defer()
+
+        submitter = self.bot.get_user(match['submitting_discordid'])
+        embed = discord.Embed(title="LTS Match Denied",
+                            description="The match result submission has been denied.",
+                            color=discord.Color.red())
+        embed.timestamp = datetime.now()
+        embed.set_footer(text=f"Match submitted by {submitter.display_name if submitter else match['submitting_discordid']}, denied by {interaction.user.display_name}")
+        try:
+            await interaction.message.edit(embed=embed, view=None)  # Attempt to edit the message to reflect denial
+
+        except discord.NotFound:
+            await interaction.followup.send("Unable to find the original message to edit. It may have been deleted.", ephemeral=True)
 
 
 class LTSCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db_details = {
-            'database': DATABASE,
-            'user': USER,
-            'host': HOST
-        }
-
-    async def create_db_pool(self):
-        self.bot.db_pool = await asyncpg.create_pool(**self.db_details)
+        self.views_restored = False
+        self.expiry_task = None
 
     @commands.Cog.listener()
     async def on_ready(self):
-        await self.create_db_pool()
-        print("LTS Cog ready and DB pool created.")
+        # on_ready fires again after reconnects; the views only need registering once
+        if not self.views_restored:
+            self.views_restored = True
+            await self.expire_pending_matches()
+            await self.restore_pending_matches()
+            self.expiry_task = asyncio.create_task(self.expire_pending_matches_loop())
+        print("LTS Cog ready.")
+
+    async def restore_pending_matches(self):
+        # Re-attach the buttons of unconfirmed submissions; their custom_ids carry the match id
+        async with self.bot.db_pool.acquire() as conn:
+            pending = await conn.fetch("SELECT id FROM lts_matches WHERE confirmed = FALSE AND confirming_discordid IS NULL AND expired = FALSE")
+        for match in pending:
+            self.bot.add_view(ConfirmationViewLTS(self.bot, match['id']))
+        print(f"Restored {len(pending)} pending LTS confirmations.")
+
+    async def expire_pending_matches(self):
+        # Their buttons stay registered until the next restart, but answer that the match has expired
+        async with self.bot.db_pool.acquire() as conn:
+            expired = await conn.fetch("""
+                UPDATE lts_matches SET expired = TRUE
+                WHERE confirmed = FALSE AND confirming_discordid IS NULL AND expired = FALSE
+                  AND match_timestamp < CURRENT_TIMESTAMP - $1::interval
+                RETURNING id
+            """, PENDING_MATCH_EXPIRY)
+        if expired:
+            print(f"Expired {len(expired)} unanswered LTS submissions: {', '.join(str(row['id']) for row in expired)}")
+
+    async def expire_pending_matches_loop(self):
+        while True:
+            await asyncio.sleep(EXPIRY_CHECK_INTERVAL)
+            try:
+                await self.expire_pending_matches()
+            except Exception as e:
+                print(f"Error expiring LTS submissions: {e}")
 
     @commands.slash_command(name="submit_lts", description="Submit the result of an LTS match.")
     async def submit_lts(self, interaction: discord.Interaction, your_score: int, opponent_team_player: discord.Member, their_score: int):
         async with self.bot.db_pool.acquire() as conn:
-            user_id_str = str(interaction.user.id)
-            opponent_id_str = str(opponent_team_player.id)
+            # Team lookups go through the normalized lts_team_members (migrations/006_lts_player_ratings.sql)
+            team_query = "SELECT t.id, t.team_name, t.elo_rating FROM lts_team_members m JOIN lts_teams t ON t.id = m.team_id WHERE m.discordid = $1"
+            user_team_info = await conn.fetchrow(team_query, interaction.user.id)
 
-            user_team_info = await conn.fetchrow(
-                "SELECT id, team_name, elo_rating, roster FROM lts_teams WHERE roster @> $1::jsonb",
-                json.dumps([user_id_str])
-            )
-
-            if not user_team_info or user_id_str not in json.loads(user_team_info['roster']):
+            if not user_team_info:
                 await interaction.response.send_message("You are not registered on any LTS team or not in the roster.", ephemeral=True)
                 return
 
-            opponent_team_info = await conn.fetchrow(
-                "SELECT id, team_name, elo_rating, roster FROM lts_teams WHERE roster @> $1::jsonb",
-                json.dumps([opponent_id_str])
-            )
+            opponent_team_info = await conn.fetchrow(team_query, opponent_team_player.id)
 
-            if not opponent_team_info or opponent_id_str not in json.loads(opponent_team_info['roster']):
+            if not opponent_team_info:
                 await interaction.response.send_message(f"Opponent team for player {opponent_team_player.display_name} not found or the player is not on the roster.", ephemeral=True)
                 return
 
             # Determine winner and loser based on score
             if your_score > their_score:
-                winning_team_name, winners_score = user_team_info['team_name'], your_score
-                losing_team_name, losers_score = opponent_team_info['team_name'], their_score
+                winner, winners_score, loser, losers_score = user_team_info, your_score, opponent_team_info, their_score
             else:
-                winning_team_name, winners_score = opponent_team_info['team_name'], their_score
-                losing_team_name, losers_score = user_team_info['team_name'], your_score
+                winner, winners_score, loser, losers_score = opponent_team_info, their_score, user_team_info, your_score
+            winning_team_name, losing_team_name = winner['team_name'], loser['team_name']
+
+            # Record the pending match and both current rosters as its participants; confirm/deny settle it by id
+            match_id = await conn.fetchval("""
+                WITH match AS (
+                    INSERT INTO lts_matches (submitting_discordid, winner_team_id, winner_score, winner_elo, loser_team_id, loser_score, loser_elo)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7)
+                    RETURNING id
+                ), participants AS (
+                    INSERT INTO lts_match_participants (match_id, team_id, discordid)
+                    SELECT match.id, m.team_id, m.discordid FROM match JOIN lts_team_members m ON m.team_id IN ($2, $5)
+                )
+                SELECT id FROM match
+            """, interaction.user.id, winner['id'], winners_score, winner['elo_rating'], loser['id'], losers_score, loser['elo_rating'])
 
             # Prepare and send a confirmation message with the ConfirmationViewLTS
-            view = ConfirmationViewLTS(
-                bot=self.bot,
-                db_pool=self.bot.db_pool,
-                submitter=interaction.user,
-                opponent_team=opponent_team_info,
-                team1_score=your_score,
-                team2_score=their_score,
-                team1_id=user_team_info['id'],
-                team2_id=opponent_team_info['id'],
-                team1_elo=user_team_info['elo_rating'],
-                team2_elo=opponent_team_info['elo_rating']
-            )
+            view = ConfirmationViewLTS(self.bot, match_id)
 
             embed = discord.Embed(
                 title="LTS(3v3+) Match Submission (UNVERIFIED)",
@@ -271,7 +282,7 @@ class LTSCog(commands.Cog):
 
                 # Check if the user is already a member or owner of an LTS team
                 user_id_str = str(interaction.user.id)  # Convert user ID to string
-                existing_team_member = await conn.fetchval("SELECT id FROM lts_teams WHERE team_owner = $1 OR roster @> $2::jsonb", interaction.user.id, json.dumps([user_id_str]))
+                existing_team_member = await conn.fetchval("SELECT id FROM lts_teams WHERE team_owner = $1 OR id IN (SELECT team_id FROM lts_team_members WHERE discordid = $1)", interaction.user.id)
                 if existing_team_member:
                     await interaction.response.send_message("You are already a member or owner of an LTS team.", ephemeral=True)
                     return
@@ -282,6 +293,7 @@ class LTSCog(commands.Cog):
                     INSERT INTO lts_teams (team_name, team_owner, roster)
                     VALUES ($1, $2, $3::jsonb)
                     """, team_name, interaction.user.id, initial_roster)
+                self.bot.response_cache.invalidate(responsecache.LTS)
 
                 # Prepare the embed message for echoing
                 embed = discord.Embed(title="New LTS Team Created", color=discord.Color.green())
@@ -326,6 +338,7 @@ class LTSCog(commands.Cog):
 
                 # Update the team name
                 await conn.execute("UPDATE lts_teams SET team_name = $1 WHERE id = $2", new_team_name, team['id'])
+                self.bot.response_cache.invalidate(responsecache.LTS)
 
                 # Prepare the embed message
                 embed = discord.Embed(title="Team Name Changed", color=discord.Color.blue())
@@ -347,10 +360,11 @@ class LTSCog(commands.Cog):
 
 
     @commands.slash_command(name="lts_leave_team", description="Leave your current LTS team.")
+    @defer_ephemeral
     async def lts_leave_team(self, interaction: discord.Interaction):
         async with self.bot.db_pool.acquire() as conn:
             try:
-                player_id_str = str(interaction.user.id)  # Convert player ID to string for JSONB query
+                player_id_str = str(interaction.user.id)  # Roster entries are stored as strings
 
                 # Check if the user is the owner of any LTS team
                 team_owner_check = await conn.fetchrow("SELECT id, team_name FROM lts_teams WHERE team_owner = $1", interaction.user.id)
@@ -360,7 +374,7 @@ class LTSCog(commands.Cog):
                     return
 
                 # Fetch the team where the user is a member
-                team_info = await conn.fetchrow("SELECT id, roster, team_name FROM lts_teams WHERE roster @> $1::jsonb", json.dumps([player_id_str]))
+                team_info = await conn.fetchrow("SELECT t.id, t.roster, t.team_name FROM lts_team_members m JOIN lts_teams t ON t.id = m.team_id WHERE m.discordid = $1", interaction.user.id)
                 if not team_info:
                     await interaction.response.send_message("You are not a member of any LTS team.", ephemeral=True)
                     return
@@ -372,6 +386,7 @@ class LTSCog(commands.Cog):
                 if player_id_str in roster:
                     roster.remove(player_id_str)
                     await conn.execute("UPDATE lts_teams SET roster = $1::jsonb WHERE id = $2", json.dumps(roster), team_id)
+                    self.bot.response_cache.invalidate(responsecache.LTS)
                     leave_message = f"You have successfully left the team '{team_name}'."
                     await interaction.response.send_message(leave_message, ephemeral=True)
                 else:
@@ -383,6 +398,7 @@ class LTSCog(commands.Cog):
 
 
     @commands.slash_command(name="lts_add_teammate", description="Add a teammate to your LTS team.")
+    @defer_ephemeral
     async def lts_add_teammate(self, interaction: discord.Interaction, member: discord.Member):
         async with self.bot.db_pool.acquire() as conn:
             # Check if the command issuer is the owner of any team
@@ -392,7 +408,7 @@ class LTSCog(commands.Cog):
                 return
 
             # Check if the targeted member is already in a team
-            member_in_any_team = await conn.fetchval("SELECT id FROM lts_teams WHERE roster @> $1::jsonb", json.dumps([str(member.id)]))
+            member_in_any_team = await conn.fetchval("SELECT team_id FROM lts_team_members WHERE discordid = $1", member.id)
             if member_in_any_team:
                 await interaction.response.send_message(f"{member.display_name} is already a member of a team.", ephemeral=True)
                 return
@@ -402,6 +418,7 @@ class LTSCog(commands.Cog):
                 updated_roster = json.loads(owner_team['roster'])
                 updated_roster.append(str(member.id))  # Add new member ID as a string
                 await conn.execute("UPDATE lts_teams SET roster = $1::jsonb WHERE id = $2", json.dumps(updated_roster), owner_team['id'])
+                self.bot.response_cache.invalidate(responsecache.LTS)
 
                 await interaction.response.send_message(f"{member.display_name} has been successfully added to your team.", ephemeral=True)
             except Exception as e:
@@ -410,6 +427,7 @@ class LTSCog(commands.Cog):
 
 
     @commands.slash_command(name="lts_remove_teammate", description="Remove a teammate from your LTS team.")
+    @defer_ephemeral
     async def lts_remove_teammate(self, interaction: discord.Interaction, member: discord.Member):
         async with self.bot.db_pool.acquire() as conn:
             # Check if the command issuer is the owner of any team
@@ -430,6 +448,7 @@ class LTSCog(commands.Cog):
             try:
                 roster.remove(str(member.id))  # Remove member ID from roster
                 await conn.execute("UPDATE lts_teams SET roster = $1::jsonb WHERE id = $2", json.dumps(roster), owner_team['id'])
+                self.bot.response_cache.invalidate(responsecache.LTS)
 
                 await interaction.response.send_message(f"{member.display_name} has been successfully removed from your team.", ephemeral=True)
             except Exception as e:
@@ -439,33 +458,39 @@ class LTSCog(commands.Cog):
 
     @commands.slash_command(name="lts_list_teams", description="List all registered LTS teams.")
     async def lts_list_teams(self, interaction: discord.Interaction):
+        # Owner names cost a fetch_user each, so the whole embed is cached until an LTS write
+        embed = await self.bot.response_cache.get_or_build(('lts_list_teams',), (responsecache.LTS,), self.build_team_list_embed)
+
+        if not embed:
+            await interaction.response.send_message("There are currently no registered LTS teams.", ephemeral=True)
+        # Check if the embed exceeds Discord's limits
+        elif len(embed) > 6000:  # Discord embed total character limit
+            await interaction.response.send_message("The list of teams is too long to display in one message.", ephemeral=True)
+        else:
+            await interaction.response.send_message(embed=embed, ephemeral=False)
+
+    async def build_team_list_embed(self):
         async with self.bot.db_pool.acquire() as conn:
             # Fetch all teams ordered by ELO rating in descending order, including the team owner's ID
             teams = await conn.fetch("""
                 SELECT team_name, elo_rating, team_owner FROM lts_teams ORDER BY elo_rating DESC
             """)
 
-            if not teams:
-                await interaction.response.send_message("There are currently no registered LTS teams.", ephemeral=True)
-                return
+        if not teams:
+            return None
 
-            # Start constructing the embed
-            embed = discord.Embed(title="Registered LTS Teams", description="Teams sorted by ELO ranking:", color=discord.Color.blue())
+        # Start constructing the embed
+        embed = discord.Embed(title="Registered LTS Teams", description="Teams sorted by ELO ranking:", color=discord.Color.blue())
 
-            # Loop through each team to add them to the embed
-            for index, team in enumerate(teams, start=1):
-                # Fetch the team owner's name using their ID
-                owner = await self.bot.fetch_user(team['team_owner'])
-                owner_name = owner.name if owner else "Unknown Owner"
+        # Loop through each team to add them to the embed
+        for index, team in enumerate(teams, start=1):
+            # Fetch the team owner's name using their ID
+            owner = await self.bot.fetch_user(team['team_owner'])
+            owner_name = owner.name if owner else "Unknown Owner"
 
-                # Add the team to the embed with numbering and include the owner's name
-                embed.add_field(name=f"{index}. {team['team_name']} ({owner_name})", value=f"ELO: {team['elo_rating']}", inline=False)
-
-            # Check if the embed exceeds Discord's limits
-            if len(embed) > 6000:  # Discord embed total character limit
-                await interaction.response.send_message("The list of teams is too long to display in one message.", ephemeral=True)
-            else:
-                await interaction.response.send_message(embed=embed, ephemeral=False)
+            # Add the team to the embed with numbering and include the owner's name
+            embed.add_field(name=f"{index}. {team['team_name']} ({owner_name})", value=f"ELO: {team['elo_rating']}", inline=False)
+        return embed
 
     @commands.slash_command(name="lts_search", description="Display details about a team by a team member.")
     async def lts_search(self, interaction: discord.Interaction, member: discord.Member):
@@ -473,11 +498,12 @@ class LTSCog(commands.Cog):
             # Fetch team information including ELO rating, matches played, wins, and roster.
             team_info = await conn.fetchrow(
                 """
-                SELECT team_name, roster, team_owner, elo_rating, matches_played, wins
-                FROM lts_teams
-                WHERE roster @> $1::jsonb
+                SELECT t.team_name, t.roster, t.team_owner, t.elo_rating, t.matches_played, t.wins
+                FROM lts_team_members m
+                JOIN lts_teams t ON t.id = m.team_id
+                WHERE m.discordid = $1
                 """,
-                json.dumps([str(member.id)])
+                member.id
             )
 
             if not team_info:
@@ -0,0 +1,86 @@
+#lts_rating.py
+"""Per-player ratings for LTS matches, using an averaged-Elo team model.
+
+A side's strength is the mean rating of the players who took part. Each player
+is scored against the opposing side's mean, so a strong player on a winning
+team gains less than a weaker teammate. A whole side is rated in one pass over
+its participant lists, and the results are written with a single unnest()
+statement, so a 6v6 costs the same round trips as a 1v1.
+"""
+
+K = 32
+C = 400
+DEFAULT_RATING = 1500
+
+
+def expected_score(rating, opponent_rating, c=C):
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / c))
+
+
+def side_strength(ratings):
+    return sum(ratings) / len(ratings)
+
+
+def rate_side(ratings, opponent_ratings, actual, k=K):
+    """New ratings for one side's participants; actual is 1 for a win, 0 for a loss, 0.5 for a draw."""
+    opponent_strength = side_strength(opponent_ratings)
+    return [rating + k * (actual - expected_score(rating, opponent_strength)) for rating in ratings]
+
+
+def rate_match(winner_ratings, loser_ratings, winner_score, loser_score, k=K):
+    """New (winner, loser) participant ratings; equal scores count as a draw."""
+    winner_actual = 1 if winner_score > loser_score else 0.5
+    return (rate_side(winner_ratings, loser_ratings, winner_actual, k),
+            rate_side(loser_ratings, winner_ratings, 1 - winner_actual, k))
+
+
+# Participants of a match with their current ratings; unrated players start at DEFAULT_RATING
+PARTICIPANTS_QUERY = """
+    SELECT p.discordid, p.team_id, COALESCE(r.rating, $2) AS rating
+    FROM lts_match_participants p
+    LEFT JOIN lts_player_ratings r ON r.discordid = p.discordid
+    WHERE p.match_id = $1
+    ORDER BY p.team_id, p.discordid
+"""
+
+UPDATE_PLAYERS_QUERY = """
+    WITH rated AS (
+        SELECT * FROM unnest($2::bigint[], $3::float8[], $4::float8[], $5::int[], $6::int[])
+            AS rated(discordid, rating_before, rating_after, won, lost)
+    ), history AS (
+        UPDATE lts_match_participants p SET rating_before = rated.rating_before, rating_after = rated.rating_after
+        FROM rated WHERE p.match_id = $1 AND p.discordid = rated.discordid
+    )
+    INSERT INTO lts_player_ratings (discordid, rating, matches, wins, losses, last_match)
+    SELECT discordid, rating_after, 1, won, lost, CURRENT_TIMESTAMP FROM rated
+    ON CONFLICT (discordid) DO UPDATE SET
+        rating = EXCLUDED.rating,
+        matches = lts_player_ratings.matches + 1,
+        wins = lts_player_ratings.wins + EXCLUDED.wins,
+        losses = lts_player_ratings.losses + EXCLUDED.losses,
+        last_match = EXCLUDED.last_match
+"""
+
+
+async def settle_participants(conn, match_id, winner_team_id, winner_score, loser_score):
+    """Rates everyone recorded as playing match_id; returns {discordid: (before, after)}.
+
+    Matches submitted before participants were recorded have none, and leave
+    player ratings alone.
+    """
+    rows = await conn.fetch(PARTICIPANTS_QUERY, match_id, DEFAULT_RATING)
+    winners = [row for row in rows if row['team_id'] == winner_team_id]
+    losers = [row for row in rows if row['team_id'] != winner_team_id]
+    if not winners or not losers:
+        return {}
+
+    winner_after, loser_after = rate_match([row['rating'] for row in winners], [row['rating'] for row in losers], winner_score, loser_score)
+    decided = 1 if winner_score > loser_score else 0
+    players = winners + losers
+    after = winner_after + loser_after
+    await conn.execute(
+        UPDATE_PLAYERS_QUERY, match_id,
+        [row['discordid'] for row in players], [row['rating'] for row in players], after,
+        [decided] * len(winners) + [0] * len(losers), [0] * len(winners) + [decided] * len(losers),
+    )
+    return {row['discordid']: (row['rating'], rating) for row, rating in zip(players, after)}
@@ -0,0 +1,241 @@
+#matchmaking.py
+import asyncio
+import bisect
+import time
+
+
+class QueueEntry:
+    __slots__ = ('key', 'members', 'elo', 'queued_at', 'channel_id')
+
+    def __init__(self, members, elo, queued_at, channel_id):
+        self.key = tuple(sorted(members))
+        self.members = tuple(members)
+        self.elo = elo
+        self.queued_at = queued_at
+        self.channel_id = channel_id
+
+
+class MatchQueue:
+    """Entries kept sorted by Elo, so the closest opponents are found by bisection.
+
+    Finding a match is O(log n) plus the entries scanned inside the window.
+    Adding and removing are O(n): the sorted list is a plain list, and insort
+    and del shift its tail. For the queue sizes a ready pool reaches, that is
+    a short memmove.
+
+    An entry accepts opponents within its Elo window, which starts at
+    `base_window` and widens by `widen_per_minute` while it waits, up to
+    `max_window`. Two entries pair when each is inside the other's window.
+    """
+
+    def __init__(self, mode, team_size, base_window=50, widen_per_minute=25, max_window=400):
+        self.mode = mode
+        self.team_size = team_size
+        self.base_window = base_window
+        self.widen_per_minute = widen_per_minute
+        self.max_window = max_window
+        self.entries = {}  # key -> QueueEntry, oldest first
+        self.by_member = {}  # discord id -> key
+        self._sorted = []  # (elo, queued_at, key)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, member_id):
+        return member_id in self.by_member
+
+    def window(self, entry, now):
+        return min(self.max_window, self.base_window + self.widen_per_minute * (now - entry.queued_at) / 60)
+
+    def add(self, entry):
+        for member_id in entry.members:
+            if member_id in self.by_member:
+                self.remove(member_id)
+        self.entries[entry.key] = entry
+        for member_id in entry.members:
+            self.by_member[member_id] = entry.key
+        bisect.insort(self._sorted, (entry.elo, entry.queued_at, entry.key))
+
+    def remove(self, member_id):
+        """Removes the entry containing member_id (a whole team for duos); returns it or None."""
+        key = self.by_member.get(member_id)
+        if key is None:
+            return None
+        entry = self.entries.pop(key)
+        for member in entry.members:
+            self.by_member.pop(member, None)
+        index = bisect.bisect_left(self._sorted, (entry.elo, entry.queued_at, entry.key))
+        del self._sorted[index]
+        return entry
+
+    def find_match(self, entry, now):
+        """Closest-Elo entry that entry and it both accept, scanning outwards from entry's position."""
+        window = self.window(entry, now)
+        index = bisect.bisect_left(self._sorted, (entry.elo, entry.queued_at, entry.key))
+        below, above = index - 1, index + 1
+        while True:
+            below_gap = entry.elo - self._sorted[below][0] if below >= 0 else None
+            above_gap = self._sorted[above][0] - entry.elo if above < len(self._sorted) else None
+            if below_gap is None and above_gap is None:
+                return None
+            if above_gap is None or (below_gap is not None and below_gap <= above_gap):
+                gap, candidate_key, below = below_gap, self._sorted[below][2], below - 1
+            else:
+                gap, candidate_key, above = above_gap, self._sorted[above][2], above + 1
+            if gap > window:
+                return None
+            candidate = self.entries[candidate_key]
+            if gap <= self.window(candidate, now):
+                return candidate
+
+    def pair_all(self, now):
+        """Pairs whoever can be paired, longest-waiting first; returns [(entry, opponent)]."""
+        pairings = []
+        for entry in list(self.entries.values()):
+            if entry.key not in self.entries:
+                continue
+            opponent = self.find_match(entry, now)
+            if opponent is not None:
+                self.remove(entry.members[0])
+                self.remove(opponent.members[0])
+                pairings.append((entry, opponent))
+        return pairings
+
+
+class Matchmaker:
+    """1v1 and 2v2 matchmaking queues, persisted in ranked_players so they survive restarts.
+
+    ranked_players.time_queued holds the unix time a player queued (0 when not
+    queued). queue_mode, queue_partner and queue_channel_id record which queue,
+    the duo teammate and the channel to announce in.
+
+    With several shard processes, every process mirrors the queues through
+    on_change/apply_remote, but only the leader runs the pairing loop. Pairings
+    for channels it cannot see go out through relay.
+    """
+
+    def __init__(self, bot, create_db_connection, close_db_connection, interval=5):
+        self.bot = bot
+        self.create_db_connection = create_db_connection
+        self.close_db_connection = close_db_connection
+        self.interval = interval
+        self.queues = {'duel': MatchQueue('duel', 1), 'duo': MatchQueue('duo', 2)}
+        self.on_change = None  # async callable(conn, mode, members, entry or None), see shardstate.py
+        self.relay = None  # async callable(channel_id, content) for channels served by another process
+        self._task = None
+
+    async def reload(self, conn):
+        """Rebuilds the queues from ranked_players, e.g. after missing another process's changes."""
+        self.queues = {mode: MatchQueue(mode, queue.team_size) for mode, queue in self.queues.items()}
+        await self.restore(conn)
+
+    async def restore(self, conn):
+        rows = await conn.fetch("""
+            SELECT rp.discordid, rp.time_queued, rp.queue_mode, rp.queue_partner,
+                   rp.queue_channel_id, rp.elo_duelsx,
+                   COALESCE(dt.elo_rating, 1500) AS duo_elo
+            FROM ranked_players rp
+            LEFT JOIN ranked_players partner ON partner.discordid = rp.queue_partner
+            LEFT JOIN duo_teams dt ON LEAST(dt.player1_id, dt.player2_id) = LEAST(rp.playfabid, partner.playfabid)
+                                  AND GREATEST(dt.player1_id, dt.player2_id) = GREATEST(rp.playfabid, partner.playfabid)
+            WHERE rp.time_queued > 0 AND rp.queue_mode IS NOT NULL AND rp.retired = FALSE
+        """)
+        for row in rows:
+            if row['queue_mode'] == 'duo':
+                if row['queue_partner'] is None or row['queue_partner'] in self.queues['duo']:
+                    continue
+                entry = QueueEntry((row['discordid'], row['queue_partner']), row['duo_elo'], row['time_queued'], row['queue_channel_id'])
+                self.queues['duo'].add(entry)
+            else:
+                self.queues['duel'].add(QueueEntry((row['discordid'],), row['elo_duelsx'], row['time_queued'], row['queue_channel_id']))
+        print(f"Matchmaking restored {len(self.queues['duel'])} duel and {len(self.queues['duo'])} duo queue entries.")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.match()
+            except Exception as e:
+                print(f"Error in matchmaking: {e}")
+
+    async def match(self):
+        now = time.time()
+        for mode, queue in self.queues.items():
+            pairings = queue.pair_all(now)
+            if not pairings:
+                continue
+            members = [member for pairing in pairings for entry in pairing for member in entry.members]
+            conn = await self.create_db_connection()
+            try:
+                await self._persist(conn, members, None)
+                if self.on_change is not None:
+                    await self.on_change(conn, mode, members, None)
+            finally:
+                await self.close_db_connection(conn)
+            for entry, opponent in pairings:
+                await self.publish(mode, entry, opponent)
+
+    async def enqueue(self, conn, mode, members, elo, channel_id):
+        entry = QueueEntry(members, elo, int(time.time()), channel_id)
+        self.queues[mode].add(entry)
+        await self._persist(conn, entry.members, entry, mode)
+        if self.on_change is not None:
+            await self.on_change(conn, mode, entry.members, entry)
+
+    async def dequeue(self, conn, member_id, mode=None):
+        """Takes the member (and a duo teammate) out of one or both queues."""
+        removed = []
+        for queue_mode, queue in self.queues.items():
+            if mode in (None, queue_mode):
+                entry = queue.remove(member_id)
+                if entry is not None:
+                    removed.extend(entry.members)
+                    if self.on_change is not None:
+                        await self.on_change(conn, queue_mode, entry.members, None)
+        if removed:
+            await self._persist(conn, removed, None)
+        return removed
+
+    def apply_remote(self, message):
+        """Applies an enqueue or dequeue published by another process's on_change."""
+        queue = self.queues[message['mode']]
+        if 'elo' in message:
+            queue.add(QueueEntry(message['members'], message['elo'], message['queued_at'], message['channel_id']))
+        else:
+            for member_id in message['members']:
+                queue.remove(member_id)
+
+    async def _persist(self, conn, members, entry, mode=None):
+        if entry is None:
+            await conn.execute("""
+                UPDATE ranked_players SET time_queued = 0, queue_mode = NULL, queue_partner = NULL, queue_channel_id = NULL
+                WHERE discordid = ANY($1::bigint[])
+            """, list(members))
+            return
+        # Each member records the other as partner, so either can restore the team
+        partners = [next((other for other in entry.members if other != member), None) for member in entry.members]
+        await conn.execute("""
+            UPDATE ranked_players rp
+            SET time_queued = $2, queue_mode = $3, queue_partner = queued.partner, queue_channel_id = $4
+            FROM unnest($1::bigint[], $5::bigint[]) AS queued(discordid, partner)
+            WHERE rp.discordid = queued.discordid
+        """, list(entry.members), entry.queued_at, mode, entry.channel_id, partners)
+
+    async def publish(self, mode, entry, opponent):
+        """Announces the pairing in the channel(s) the two sides queued from."""
+        side = lambda e: " & ".join(f"<@{member}>" for member in e.members) + f" ({round(e.elo)})"
+        submit = "/submit_duel" if mode == 'duel' else "/submit_duo"
+        message = f"**{'1v1' if mode == 'duel' else '2v2'} match found:** {side(entry)} vs {side(opponent)}. Report the result with `{submit}`."
+        for channel_id in {entry.channel_id, opponent.channel_id}:
+            channel = self.bot.get_channel(channel_id) if channel_id else None
+            try:
+                if channel:
+                    await channel.send(message)
+                elif channel_id and self.relay is not None:
+                    await self.relay(channel_id, message)
+            except Exception as e:
+                print(f"Failed to announce pairing in {channel_id}: {e}")
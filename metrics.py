@@ -0,0 +1,270 @@
+#metrics.py
+import asyncio
+import bisect
+import contextvars
+import time
+import weakref
+
+import asyncpg
+from discord.webhook.async_ import AsyncWebhookAdapter
+
+from querytrace import QueryTracer, rows_affected
+
+# Discord fails an interaction that hasn't been responded to (or deferred) within 3 seconds
+INTERACTION_DEADLINE = 3.0
+
+# Bucket upper bounds, Prometheus style (an implicit +Inf bucket follows)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# The invocation being measured in the current task, if any
+current_command = contextvars.ContextVar('current_command', default=None)
+_resetting = contextvars.ContextVar('resetting', default=False)  # set while the pool resets a released connection
+# Task -> command name, readable from outside the task (e.g. by the loop lag watchdog)
+running_commands = weakref.WeakKeyDictionary()
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a running sum, like a Prometheus histogram."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (inf if it's past the last bound)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class CommandInvocation:
+    """What one command invocation spent: wall time, time to first response, DB and REST usage."""
+
+    __slots__ = ('name', 'started', 'first_response', 'db_time', 'db_statements', 'rest_calls')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.first_response = None
+        self.db_time = 0.0
+        self.db_statements = 0
+        self.rest_calls = 0
+
+
+class CommandMetrics:
+    """Per-command histograms for every finished invocation, kept in process."""
+
+    def __init__(self):
+        self.wall_time = {}
+        self.first_response = {}
+        self.db_time = {}
+        self.db_statements = {}
+        self.rest_calls = {}
+        self.missed_deadline = {}  # command -> invocations whose first response came after 3s
+        self.auto_deferred = {}  # command -> invocations deferred by deadline.DeadlineGuard
+
+    def _histogram(self, family, name, bounds):
+        histogram = family.get(name)
+        if histogram is None:
+            histogram = family[name] = Histogram(bounds)
+        return histogram
+
+    def record(self, invocation):
+        wall_time = time.perf_counter() - invocation.started
+        first_response = invocation.first_response if invocation.first_response is not None else wall_time
+        self._histogram(self.wall_time, invocation.name, SECONDS_BUCKETS).observe(wall_time)
+        self._histogram(self.first_response, invocation.name, SECONDS_BUCKETS).observe(first_response)
+        self._histogram(self.db_time, invocation.name, SECONDS_BUCKETS).observe(invocation.db_time)
+        self._histogram(self.db_statements, invocation.name, COUNT_BUCKETS).observe(invocation.db_statements)
+        self._histogram(self.rest_calls, invocation.name, COUNT_BUCKETS).observe(invocation.rest_calls)
+        if first_response > INTERACTION_DEADLINE:
+            self.missed_deadline[invocation.name] = self.missed_deadline.get(invocation.name, 0) + 1
+
+    def record_auto_defer(self, name):
+        self.auto_deferred[name] = self.auto_deferred.get(name, 0) + 1
+
+    def summary_lines(self):
+        """One line per command, slowest p95 first, for the admin command."""
+        lines = []
+        for name, wall in sorted(self.wall_time.items(), key=lambda item: item[1].quantile(0.95), reverse=True):
+            count = wall.count
+            lines.append(
+                f"{name}: n={count} wall p50<={wall.quantile(0.5)}s p95<={wall.quantile(0.95)}s "
+                f"first response p95<={self.first_response[name].quantile(0.95)}s "
+                f"db avg {self.db_time[name].sum / count * 1000:.1f}ms/{self.db_statements[name].sum / count:.1f} stmts "
+                f"rest avg {self.rest_calls[name].sum / count:.1f} "
+                f"missed 3s: {self.missed_deadline.get(name, 0)} "
+                f"auto-deferred: {self.auto_deferred.get(name, 0)}"
+            )
+        return lines
+
+    def render_prometheus(self):
+        """Prometheus text exposition format of every histogram."""
+        families = [
+            ('chivbot_command_seconds', 'Command wall time.', self.wall_time),
+            ('chivbot_command_first_response_seconds', 'Time until the first response or defer.', self.first_response),
+            ('chivbot_command_db_seconds', 'Time spent in database calls per command.', self.db_time),
+            ('chivbot_command_db_statements', 'Database statements per command.', self.db_statements),
+            ('chivbot_command_rest_calls', 'Discord REST calls per command.', self.rest_calls),
+        ]
+        lines = []
+        for metric, help_text, family in families:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, histogram in sorted(family.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{command="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{command="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{command="{name}"}} {histogram.sum}')
+                lines.append(f'{metric}_count{{command="{name}"}} {histogram.count}')
+        lines.append("# HELP chivbot_command_missed_deadline_total Invocations whose first response took over 3s.")
+        lines.append("# TYPE chivbot_command_missed_deadline_total counter")
+        for name, count in sorted(self.missed_deadline.items()):
+            lines.append(f'chivbot_command_missed_deadline_total{{command="{name}"}} {count}')
+        lines.append("# HELP chivbot_command_auto_deferred_total Invocations deferred automatically before the deadline.")
+        lines.append("# TYPE chivbot_command_auto_deferred_total counter")
+        for name, count in sorted(self.auto_deferred.items()):
+            lines.append(f'chivbot_command_auto_deferred_total{{command="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+command_metrics = CommandMetrics()
+query_tracer = QueryTracer()
+
+
+def current_command_name():
+    invocation = current_command.get()
+    return invocation.name if invocation is not None else None
+
+
+async def command_started(ctx):
+    """Global before_invoke hook: starts measuring the invocation in this task."""
+    command = getattr(ctx, 'command', None)
+    name = command.qualified_name if command else "unknown"
+    current_command.set(CommandInvocation(name))
+    running_commands[asyncio.current_task()] = name
+
+
+async def command_finished(ctx):
+    """Global after_invoke hook: records the invocation (runs even if the command raised)."""
+    invocation = current_command.get()
+    if invocation is not None:
+        command_metrics.record(invocation)
+        current_command.set(None)
+    running_commands.pop(asyncio.current_task(), None)
+
+
+class InstrumentedConnection(asyncpg.Connection):
+    """asyncpg connection that charges statement time to the command running in this task
+    and records every statement in query_tracer.
+
+    Used as the pool's connection_class, so every pooled query is covered.
+    """
+
+    async def _timed(self, method, query, count_rows, *args, **kwargs):
+        if _resetting.get():
+            return await method(query, *args, **kwargs)
+        invocation = current_command.get()
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await method(query, *args, **kwargs)
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            if invocation is not None:
+                invocation.db_time += elapsed
+                invocation.db_statements += 1
+            query_tracer.record(query, elapsed, count_rows(result), invocation.name if invocation else None)
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed(super().execute, query, rows_affected, *args, **kwargs)
+
+    async def executemany(self, command, args, **kwargs):
+        return await self._timed(super().executemany, command, lambda result: 0, args, **kwargs)
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed(super().fetch, query, lambda rows: len(rows) if rows else 0, *args, **kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed(super().fetchrow, query, lambda row: 0 if row is None else 1, *args, **kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed(super().fetchval, query, lambda value: 0 if value is None else 1, *args, **kwargs)
+
+    async def reset(self, *, timeout=None):
+        # The pool runs its reset query on release, still in the releasing command's context; it isn't the command's work
+        token = _resetting.set(True)
+        try:
+            return await super().reset(timeout=timeout)
+        finally:
+            _resetting.reset(token)
+
+
+def _count_rest_call(is_interaction_callback=False):
+    invocation = current_command.get()
+    if invocation is None:
+        return
+    invocation.rest_calls += 1
+    if is_interaction_callback and invocation.first_response is None:
+        invocation.first_response = time.perf_counter() - invocation.started
+
+
+def install(bot):
+    """Counts Discord REST calls per command.
+
+    Bot API calls go through bot.http; interaction responses and followups go
+    through the webhook adapter, where the /callback route is the first response
+    (send_message or defer).
+    """
+    http_request = bot.http.request
+
+    async def counted_http_request(route, *args, **kwargs):
+        _count_rest_call()
+        return await http_request(route, *args, **kwargs)
+
+    bot.http.request = counted_http_request
+
+    if not getattr(AsyncWebhookAdapter.request, '_chivbot_counted', False):
+        webhook_request = AsyncWebhookAdapter.request
+
+        async def counted_webhook_request(self, route, *args, **kwargs):
+            _count_rest_call(route.path.endswith('/callback'))
+            return await webhook_request(self, route, *args, **kwargs)
+
+        counted_webhook_request._chivbot_counted = True
+        AsyncWebhookAdapter.request = counted_webhook_request
+
+
+async def start_metrics_server(host, port):
+    """Serves /metrics in Prometheus text format on a local port."""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=command_metrics.render_prometheus(), content_type='text/plain')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
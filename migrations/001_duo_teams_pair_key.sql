@@ -0,0 +1,8 @@
+-- Canonical (min, max) pair key for duo teams.
+-- A team is the same whichever order its players were submitted in, so the
+-- unique index is built over LEAST/GREATEST of the two playfab ids. Rows with
+-- an unregistered (NULL) player are left out; they can never be matched anyway.
+
+CREATE UNIQUE INDEX IF NOT EXISTS duo_teams_pair_key
+    ON public.duo_teams ((LEAST(player1_id, player2_id)), (GREATEST(player1_id, player2_id)))
+    WHERE player1_id IS NOT NULL AND player2_id IS NOT NULL;
@@ -0,0 +1,20 @@
+-- Serve /duo_teams from duo_teams.matches_played instead of aggregating duos.
+-- Backfill the counter for teams whose matches predate it being maintained,
+-- then index the ranking order for active teams that have played.
+
+UPDATE public.duo_teams dt
+SET matches_played = c.match_count
+FROM (
+    SELECT team_id, COUNT(*) AS match_count
+    FROM (
+        SELECT winner_team_id AS team_id FROM public.duos
+        UNION ALL
+        SELECT loser_team_id AS team_id FROM public.duos
+    ) AS d
+    GROUP BY team_id
+) AS c
+WHERE dt.id = c.team_id AND dt.matches_played < c.match_count;
+
+CREATE INDEX IF NOT EXISTS duo_teams_ranking
+    ON public.duo_teams (elo_rating DESC)
+    WHERE retired = FALSE AND matches_played > 0;
@@ -0,0 +1,44 @@
+-- Precompute each player's most common alias so lookups don't have to parse
+-- players.alias_history (a JSON object of alias -> times seen) on every call.
+
+ALTER TABLE public.players ADD COLUMN IF NOT EXISTS most_common_alias character varying(255);
+
+-- alias_history is written by chivstats.xyz. Malformed JSON, a non-object or non-numeric counts yield NULL
+-- instead of raising, since the trigger below runs inside the website's own writes to players.
+CREATE OR REPLACE FUNCTION public.most_common_alias_of(alias_history text) RETURNS character varying
+    LANGUAGE plpgsql IMMUTABLE
+    AS $$
+DECLARE
+    parsed jsonb;
+BEGIN
+    parsed := alias_history::jsonb;
+    IF jsonb_typeof(parsed) IS DISTINCT FROM 'object' THEN
+        RETURN NULL;
+    END IF;
+    RETURN (
+        SELECT LEFT(key, 255) FROM jsonb_each_text(parsed)
+        WHERE value ~ '^\s*-?[0-9]+(\.[0-9]+)?\s*$'
+        ORDER BY value::numeric DESC
+        LIMIT 1
+    );
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$;
+
+UPDATE public.players
+SET most_common_alias = public.most_common_alias_of(alias_history)
+WHERE alias_history IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION public.players_most_common_alias() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    NEW.most_common_alias := public.most_common_alias_of(NEW.alias_history);
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS players_most_common_alias ON public.players;
+CREATE TRIGGER players_most_common_alias BEFORE INSERT OR UPDATE OF alias_history ON public.players
+    FOR EACH ROW EXECUTE FUNCTION public.players_most_common_alias();
@@ -0,0 +1,14 @@
+-- Structured audit trail; rows are written in batches by audit.AuditLog.
+CREATE TABLE IF NOT EXISTS public.audit_log (
+    id bigserial PRIMARY KEY,
+    created_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    command character varying(64) NOT NULL,
+    discord_id bigint,
+    playfabid character varying,
+    guild_id bigint,
+    details jsonb,
+    message text NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS audit_log_created_at ON public.audit_log (created_at);
+CREATE INDEX IF NOT EXISTS audit_log_discord_id ON public.audit_log (discord_id, created_at);
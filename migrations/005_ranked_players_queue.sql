@@ -0,0 +1,10 @@
+-- Matchmaking queue state kept next to time_queued, so matchmaking.Matchmaker can restore it after a restart.
+ALTER TABLE public.ranked_players ADD COLUMN IF NOT EXISTS queue_mode character varying(8);
+ALTER TABLE public.ranked_players ADD COLUMN IF NOT EXISTS queue_partner bigint;
+ALTER TABLE public.ranked_players ADD COLUMN IF NOT EXISTS queue_channel_id bigint;
+
+-- time_queued was never written before this, and the dump carries leftover values (12, 120, 44) that would
+-- otherwise restore as players queued since 1970. Only rows with a queue_mode were queued by Matchmaker.
+UPDATE public.ranked_players SET time_queued = 0 WHERE queue_mode IS NULL AND time_queued <> 0;
+
+CREATE INDEX IF NOT EXISTS ranked_players_queued ON public.ranked_players (time_queued) WHERE time_queued > 0;
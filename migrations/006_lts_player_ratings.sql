@@ -0,0 +1,51 @@
+-- Normalized LTS membership and per-player ratings (see lts_rating.py).
+-- lts_teams.roster stays the source of truth; lts_team_members is kept in step
+-- with it by a trigger, so nothing has to decode the JSON to find a player's team.
+
+CREATE TABLE IF NOT EXISTS public.lts_team_members (
+    team_id integer NOT NULL REFERENCES public.lts_teams (id) ON DELETE CASCADE,
+    discordid bigint NOT NULL,
+    PRIMARY KEY (team_id, discordid)
+);
+
+CREATE INDEX IF NOT EXISTS lts_team_members_discordid ON public.lts_team_members (discordid);
+
+INSERT INTO public.lts_team_members (team_id, discordid)
+SELECT t.id, member::bigint
+FROM public.lts_teams t, jsonb_array_elements_text(t.roster) AS member
+ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION public.lts_teams_sync_members() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    DELETE FROM public.lts_team_members WHERE team_id = NEW.id;
+    INSERT INTO public.lts_team_members (team_id, discordid)
+    SELECT NEW.id, member::bigint FROM jsonb_array_elements_text(NEW.roster) AS member
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS lts_teams_sync_members ON public.lts_teams;
+CREATE TRIGGER lts_teams_sync_members AFTER INSERT OR UPDATE OF roster ON public.lts_teams
+    FOR EACH ROW EXECUTE FUNCTION public.lts_teams_sync_members();
+
+-- Who played each match, and their rating before and after it was settled
+CREATE TABLE IF NOT EXISTS public.lts_match_participants (
+    match_id integer NOT NULL REFERENCES public.lts_matches (id) ON DELETE CASCADE,
+    team_id integer NOT NULL,
+    discordid bigint NOT NULL,
+    rating_before double precision,
+    rating_after double precision,
+    PRIMARY KEY (match_id, discordid)
+);
+
+CREATE TABLE IF NOT EXISTS public.lts_player_ratings (
+    discordid bigint PRIMARY KEY,
+    rating double precision NOT NULL DEFAULT 1500,
+    matches integer NOT NULL DEFAULT 0,
+    wins integer NOT NULL DEFAULT 0,
+    losses integer NOT NULL DEFAULT 0,
+    last_match timestamp with time zone
+);
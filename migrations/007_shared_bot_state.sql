@@ -0,0 +1,25 @@
+-- State shared by bot processes that each own a range of shards, see shardstate.SharedState.
+-- Each process writes the ready-role holders of its own guilds; every process mirrors the whole table.
+CREATE TABLE IF NOT EXISTS public.ready_pool_members (
+    role_name character varying(32) NOT NULL,
+    discordid bigint NOT NULL,
+    guild_id bigint NOT NULL,
+    PRIMARY KEY (role_name, discordid, guild_id)
+);
+
+CREATE INDEX IF NOT EXISTS ready_pool_members_guild ON public.ready_pool_members (guild_id);
+
+-- The leaderboard message the bot keeps editing in each guild's #ranked-leaderboards
+CREATE TABLE IF NOT EXISTS public.leaderboard_messages (
+    guild_id bigint PRIMARY KEY,
+    channel_id bigint NOT NULL,
+    message_id bigint NOT NULL,
+    updated_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Broadcasts too large for a NOTIFY payload (8000 bytes) are passed by id
+CREATE TABLE IF NOT EXISTS public.shard_broadcasts (
+    id bigserial PRIMARY KEY,
+    created_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    payload jsonb NOT NULL
+);
@@ -0,0 +1,80 @@
+-- NOTIFY chivbot_changes when ranked_players, duo_teams or lts_teams change, so the bot can drop what it
+-- cached from them whoever wrote (the bot, chivstats.xyz or admin SQL). One notification per statement:
+-- {"table": ..., "op": ..., "keys": [{key columns of each changed row}]}, or "keys": null when the list
+-- would not fit in a NOTIFY payload and the whole table should be treated as changed.
+-- Trigger arguments: the key columns to send, then optionally columns whose changes are ignored.
+CREATE OR REPLACE FUNCTION public.chivbot_notify_change() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    key_columns text[] := string_to_array(TG_ARGV[0], ',');
+    ignored_columns text[] := COALESCE(string_to_array(TG_ARGV[1], ','), '{}');
+    changed jsonb;
+    payload text;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT jsonb_agg((SELECT jsonb_object_agg(k, to_jsonb(n) -> k) FROM unnest(key_columns) AS k))
+        INTO changed FROM new_rows n;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT jsonb_agg((SELECT jsonb_object_agg(k, to_jsonb(o) -> k) FROM unnest(key_columns) AS k))
+        INTO changed FROM old_rows o;
+    ELSE
+        -- Old and new keys of rows where anything but the ignored columns changed
+        SELECT jsonb_agg(DISTINCT keys) INTO changed FROM (
+            SELECT (SELECT jsonb_object_agg(k, to_jsonb(o) -> k) FROM unnest(key_columns) AS k) AS old_keys,
+                   (SELECT jsonb_object_agg(k, to_jsonb(n) -> k) FROM unnest(key_columns) AS k) AS new_keys
+            FROM old_rows o JOIN new_rows n ON n.id = o.id
+            WHERE to_jsonb(o) - ignored_columns IS DISTINCT FROM to_jsonb(n) - ignored_columns
+        ) changed_rows, LATERAL (VALUES (old_keys), (new_keys)) AS both_keys(keys);
+    END IF;
+
+    IF changed IS NULL THEN
+        RETURN NULL;
+    END IF;
+    payload := jsonb_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'keys', changed)::text;
+    IF octet_length(payload) > 7900 THEN
+        payload := jsonb_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'keys', NULL)::text;
+    END IF;
+    PERFORM pg_notify('chivbot_changes', payload);
+    RETURN NULL;
+END;
+$$;
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS ranked_players_notify_insert ON public.ranked_players;
+CREATE TRIGGER ranked_players_notify_insert AFTER INSERT ON public.ranked_players
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+    EXECUTE FUNCTION public.chivbot_notify_change('playfabid,discordid');
+DROP TRIGGER IF EXISTS ranked_players_notify_update ON public.ranked_players;
+CREATE TRIGGER ranked_players_notify_update AFTER UPDATE ON public.ranked_players
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+    EXECUTE FUNCTION public.chivbot_notify_change('playfabid,discordid', 'coins,time_queued,queue_mode,queue_partner,queue_channel_id');
+DROP TRIGGER IF EXISTS ranked_players_notify_delete ON public.ranked_players;
+CREATE TRIGGER ranked_players_notify_delete AFTER DELETE ON public.ranked_players
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+    EXECUTE FUNCTION public.chivbot_notify_change('playfabid,discordid');
+
+DROP TRIGGER IF EXISTS duo_teams_notify_insert ON public.duo_teams;
+CREATE TRIGGER duo_teams_notify_insert AFTER INSERT ON public.duo_teams
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+    EXECUTE FUNCTION public.chivbot_notify_change('id,player1_id,player2_id');
+DROP TRIGGER IF EXISTS duo_teams_notify_update ON public.duo_teams;
+CREATE TRIGGER duo_teams_notify_update AFTER UPDATE ON public.duo_teams
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+    EXECUTE FUNCTION public.chivbot_notify_change('id,player1_id,player2_id', 'last_activity');
+DROP TRIGGER IF EXISTS duo_teams_notify_delete ON public.duo_teams;
+CREATE TRIGGER duo_teams_notify_delete AFTER DELETE ON public.duo_teams
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+    EXECUTE FUNCTION public.chivbot_notify_change('id,player1_id,player2_id');
+
+DROP TRIGGER IF EXISTS lts_teams_notify_insert ON public.lts_teams;
+CREATE TRIGGER lts_teams_notify_insert AFTER INSERT ON public.lts_teams
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+    EXECUTE FUNCTION public.chivbot_notify_change('id');
+DROP TRIGGER IF EXISTS lts_teams_notify_update ON public.lts_teams;
+CREATE TRIGGER lts_teams_notify_update AFTER UPDATE ON public.lts_teams
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+    EXECUTE FUNCTION public.chivbot_notify_change('id', 'last_activity');
+DROP TRIGGER IF EXISTS lts_teams_notify_delete ON public.lts_teams;
+CREATE TRIGGER lts_teams_notify_delete AFTER DELETE ON public.lts_teams
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+    EXECUTE FUNCTION public.chivbot_notify_change('id');
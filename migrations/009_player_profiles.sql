@@ -0,0 +1,9 @@
+-- profiles.ProfileStore counts each player's duels, and /odds counts head-to-head duels, by PlayFab id
+CREATE INDEX IF NOT EXISTS duels_winner_playfabid ON public.duels (winner_playfabid);
+CREATE INDEX IF NOT EXISTS duels_loser_playfabid ON public.duels (loser_playfabid);
+
+-- Profiles show coins and wealth rank, so coin moves are no longer ignored by the change notifications
+DROP TRIGGER IF EXISTS ranked_players_notify_update ON public.ranked_players;
+CREATE TRIGGER ranked_players_notify_update AFTER UPDATE ON public.ranked_players
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+    EXECUTE FUNCTION public.chivbot_notify_change('playfabid,discordid', 'time_queued,queue_mode,queue_partner,queue_channel_id');
@@ -0,0 +1,7 @@
+-- Pending LTS submissions nobody answers expire (see LTSCog.expire_pending_matches), so their buttons
+-- stop being restored and tools/export_matches.py stops waiting for them.
+-- Pending means: confirmed = FALSE AND confirming_discordid IS NULL AND expired = FALSE.
+ALTER TABLE public.lts_matches ADD COLUMN IF NOT EXISTS expired boolean DEFAULT false NOT NULL;
+
+CREATE INDEX IF NOT EXISTS lts_matches_pending ON public.lts_matches (id)
+    WHERE confirmed = FALSE AND confirming_discordid IS NULL AND expired = FALSE;
@@ -0,0 +1,48 @@
+-- Databases that already applied 003 still have the strict alias trigger, where one malformed players.alias_history
+-- fails chivstats.xyz's own write. Same definitions as the current 003.
+CREATE OR REPLACE FUNCTION public.most_common_alias_of(alias_history text) RETURNS character varying
+    LANGUAGE plpgsql IMMUTABLE
+    AS $$
+DECLARE
+    parsed jsonb;
+BEGIN
+    parsed := alias_history::jsonb;
+    IF jsonb_typeof(parsed) IS DISTINCT FROM 'object' THEN
+        RETURN NULL;
+    END IF;
+    RETURN (
+        SELECT LEFT(key, 255) FROM jsonb_each_text(parsed)
+        WHERE value ~ '^\s*-?[0-9]+(\.[0-9]+)?\s*$'
+        ORDER BY value::numeric DESC
+        LIMIT 1
+    );
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.players_most_common_alias() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    NEW.most_common_alias := public.most_common_alias_of(NEW.alias_history);
+    RETURN NEW;
+END;
+$$;
+
+-- NOTIFY chivbot_changes (see 008) when a player's most_common_alias changes; the bot caches it in
+-- player_name_cache and the profile store. players is rewritten constantly by chivstats.xyz, so this is a row
+-- trigger filtered by WHEN, so updates that leave the alias alone skip the function call.
+CREATE OR REPLACE FUNCTION public.chivbot_notify_alias() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('chivbot_changes', jsonb_build_object(
+        'table', TG_TABLE_NAME, 'op', TG_OP, 'keys', jsonb_build_array(jsonb_build_object('playfabid', NEW.playfabid)))::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS players_notify_alias ON public.players;
+CREATE TRIGGER players_notify_alias AFTER UPDATE OF alias_history ON public.players
+    FOR EACH ROW WHEN (OLD.most_common_alias IS DISTINCT FROM NEW.most_common_alias)
+    EXECUTE FUNCTION public.chivbot_notify_alias();
@@ -0,0 +1,80 @@
+#network.py
+import discord
+
+RANKED_CHANNEL = "chivstats-ranked"
+
+
+class NetworkMembership:
+    """Who can see #chivstats-ranked in each guild, maintained from gateway events.
+
+    For each guild we keep the set of members that can read the channel, and
+    across the network a refcount of how many of those guilds each member is
+    visible in. The unique member count is then len(refcounts), so
+    /chivstats_network no longer works out channel permissions for every member
+    of every guild. A single member's visibility is rechecked when they join,
+    leave or change roles. A whole guild is recounted only when its channel or
+    roles change.
+    """
+
+    def __init__(self, channel_name=RANKED_CHANNEL):
+        self.channel_name = channel_name
+        self.visible = {}  # guild id -> set of member ids that can read the channel
+        self.refcounts = {}  # member id -> number of guilds they can see the channel in
+
+    @property
+    def unique_members(self):
+        return len(self.refcounts)
+
+    def channel(self, guild):
+        return discord.utils.get(guild.text_channels, name=self.channel_name)
+
+    def guild_count(self, guild_id):
+        """Members that can see the channel in guild_id, or None if it has no such channel."""
+        members = self.visible.get(guild_id)
+        return len(members) if members is not None else None
+
+    def seed(self, guilds):
+        self.visible.clear()
+        self.refcounts.clear()
+        for guild in guilds:
+            self.recount_guild(guild)
+
+    def recount_guild(self, guild):
+        self.drop_guild(guild.id)
+        channel = self.channel(guild)
+        if channel is None:
+            return
+        members = self.visible[guild.id] = set()
+        for member in channel.members:
+            members.add(member.id)
+            self.refcounts[member.id] = self.refcounts.get(member.id, 0) + 1
+
+    def drop_guild(self, guild_id):
+        for member_id in self.visible.pop(guild_id, ()):
+            self._release(member_id)
+
+    def recheck_member(self, member):
+        members = self.visible.get(member.guild.id)
+        if members is None:
+            return
+        channel = self.channel(member.guild)
+        can_see = channel is not None and channel.permissions_for(member).read_messages
+        if can_see and member.id not in members:
+            members.add(member.id)
+            self.refcounts[member.id] = self.refcounts.get(member.id, 0) + 1
+        elif not can_see and member.id in members:
+            members.discard(member.id)
+            self._release(member.id)
+
+    def member_removed(self, member):
+        members = self.visible.get(member.guild.id)
+        if members is not None and member.id in members:
+            members.discard(member.id)
+            self._release(member.id)
+
+    def _release(self, member_id):
+        remaining = self.refcounts[member_id] - 1
+        if remaining:
+            self.refcounts[member_id] = remaining
+        else:
+            del self.refcounts[member_id]
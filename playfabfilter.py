@@ -0,0 +1,109 @@
+#playfabfilter.py
+import asyncio
+import hashlib
+import math
+import time
+
+
+class PlayFabIdFilter:
+    """Bloom filter over players.playfabid, used to reject mistyped ids without a query.
+
+    A miss means the id was not in players as of the last refresh, so check
+    refreshes and looks again before rejecting, unless the last refresh is
+    under `miss_refresh_age` seconds old. That keeps a stream of typos from
+    turning into a stream of queries. A hit may be a false
+    positive (about `error_rate` of them), so the database still has the final
+    say. A refresh adds rows above the highest id seen, minus `rescan_ids`.
+    players.id comes from a sequence shared with chivstats.xyz's concurrent
+    inserts, so a row can commit after a higher id was already loaded. The
+    trailing rescan picks those rows up. The bit array is rebuilt at twice the
+    size once it holds more ids than it was sized for. Until the first load
+    finishes, every id counts as a possible hit.
+    """
+
+    def __init__(self, error_rate=0.001, refresh_interval=60, min_capacity=100000, rescan_ids=1000, miss_refresh_age=5):
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.miss_refresh_age = miss_refresh_age
+        self.min_capacity = min_capacity
+        self.rescan_ids = rescan_ids
+        self.loaded = False
+        self.count = 0
+        self.last_id = 0
+        self.refreshed_at = None
+        self._size(min_capacity)
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+
+    def _size(self, capacity):
+        self.capacity = capacity
+        self.num_bits = math.ceil(-capacity * math.log(self.error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, playfabid):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(playfabid.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, playfabid):
+        for position in self._positions(playfabid):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, playfabid):
+        if not self.loaded:
+            return True
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(playfabid))
+
+    async def check(self, conn, playfabid):
+        """Whether playfabid may exist; a miss is confirmed by a recent enough refresh before it is believed."""
+        if playfabid in self:
+            return True
+        await self.refresh(conn, max_age=self.miss_refresh_age)
+        return playfabid in self
+
+    async def refresh(self, conn, max_age=None):
+        """Adds new players; with max_age, skips it if the last refresh is younger than that many seconds."""
+        async with self._lock:
+            # Checked under the lock, so misses that queued behind one refresh don't each run another
+            if max_age is not None and self.refreshed_at is not None and time.monotonic() - self.refreshed_at < max_age:
+                return
+            since = max(0, self.last_id - self.rescan_ids) if self.loaded else 0
+            rows = await conn.fetch("SELECT id, playfabid FROM players WHERE id > $1 AND playfabid IS NOT NULL", since)
+            new_rows = sum(1 for row in rows if row['id'] > self.last_id)
+            if self.count + new_rows > self.capacity:
+                # Full: resize for twice what is there now and reload everything
+                total = await conn.fetchval("SELECT COUNT(*) FROM players WHERE playfabid IS NOT NULL")
+                self._size(max(self.min_capacity, total * 2))
+                self.count = 0
+                self.last_id = 0
+                rows = await conn.fetch("SELECT id, playfabid FROM players WHERE playfabid IS NOT NULL")
+                new_rows = len(rows)
+            # Rescanned rows are set again, which is harmless; count only tracks rows above the old mark
+            for row in rows:
+                self.add(row['playfabid'])
+                if row['id'] > self.last_id:
+                    self.last_id = row['id']
+            self.count += new_rows
+            if not self.loaded:
+                print(f"PlayFab id filter: {self.count} ids in {len(self.bits) // 1024} KiB")
+            self.loaded = True
+            self.refreshed_at = time.monotonic()
+
+    def start(self, create_db_connection, close_db_connection):
+        """Loads the filter and keeps adding new players in the background, once per process."""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(create_db_connection, close_db_connection))
+
+    async def _refresh_loop(self, create_db_connection, close_db_connection):
+        while True:
+            conn = await create_db_connection()
+            try:
+                await self.refresh(conn)
+            except Exception as e:
+                print(f"Error refreshing PlayFab id filter: {e}")
+            finally:
+                await close_db_connection(conn)
+            await asyncio.sleep(self.refresh_interval)
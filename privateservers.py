@@ -3,6 +3,8 @@ import json
 import discord
 from discord.ext import commands
 
+from deadline import defer_ephemeral
+
 class PrivateServers(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -36,6 +38,7 @@ class PrivateServers(commands.Cog):
         print("Private Server List Cog loaded.")
 
     @commands.slash_command(name="bocoboco", description="Test command to verify slash commands are working.")
+    @defer_ephemeral
     async def bocoboco(self, interaction: discord.Interaction):
         # Sending an ephemeral message back to the user
         await interaction.response.send_message("Slash command test successful! This is an ephemeral message.", ephemeral=True)
@@ -0,0 +1,199 @@
+#profiles.py
+import bisect
+import itertools
+import sys
+
+# One row per ranked player: the ranked_players columns the profile commands show, the alias from
+# players, and how many duels they have played. Ranks are worked out in memory, see ProfileStore.
+PROFILE_QUERY = """
+    SELECT rp.discordid, rp.playfabid, rp.discord_username, rp.common_name, rp.gamename, rp.retired,
+           rp.elo_duelsx, rp.kills, rp.deaths, rp.matches, rp.coins, p.most_common_alias,
+           (SELECT COUNT(*) FROM duels d WHERE d.winner_playfabid = rp.playfabid) +
+           (SELECT COUNT(*) FROM duels d WHERE d.loser_playfabid = rp.playfabid) AS duels
+    FROM ranked_players rp
+    LEFT JOIN players p ON p.playfabid = rp.playfabid
+"""
+
+RANKED_COLUMNS = ('elo', 'kdr', 'matches', 'coins')
+MEMORY_SAMPLE = 200
+
+
+def _owned_size(value, seen):
+    # None, bools and small ints are shared singletons; count everything else once
+    if value is None or isinstance(value, bool) or (type(value) is int and -5 <= value <= 256) or id(value) in seen:
+        return 0
+    seen.add(id(value))
+    return sys.getsizeof(value)
+
+
+class PlayerProfile:
+    __slots__ = ('discordid', 'playfabid', 'discord_username', 'common_name', 'gamename', 'retired',
+                 'elo', 'kills', 'deaths', 'matches', 'coins', 'alias', 'duels')
+
+    def __init__(self, row):
+        self.discordid = row['discordid']
+        self.playfabid = row['playfabid']
+        self.discord_username = row['discord_username']
+        self.common_name = row['common_name']
+        self.gamename = row['gamename']
+        self.retired = row['retired']
+        self.elo = row['elo_duelsx']
+        self.kills = row['kills'] or 0
+        self.deaths = row['deaths'] or 0
+        self.matches = row['matches']
+        self.coins = row['coins']
+        self.alias = row['most_common_alias']
+        self.duels = row['duels']
+
+    @property
+    def display_name(self):
+        return self.gamename or self.common_name
+
+    @property
+    def kdr(self):
+        return self.kills / self.deaths if self.deaths > 0 else self.kills
+
+    def rank_value(self, column):
+        # Matches the old COUNT(*) queries: NULLs are never ranked, and KDR only counts players with deaths
+        if column == 'kdr':
+            return self.kills / self.deaths if self.deaths > 0 else None
+        return getattr(self, column)
+
+
+class ProfileStore:
+    """Every ranked player's profile, materialized in memory.
+
+    /rank, /stats, /status and /odds used to rebuild a profile with a query per
+    figure, including four COUNT(*) scans for the ranks, and most commands
+    looked up playfab ids and retired flags one query at a time. The store
+    loads every profile once, indexed by discord id and by playfab id. Each
+    ranked column is kept as a sorted list, so a rank is a bisection: players
+    with a higher value, plus one. Settlement, registration and the commands
+    that change a player refresh just the rows they touched. Writes
+    from elsewhere arrive as ranked_players change notifications (see
+    on_table_change in bot.py).
+    """
+
+    def __init__(self):
+        self.by_discordid = {}
+        self.by_playfabid = {}
+        self.sorted = {column: [] for column in RANKED_COLUMNS}
+        self.loaded = False
+
+    def get(self, discordid):
+        return self.by_discordid.get(discordid)
+
+    def get_by_playfabid(self, playfabid):
+        return self.by_playfabid.get(playfabid)
+
+    def rank(self, column, value):
+        """1 + the number of ranked players whose column is above value."""
+        values = self.sorted[column]
+        return len(values) - bisect.bisect_right(values, value) + 1
+
+    def ranks(self, profile):
+        """{column: rank} for profile; None where it has no value for the column."""
+        # A player without deaths isn't in the KDR list but is still placed by their kills, as before
+        values = {column: profile.kdr if column == 'kdr' else getattr(profile, column) for column in RANKED_COLUMNS}
+        return {column: self.rank(column, value) if value is not None else None for column, value in values.items()}
+
+    async def load(self, conn):
+        rows = await conn.fetch(PROFILE_QUERY)
+        self.by_discordid.clear()
+        self.by_playfabid.clear()
+        for values in self.sorted.values():
+            values.clear()
+        profiles = [PlayerProfile(row) for row in rows]
+        for profile in profiles:
+            self._index(profile)
+        for column, values in self.sorted.items():
+            values.extend(value for profile in profiles if (value := profile.rank_value(column)) is not None)
+            values.sort()
+        self.loaded = True
+        print(f"Loaded {len(profiles)} player profiles ({self.memory_bytes() / 1024 / 1024:.1f} MiB).")
+
+    async def refresh(self, conn, discordids=(), playfabids=()):
+        """Reloads the given players from the database; players no longer in ranked_players are dropped."""
+        discordids = [discordid for discordid in discordids if discordid is not None]
+        playfabids = [playfabid for playfabid in playfabids if playfabid is not None]
+        if not discordids and not playfabids:
+            return
+        rows = await conn.fetch(PROFILE_QUERY + " WHERE rp.discordid = ANY($1::bigint[]) OR rp.playfabid = ANY($2::text[])",
+                                discordids, playfabids)
+        for profile in [self.by_discordid.get(discordid) for discordid in discordids] + \
+                       [self.by_playfabid.get(playfabid) for playfabid in playfabids]:
+            if profile is not None:
+                self._remove(profile)
+        for row in rows:
+            self._remove(self.by_discordid.get(row['discordid']))
+            self._remove(self.by_playfabid.get(row['playfabid']))
+            profile = PlayerProfile(row)
+            self._index(profile)
+            for column, values in self.sorted.items():
+                value = profile.rank_value(column)
+                if value is not None:
+                    bisect.insort(values, value)
+
+    def memory_bytes(self):
+        """Estimated size of the store, from up to MEMORY_SAMPLE records and sorted values.
+
+        Takes a few milliseconds, so load and /admin_metrics can use it. It lands
+        within a few percent of measure_memory_bytes, which walks everything:
+        about 690 bytes a player, roughly 65 MiB at 100k players.
+        """
+        size = sys.getsizeof(self.by_discordid) + sys.getsizeof(self.by_playfabid)
+        records = self.by_playfabid if len(self.by_playfabid) >= len(self.by_discordid) else self.by_discordid
+        sample = list(itertools.islice(records.values(), MEMORY_SAMPLE))
+        if sample:
+            seen = set()
+            per_record = sum(_owned_size(profile, seen) + sum(_owned_size(getattr(profile, name), seen) for name in PlayerProfile.__slots__)
+                             for profile in sample) / len(sample)
+            size += per_record * len(records)
+        for column, values in self.sorted.items():
+            size += sys.getsizeof(values)
+            # Only KDR values are computed; the other lists hold the records' own value objects
+            if column == 'kdr' and values:
+                spaced = values[::max(1, len(values) // MEMORY_SAMPLE)]
+                seen = set()
+                size += sum(_owned_size(value, seen) for value in spaced) / len(spaced) * len(values)
+        return int(size)
+
+    def measure_memory_bytes(self):
+        """Size of the store, walking every record and sorted value.
+
+        Blocks for over a second at 100k players, so it is for offline
+        measurement, not for the running bot.
+        """
+        seen = set()
+        size = sys.getsizeof(self.by_discordid) + sys.getsizeof(self.by_playfabid)
+        for profile in list(self.by_discordid.values()) + list(self.by_playfabid.values()):
+            if id(profile) not in seen:
+                size += _owned_size(profile, seen) + sum(_owned_size(getattr(profile, name), seen) for name in PlayerProfile.__slots__)
+        for values in self.sorted.values():
+            size += sys.getsizeof(values) + sum(_owned_size(value, seen) for value in values)
+        return size
+
+    def _index(self, profile):
+        if profile.discordid is not None:
+            self.by_discordid[profile.discordid] = profile
+        if profile.playfabid is not None:
+            self.by_playfabid[profile.playfabid] = profile
+
+    def _remove(self, profile):
+        if profile is None:
+            return
+        indexed = False
+        if self.by_discordid.get(profile.discordid) is profile:
+            del self.by_discordid[profile.discordid]
+            indexed = True
+        if self.by_playfabid.get(profile.playfabid) is profile:
+            del self.by_playfabid[profile.playfabid]
+            indexed = True
+        if not indexed:
+            return  # already removed
+        for column, values in self.sorted.items():
+            value = profile.rank_value(column)
+            if value is not None:
+                index = bisect.bisect_left(values, value)
+                if index < len(values) and values[index] == value:
+                    del values[index]
@@ -0,0 +1,101 @@
+#pubsub.py
+import asyncio
+import inspect
+import json
+import os
+import uuid
+
+
+class PubSub:
+    """Postgres LISTEN/NOTIFY on a dedicated connection.
+
+    LISTEN only works on a connection that stays open, so this one lives outside
+    the pool. If it drops, the loop reconnects with backoff, listens again and
+    runs the resync callbacks. Anything that missed notifications while
+    disconnected can reload its state there.
+
+    Payloads are JSON objects tagged with this process's origin id. By default a
+    handler skips messages its own process published, since the publisher
+    already applied the change locally.
+    """
+
+    def __init__(self, connect, min_backoff=1, max_backoff=30):
+        self.connect = connect
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.handlers = {}  # channel -> [(handler, include_own)]
+        self.resync_callbacks = []
+        self.connected = asyncio.Event()
+        self.received = 0
+        self.reconnects = 0
+        self._conn = None
+        self._task = None
+
+    def subscribe(self, channel, handler, include_own=False):
+        """handler(payload) is called for each notification on channel; it may be a coroutine function."""
+        self.handlers.setdefault(channel, []).append((handler, include_own))
+
+    def on_resync(self, callback):
+        """callback() is awaited after every (re)connect, once listening has resumed."""
+        self.resync_callbacks.append(callback)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def publish(self, conn, channel, payload):
+        """Sends payload on channel through conn; inside a transaction it is delivered on commit."""
+        await conn.execute("SELECT pg_notify($1, $2)", channel, json.dumps({**payload, 'origin': self.origin}))
+
+    async def _run(self):
+        backoff = self.min_backoff
+        while True:
+            try:
+                self._conn = await self.connect()
+                closed = asyncio.Event()
+                self._conn.add_termination_listener(lambda conn: closed.set())
+                for channel in self.handlers:
+                    await self._conn.add_listener(channel, self._dispatch)
+                self.connected.set()
+                backoff = self.min_backoff
+                for callback in self.resync_callbacks:
+                    try:
+                        await callback()
+                    except Exception as e:
+                        print(f"PubSub resync failed in {getattr(callback, '__qualname__', callback)}: {e}")
+                await closed.wait()
+                print("PubSub connection lost; reconnecting.")
+                self.reconnects += 1
+            except asyncio.CancelledError:
+                if self._conn is not None and not self._conn.is_closed():
+                    await self._conn.close()
+                raise
+            except Exception as e:
+                print(f"PubSub connection failed: {e}; retrying in {backoff}s.")
+            self.connected.clear()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _dispatch(self, conn, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            print(f"PubSub: ignoring malformed payload on {channel}: {payload[:200]}")
+            return
+        self.received += 1
+        own = message.get('origin') == self.origin
+        for handler, include_own in self.handlers.get(channel, ()):
+            if own and not include_own:
+                continue
+            try:
+                result = handler(message)
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result).add_done_callback(self._report)
+            except Exception as e:
+                print(f"PubSub handler for {channel} failed: {e}")
+
+    @staticmethod
+    def _report(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"PubSub handler failed: {future.exception()}")
@@ -0,0 +1,143 @@
+#querytrace.py
+import collections
+import json
+import re
+import time
+
+import asyncpg
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w$.])\d+(?:\.\d+)?\b')
+_NORMALIZED_CACHE_SIZE = 2048
+
+# Label used for time spent waiting on the pool rather than running a statement
+ACQUIRE = "<pool acquire>"
+
+
+def normalize_query(query):
+    """Collapses whitespace and replaces inline literals with ? so equivalent statements group together."""
+    query = _WHITESPACE.sub(' ', query).strip()
+    query = _STRING_LITERAL.sub('?', query)
+    return _NUMBER_LITERAL.sub('?', query)
+
+
+class StatementStats:
+    __slots__ = ('calls', 'total_time', 'rows', 'samples', 'commands')
+
+    def __init__(self, sample_size):
+        self.calls = 0
+        self.total_time = 0.0
+        self.rows = 0
+        self.samples = collections.deque(maxlen=sample_size)  # recent durations, for percentiles
+        self.commands = collections.Counter()  # issuing command -> calls
+
+    def percentiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0, 0.0, 0.0
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        return pick(0.50), pick(0.95), pick(0.99)
+
+
+class QueryTracer:
+    """Groups every pooled statement by normalized text and records how it behaves.
+
+    Per statement: call count, p50/p95/p99 over recent calls, rows returned and
+    which commands issued it. Anything slower than the threshold is logged as it
+    happens, so N+1 patterns and slow paths show up with the command responsible.
+    """
+
+    def __init__(self, slow_threshold=0.25, sample_size=512):
+        self.slow_threshold = slow_threshold
+        self.sample_size = sample_size
+        self.statements = {}
+        self._normalized = {}
+
+    def _normalize(self, query):
+        normalized = self._normalized.get(query)
+        if normalized is None:
+            normalized = normalize_query(query)
+            if len(self._normalized) < _NORMALIZED_CACHE_SIZE:
+                self._normalized[query] = normalized
+        return normalized
+
+    def record(self, query, elapsed, rows, command):
+        normalized = self._normalize(query) if query is not ACQUIRE else ACQUIRE
+        stats = self.statements.get(normalized)
+        if stats is None:
+            stats = self.statements[normalized] = StatementStats(self.sample_size)
+        stats.calls += 1
+        stats.total_time += elapsed
+        stats.rows += rows
+        stats.samples.append(elapsed)
+        stats.commands[command or "background"] += 1
+
+        if elapsed >= self.slow_threshold:
+            print(f"Slow {'pool acquire' if query is ACQUIRE else 'query'} ({elapsed * 1000:.0f}ms, {command or 'background'}): {normalized}")
+
+    def report(self, limit=20):
+        """Statements ordered by total time spent, as a list of dicts."""
+        rows = []
+        for statement, stats in sorted(self.statements.items(), key=lambda item: item[1].total_time, reverse=True)[:limit]:
+            p50, p95, p99 = stats.percentiles()
+            rows.append({
+                'statement': statement,
+                'calls': stats.calls,
+                'total_ms': round(stats.total_time * 1000, 1),
+                'p50_ms': round(p50 * 1000, 2),
+                'p95_ms': round(p95 * 1000, 2),
+                'p99_ms': round(p99 * 1000, 2),
+                'rows': stats.rows,
+                'rows_per_call': round(stats.rows / stats.calls, 2),
+                'commands': dict(stats.commands.most_common()),
+            })
+        return rows
+
+    def report_text(self, limit=20):
+        lines = []
+        for row in self.report(limit):
+            commands = ", ".join(f"{name}={count}" for name, count in row['commands'].items())
+            lines.append(
+                f"{row['calls']} calls, {row['total_ms']}ms total, p50/p95/p99 {row['p50_ms']}/{row['p95_ms']}/{row['p99_ms']}ms, "
+                f"{row['rows_per_call']} rows/call [{commands}]\n    {row['statement']}"
+            )
+        return "\n".join(lines)
+
+    def export(self, path, limit=None):
+        with open(path, 'w') as file:
+            json.dump(self.report(limit or len(self.statements)), file, indent=2)
+
+
+def rows_affected(status):
+    """Row count from a command status string such as 'UPDATE 3' or 'INSERT 0 1'."""
+    try:
+        return int(status.rsplit(' ', 1)[-1])
+    except (AttributeError, ValueError):
+        return 0
+
+
+class TracedPool(asyncpg.Pool):
+    """Pool that reports how long each acquire waited for a free connection.
+
+    Overrides asyncpg's Pool._acquire, which sits behind both pool.acquire()
+    and ``async with pool.acquire()``.
+    """
+
+    def __init__(self, *args, tracer, command_name, **kwargs):
+        # Pool itself has no defaults for these; use the ones asyncpg.create_pool passes
+        kwargs.setdefault('max_queries', 50000)
+        kwargs.setdefault('max_inactive_connection_lifetime', 300.0)
+        kwargs.setdefault('loop', None)
+        kwargs.setdefault('record_class', asyncpg.Record)
+        kwargs.setdefault('connection_class', asyncpg.Connection)
+        super().__init__(*args, **kwargs)
+        self._tracer = tracer
+        self._command_name = command_name
+
+    async def _acquire(self, timeout):
+        started = time.perf_counter()
+        try:
+            return await super()._acquire(timeout)
+        finally:
+            self._tracer.record(ACQUIRE, time.perf_counter() - started, 0, self._command_name())
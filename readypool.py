@@ -0,0 +1,96 @@
+#readypool.py
+import discord
+
+DUEL_ROLE = "1v1 pings"
+DUO_ROLE = "2v2 pings"
+
+
+class ReadyPools:
+    """Who holds each ready role, kept live instead of rescanned on every command.
+
+    Each pool maps a user id to the guilds where they hold the role, so a user
+    with the role in several guilds counts once. Counts are the size of that
+    dict. The pools are seeded once from the guild caches and then kept current
+    from member update/remove events and by the ready commands themselves, so
+    the commands no longer wait for the role change to come back from Discord.
+
+    When the bot runs as several shard processes, on_change is set to replicate
+    single-member changes to the others, which apply them with apply().
+    """
+
+    def __init__(self, role_names=(DUEL_ROLE, DUO_ROLE)):
+        self.pools = {name: {} for name in role_names}
+        self.on_change = None  # callable(added, role_name, user_id, guild_id), see shardstate.py
+
+    def count(self, role_name):
+        return len(self.pools[role_name])
+
+    def is_ready(self, role_name, user_id):
+        return user_id in self.pools[role_name]
+
+    def add(self, role_name, user_id, guild_id):
+        if self.apply(True, role_name, user_id, guild_id) and self.on_change is not None:
+            self.on_change(True, role_name, user_id, guild_id)
+
+    def discard(self, role_name, user_id, guild_id):
+        if self.apply(False, role_name, user_id, guild_id) and self.on_change is not None:
+            self.on_change(False, role_name, user_id, guild_id)
+
+    def apply(self, added, role_name, user_id, guild_id):
+        """Records a change without reporting it to on_change; returns whether anything changed."""
+        pool = self.pools.get(role_name)
+        if pool is None:
+            return False
+        guilds = pool.get(user_id)
+        if added:
+            if guilds is not None and guild_id in guilds:
+                return False
+            pool.setdefault(user_id, set()).add(guild_id)
+            return True
+        if guilds is None or guild_id not in guilds:
+            return False
+        guilds.discard(guild_id)
+        if not guilds:
+            del pool[user_id]
+        return True
+
+    def members(self, include_guild):
+        """(role_name, user_id, guild_id) for every holder in a guild where include_guild(guild_id) is true."""
+        return [(role_name, user_id, guild_id)
+                for role_name, pool in self.pools.items()
+                for user_id, guilds in pool.items()
+                for guild_id in guilds if include_guild(guild_id)]
+
+    def seed(self, guilds):
+        for pool in self.pools.values():
+            pool.clear()
+        for guild in guilds:
+            self.seed_guild(guild)
+
+    def seed_guild(self, guild):
+        for role_name in self.pools:
+            role = discord.utils.get(guild.roles, name=role_name)
+            if role:
+                for member in role.members:
+                    if not member.bot:
+                        self.apply(True, role_name, member.id, guild.id)
+
+    def drop_guild(self, guild_id):
+        for role_name, pool in self.pools.items():
+            for user_id in [user_id for user_id, guilds in pool.items() if guild_id in guilds]:
+                self.apply(False, role_name, user_id, guild_id)
+
+    def member_updated(self, before, after):
+        if after.bot:
+            return
+        before_names = {role.name for role in before.roles}
+        after_names = {role.name for role in after.roles}
+        for role_name in self.pools:
+            if role_name in after_names and role_name not in before_names:
+                self.add(role_name, after.id, after.guild.id)
+            elif role_name in before_names and role_name not in after_names:
+                self.discard(role_name, after.id, after.guild.id)
+
+    def member_removed(self, member):
+        for role_name in self.pools:
+            self.discard(role_name, member.id, member.guild.id)
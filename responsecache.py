@@ -0,0 +1,92 @@
+#responsecache.py
+import asyncio
+import time
+from collections import OrderedDict
+
+# Tags naming the data a cached response was built from; writers invalidate by tag
+DUELS = 'duels'      # ranked_players ratings, names and active status
+DUOS = 'duos'        # duo_teams ratings, names and membership
+HOUSE = 'house'      # house_account balance
+LTS = 'lts'          # lts_teams ratings and rosters
+NETWORK = 'network'  # guilds the bot is in and who can see #chivstats-ranked
+
+
+class CachedResponse:
+    __slots__ = ('value', 'tags', 'expires')
+
+    def __init__(self, value, tags, expires):
+        self.value = value
+        self.tags = tags
+        self.expires = expires
+
+
+class ResponseCache:
+    """Read-through cache for the rendered responses of informational commands.
+
+    Entries are keyed by command name and arguments. Each entry carries tags for
+    the data it was built from. The write paths (match settlement, coin moves,
+    roster changes) call invalidate() with the tags they touch. Concurrent misses
+    on one key share a single build. Cached values are treated as immutable, so
+    an Embed is sent as-is and never edited afterwards.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> CachedResponse, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self._building = {}  # key -> (Future, tags) of an in-flight build
+
+    async def get_or_build(self, key, tags, build, ttl=None):
+        """Returns the cached value for key, or awaits build() and caches what it returns.
+
+        build may return None to skip caching, e.g. for an error reply.
+        """
+        entry = self.entries.get(key)
+        if entry is not None and (entry.expires is None or entry.expires > time.monotonic()):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+        pending = self._building.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending[0])
+
+        self.misses += 1
+        tags = frozenset(tags)
+        future = asyncio.get_running_loop().create_future()
+        building = self._building[key] = (future, tags)
+        try:
+            value = await build()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't warn when there are none
+            raise
+        else:
+            future.set_result(value)
+            # Skip the store if an invalidation landed while building
+            if value is not None and self._building.get(key) is building:
+                self.entries[key] = CachedResponse(value, tags, time.monotonic() + ttl if ttl else None)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            return value
+        finally:
+            if self._building.get(key) is building:
+                del self._building[key]
+
+    def invalidate(self, *tags):
+        tags = set(tags)
+        for key in [key for key, entry in self.entries.items() if entry.tags & tags]:
+            del self.entries[key]
+        # Builds already running read the old data; let them answer their waiters but not be stored
+        for key in [key for key, (_, building_tags) in self._building.items() if building_tags & tags]:
+            del self._building[key]
+
+    def clear(self):
+        self.entries.clear()
+        self._building.clear()
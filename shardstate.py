@@ -0,0 +1,253 @@
+#shardstate.py
+import asyncio
+import json
+
+import discord
+
+READY_CHANNEL = 'chivbot_ready'
+BROADCAST_CHANNEL = 'chivbot_broadcast'
+LEADERBOARD_CHANNEL = 'chivbot_leaderboard'
+QUEUE_CHANNEL = 'chivbot_queue'
+
+MAX_NOTIFY_PAYLOAD = 7500  # Postgres caps NOTIFY payloads at 8000 bytes
+READY_BATCH = 100
+READY_RETRY_DELAY = 5
+
+
+def parse_shard_ids(value):
+    """'0-3' or '0,2,5-7' -> sorted list of shard ids; '' -> []."""
+    shard_ids = set()
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        first, _, last = part.partition('-')
+        shard_ids.update(range(int(first), int(last or first) + 1))
+    return sorted(shard_ids)
+
+
+async def send_to_local_guilds(bot, channel_name, embed=None, content=None, exclude_channel_id=None):
+    """Sends to channel_name in each guild this process serves; returns the names of the guilds sent to."""
+    sent_to = []
+    for guild in bot.guilds:
+        channel = discord.utils.get(guild.text_channels, name=channel_name)
+        if channel and channel.id != exclude_channel_id:
+            try:
+                await channel.send(content=content, embed=embed)
+                sent_to.append(guild.name)
+            except Exception as e:
+                print(f"Failed to send message to {channel.name} in {guild.name}: {e}")
+    return sent_to
+
+
+async def broadcast(bot, channel_name, embed=None, content=None, exclude_channel_id=None):
+    """Sends to channel_name in every guild, including guilds served by other shard processes.
+
+    Returns the names of the local guilds sent to; other processes deliver their
+    own guilds once the notification reaches them.
+    """
+    sent_to = await send_to_local_guilds(bot, channel_name, embed, content, exclude_channel_id)
+    if bot.shared_state is not None:
+        await bot.shared_state.publish_broadcast(channel_name, embed, content, exclude_channel_id)
+    return sent_to
+
+
+class SharedState:
+    """State that has to agree across bot processes that each own a range of shards.
+
+    Only used when CHIVBOT_SHARD_IDS splits the shards over several processes.
+    Each process only sees its own guilds, so anything network-wide goes through
+    Postgres:
+
+    - Ready pools. Each process writes its guilds' role holders to
+      ready_pool_members and mirrors the rest of the table, kept current by
+      NOTIFY on chivbot_ready. A user ready in guilds on two processes still
+      counts once.
+    - Matchmaking queues. Every process mirrors the queue from enqueue/dequeue
+      notifications, but only the leader (the process owning shard 0) pairs.
+      Announcements for channels it cannot see are relayed.
+    - Broadcasts to #chivstats-ranked and friends, and leaderboard refreshes.
+      Each process delivers to its own guilds.
+
+    Pending confirmations already live in duel_confirmations and lts_matches,
+    and every process restores the views for them.
+    """
+
+    def __init__(self, bot, pubsub, ready_pools, matchmaker, create_db_connection, close_db_connection):
+        self.bot = bot
+        self.pubsub = pubsub
+        self.ready_pools = ready_pools
+        self.matchmaker = matchmaker
+        self.create_db_connection = create_db_connection
+        self.close_db_connection = close_db_connection
+        self.refresh_leaderboard = None  # async callable updating this process's leaderboard messages
+        self._ready_changes = {}  # (role_name, user_id, guild_id) -> added, waiting to be written
+        self._ready_flush = None
+
+    def attach(self):
+        self.ready_pools.on_change = self.ready_changed
+        self.matchmaker.on_change = self.queue_changed
+        self.matchmaker.relay = self.relay
+        self.pubsub.subscribe(READY_CHANNEL, self._on_ready)
+        self.pubsub.subscribe(QUEUE_CHANNEL, self.matchmaker.apply_remote)
+        self.pubsub.subscribe(BROADCAST_CHANNEL, self._on_broadcast)
+        self.pubsub.subscribe(LEADERBOARD_CHANNEL, self._on_leaderboard)
+        self.pubsub.on_resync(self.resync)
+
+    def local_guild_ids(self):
+        return {guild.id for guild in self.bot.guilds}
+
+    # Ready pools
+
+    def ready_changed(self, added, role_name, user_id, guild_id):
+        # Called synchronously from ReadyPools; the writes are batched in the background
+        self._ready_changes[(role_name, user_id, guild_id)] = added
+        if self._ready_flush is None or self._ready_flush.done():
+            self._ready_flush = asyncio.create_task(self._flush_ready())
+
+    async def _flush_ready(self):
+        while self._ready_changes:
+            batch = list(self._ready_changes.items())[:READY_BATCH]
+            for key, _ in batch:
+                del self._ready_changes[key]
+            added = [key for key, was_added in batch if was_added]
+            removed = [key for key, was_added in batch if not was_added]
+            conn = None
+            try:
+                conn = await self.create_db_connection()
+                async with conn.transaction():
+                    await self._insert_ready(conn, added)
+                    if removed:
+                        await conn.execute("""
+                            DELETE FROM ready_pool_members r
+                            USING unnest($1::varchar[], $2::bigint[], $3::bigint[]) AS d(role_name, discordid, guild_id)
+                            WHERE r.role_name = d.role_name AND r.discordid = d.discordid AND r.guild_id = d.guild_id
+                        """, *zip(*removed))
+                    await self.pubsub.publish(conn, READY_CHANNEL, {'changes': [[was_added, *key] for key, was_added in batch]})
+            except Exception as e:
+                # Put the batch back unless a newer change to the same key came in meanwhile, and retry
+                for key, was_added in batch:
+                    self._ready_changes.setdefault(key, was_added)
+                print(f"Failed to share ready pool changes, retrying in {READY_RETRY_DELAY}s: {e}")
+            else:
+                continue
+            finally:
+                if conn is not None:
+                    await self.close_db_connection(conn)
+            await asyncio.sleep(READY_RETRY_DELAY)
+
+    @staticmethod
+    async def _insert_ready(conn, members):
+        if members:
+            await conn.execute("""
+                INSERT INTO ready_pool_members (role_name, discordid, guild_id)
+                SELECT * FROM unnest($1::varchar[], $2::bigint[], $3::bigint[])
+                ON CONFLICT DO NOTHING
+            """, *zip(*members))
+
+    async def sync_guilds(self, conn, guild_ids):
+        """Replaces the shared rows for guild_ids with this process's view of them."""
+        guild_ids = list(guild_ids)
+        async with conn.transaction():
+            await conn.execute("DELETE FROM ready_pool_members WHERE guild_id = ANY($1::bigint[])", guild_ids)
+            await self._insert_ready(conn, self.ready_pools.members(lambda guild_id: guild_id in guild_ids))
+            await self.pubsub.publish(conn, READY_CHANNEL, {'guild_ids': guild_ids})
+
+    async def guild_changed(self, guild_id):
+        # A guild joined or left this process; its holders were seeded or dropped in one go
+        conn = await self.create_db_connection()
+        try:
+            await self.sync_guilds(conn, [guild_id])
+        finally:
+            await self.close_db_connection(conn)
+
+    async def _load_ready(self, conn, guild_ids=None):
+        """Reloads other processes' rows, for guild_ids or for every guild this process doesn't serve."""
+        local = self.local_guild_ids()
+        if guild_ids is None:
+            stale = self.ready_pools.members(lambda guild_id: guild_id not in local)
+            rows = await conn.fetch("SELECT role_name, discordid, guild_id FROM ready_pool_members WHERE guild_id <> ALL($1::bigint[])", list(local))
+        else:
+            guild_ids = [guild_id for guild_id in guild_ids if guild_id not in local]
+            stale = self.ready_pools.members(lambda guild_id: guild_id in guild_ids)
+            rows = await conn.fetch("SELECT role_name, discordid, guild_id FROM ready_pool_members WHERE guild_id = ANY($1::bigint[])", guild_ids)
+        for role_name, user_id, guild_id in stale:
+            self.ready_pools.apply(False, role_name, user_id, guild_id)
+        for row in rows:
+            self.ready_pools.apply(True, row['role_name'], row['discordid'], row['guild_id'])
+
+    async def _on_ready(self, message):
+        if 'guild_ids' in message:
+            conn = await self.create_db_connection()
+            try:
+                await self._load_ready(conn, message['guild_ids'])
+            finally:
+                await self.close_db_connection(conn)
+            return
+        local = self.local_guild_ids()
+        for added, role_name, user_id, guild_id in message['changes']:
+            if guild_id not in local:
+                self.ready_pools.apply(added, role_name, user_id, guild_id)
+
+    async def resync(self):
+        """Publishes this process's guilds and reloads everyone else's, after (re)connecting to either side."""
+        conn = await self.create_db_connection()
+        try:
+            await self.sync_guilds(conn, self.local_guild_ids())
+            await self._load_ready(conn)
+            await self.matchmaker.reload(conn)
+        finally:
+            await self.close_db_connection(conn)
+
+    # Matchmaking
+
+    async def queue_changed(self, conn, mode, members, entry):
+        payload = {'mode': mode, 'members': list(members)}
+        if entry is not None:
+            payload.update(elo=entry.elo, queued_at=entry.queued_at, channel_id=entry.channel_id)
+        await self.pubsub.publish(conn, QUEUE_CHANNEL, payload)
+
+    async def relay(self, channel_id, content):
+        """Sends content to a channel another process serves."""
+        conn = await self.create_db_connection()
+        try:
+            await self.pubsub.publish(conn, BROADCAST_CHANNEL, {'channel_id': channel_id, 'content': content})
+        finally:
+            await self.close_db_connection(conn)
+
+    # Broadcasts and leaderboards
+
+    async def publish_broadcast(self, channel_name, embed=None, content=None, exclude_channel_id=None):
+        payload = {'channel_name': channel_name, 'embed': embed.to_dict() if embed else None,
+                   'content': content, 'exclude_channel_id': exclude_channel_id}
+        conn = await self.create_db_connection()
+        try:
+            if len(json.dumps(payload)) > MAX_NOTIFY_PAYLOAD:
+                broadcast_id = await conn.fetchval("INSERT INTO shard_broadcasts (payload) VALUES ($1::jsonb) RETURNING id", json.dumps(payload))
+                await conn.execute("DELETE FROM shard_broadcasts WHERE created_at < CURRENT_TIMESTAMP - INTERVAL '1 day'")
+                payload = {'broadcast_id': broadcast_id}
+            await self.pubsub.publish(conn, BROADCAST_CHANNEL, payload)
+        finally:
+            await self.close_db_connection(conn)
+
+    async def _on_broadcast(self, message):
+        if 'broadcast_id' in message:
+            conn = await self.create_db_connection()
+            try:
+                stored = await conn.fetchval("SELECT payload FROM shard_broadcasts WHERE id = $1", message['broadcast_id'])
+            finally:
+                await self.close_db_connection(conn)
+            if stored is None:
+                return
+            message = json.loads(stored)
+        if 'channel_id' in message:
+            channel = self.bot.get_channel(message['channel_id'])
+            if channel:
+                await channel.send(message['content'])
+            return
+        embed = discord.Embed.from_dict(message['embed']) if message.get('embed') else None
+        await send_to_local_guilds(self.bot, message['channel_name'], embed, message.get('content'), message.get('exclude_channel_id'))
+
+    async def leaderboard_changed(self, conn):
+        await self.pubsub.publish(conn, LEADERBOARD_CHANNEL, {})
+
+    async def _on_leaderboard(self, message):
+        if self.refresh_leaderboard is not None:
+            await self.refresh_leaderboard()
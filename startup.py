@@ -0,0 +1,75 @@
+#startup.py
+import asyncio
+import contextlib
+import os
+import time
+
+
+class StartupOrchestrator:
+    """Times the bot's startup phases and prints a breakdown once it is accepting commands."""
+
+    def __init__(self, process_start):
+        self.process_start = process_start
+        self.timings = []  # (phase, seconds) in the order phases finished
+        self._started = {}
+        self.complete = False
+
+    def begin(self, name):
+        self._started[name] = time.perf_counter()
+
+    def end(self, name):
+        started = self._started.pop(name, None)
+        if started is not None:
+            self.timings.append((name, time.perf_counter() - started))
+
+    @contextlib.asynccontextmanager
+    async def phase(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def run_in_background(self, name, coro):
+        """Runs a phase as a task, e.g. cache warm-up after the bot is already online."""
+        async def runner():
+            async with self.phase(f"{name} (background)"):
+                await coro
+            print(f"Startup: {name} finished in the background ({self.timings[-1][1]:.3f}s).")
+
+        return asyncio.create_task(runner())
+
+    def report(self):
+        self.complete = True
+        total = time.perf_counter() - self.process_start
+        lines = ["Startup time breakdown:"]
+        for name, seconds in self.timings:
+            lines.append(f"  {name:<16} {seconds:8.3f}s")
+        lines.append(f"  {'total':<16} {total:8.3f}s from process start to accepting commands")
+        print("\n".join(lines))
+
+
+async def apply_migrations(conn, directory):
+    """Applies migrations/*.sql in filename order, each once, recording them in schema_migrations."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            filename character varying(255) PRIMARY KEY,
+            applied_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Serialise concurrent bot processes on the same database
+    await conn.execute("SELECT pg_advisory_lock(hashtext('chivbot_schema_migrations'))")
+    try:
+        applied = {row['filename'] for row in await conn.fetch("SELECT filename FROM schema_migrations")}
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(".sql") or filename in applied:
+                continue
+            with open(os.path.join(directory, filename), 'r') as file:
+                sql = file.read()
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute("INSERT INTO schema_migrations (filename) VALUES ($1)", filename)
+            print(f"Applied migration {filename}")
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock(hashtext('chivbot_schema_migrations'))")
@@ -0,0 +1,300 @@
+#bench.py
+"""Micro-benchmarks for the pure-Python helpers that run on every match.
+
+Each benchmark runs at the size seen in production and at 100x. Sizes come
+from ranked_combat.sql: about 115 active players, 156 duels for the busiest
+pair, and 10 guilds to echo to. Timing follows pytest-benchmark: calibrate the
+loop count, then time many rounds and keep the median and the interquartile
+range per call. Rounds are interleaved across benchmarks over several passes.
+A fixed reference workload runs in the same passes. Each median is divided by
+how much slower the reference ran than in the baseline, so throttling or a
+busy host doesn't read as a regression. A benchmark fails when that ratio
+exceeds --threshold, widened by the relative spread either run saw, up to
+10%. A suspected regression is measured again, and it fails the run only if
+the second measurement confirms it.
+
+    python tools/bench.py                 # compare against tools/bench_baseline.json
+    python tools/bench.py --save          # record a new baseline
+    python tools/bench.py -k tiers        # only benchmarks whose name contains "tiers"
+
+Baselines are machine-specific; record one on the machine that gates.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+
+import bot as chivbot
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Production sizes; every benchmark also runs at SCALE times these
+ACTIVE_PLAYERS = 115
+HEAD_TO_HEAD_DUELS = 156
+GUILDS = 10
+SCALE = 100
+
+_random = random.Random(7)
+
+
+def head_to_head_rows(count):
+    rows = []
+    for _ in range(count):
+        winner, loser = ("P1", "P2") if _random.random() < 0.6 else ("P2", "P1")
+        rows.append({'winner_playfabid': winner, 'loser_playfabid': loser, 'winner_score': 5, 'loser_score': _random.randint(0, 4)})
+    return rows
+
+
+class FakeConn:
+    """Stands in for the pooled connection; fetch returns canned rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, query, *args):
+        return self.rows
+
+
+class FakeChannel:
+    def __init__(self, name):
+        self.id = _random.getrandbits(60)
+        self.name = name
+
+    async def send(self, *args, **kwargs):
+        return None
+
+
+def confirmed_duel_embed():
+    # The embed handle_confirm builds and echoes
+    embed = discord.Embed(title="1v1 Duel Winner: <@230773943240228864> vs <@1190570409087733782> (5-3)", color=discord.Color.green())
+    embed.add_field(name="<@230773943240228864>: 1625 (+14)", value="🥇   :coin: 445", inline=True)
+    embed.add_field(name="<@1190570409087733782>: 1471 (-14)", value="🇨   :coin: 121", inline=True)
+    embed.description = "`/submit_duel 5 @opponent 3`\nPayout: **4** [ 3 + (1 house tip) ]\nPurse: 0"
+    return embed
+
+
+def bench_calculate_elo(size):
+    ratings = [(_random.gauss(1500, 97), _random.gauss(1500, 97)) for _ in range(size)]
+    def run():
+        for rating, opponent in ratings:
+            chivbot.calculate_elo(rating, 32, 1, 1, opponent)
+    return run
+
+
+def bench_calculate_odds(size):
+    ratings = [(_random.gauss(1500, 97), _random.gauss(1500, 97)) for _ in range(size)]
+    def run():
+        for elo1, elo2 in ratings:
+            chivbot.calculate_odds(elo1, elo2)
+    return run
+
+
+def bench_calculate_confidence(size):
+    rows = head_to_head_rows(HEAD_TO_HEAD_DUELS * size)
+    return lambda: chivbot.calculate_confidence(rows, "P1", "P2")
+
+
+def bench_calculate_head_to_head_stats(size):
+    rows = head_to_head_rows(HEAD_TO_HEAD_DUELS * size)
+    return lambda: chivbot.calculate_head_to_head_stats(rows, "P1", "P2", 400 * size, 300 * size, "one", "two")
+
+
+def bench_calculate_tiers(size):
+    players = sorted(({'playfabid': f"{index:016X}", 'elo_duelsx': _random.gauss(1500, 97)} for index in range(ACTIVE_PLAYERS * size)),
+                     key=lambda player: player['elo_duelsx'], reverse=True)
+    conn = FakeConn(players)
+    loop = asyncio.new_event_loop()
+    sink = io.StringIO()
+    def run():
+        # Whatever calculate_tiers prints is part of its cost
+        with contextlib.redirect_stdout(sink):
+            loop.run_until_complete(chivbot.calculate_tiers(conn))
+        sink.seek(0)
+        sink.truncate()
+    return run
+
+
+def bench_remove_mentions(size):
+    text = "Duel between <@230773943240228864> and <@!1190570409087733782> confirmed in <@&1111684756896239677> " * size
+    return lambda: chivbot.remove_mentions(text)
+
+
+def bench_echo_to_guilds(size):
+    guilds = [SimpleNamespace(id=index, name=f"guild-{index}", text_channels=[FakeChannel("general"), FakeChannel("chivstats-ranked")])
+              for index in range(GUILDS * size)]
+    interaction = SimpleNamespace(guild=guilds[0], channel=guilds[0].text_channels[1])
+    embed = confirmed_duel_embed()
+    loop = asyncio.new_event_loop()
+    def run():
+        chivbot.bot._connection._guilds = {guild.id: guild for guild in guilds}
+        loop.run_until_complete(chivbot.echo_to_guilds(interaction, embed, "chivstats-ranked"))
+    return run
+
+
+BENCHMARKS = [
+    ("calculate_elo", bench_calculate_elo),
+    ("calculate_odds", bench_calculate_odds),
+    ("calculate_confidence", bench_calculate_confidence),
+    ("calculate_head_to_head_stats", bench_calculate_head_to_head_stats),
+    ("calculate_tiers", bench_calculate_tiers),
+    ("remove_mentions", bench_remove_mentions),
+    ("echo_to_guilds", bench_echo_to_guilds),
+]
+
+
+REFERENCE = "reference"
+
+
+def reference_workload():
+    # Fixed pure-Python work (dicts, arithmetic, formatting) that no change to the bot affects
+    table = {}
+    total = 0
+    for i in range(2000):
+        table[i % 97] = f"{i:x}"
+        total += i * i % 7
+    return total
+
+
+def calibrate(func, min_round_time=0.02):
+    """Loops per round so that a round takes at least min_round_time."""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_round_time:
+            return loops
+        loops *= 2 if elapsed == 0 else max(2, int(min_round_time / elapsed * 1.2))
+
+
+def time_rounds(func, loops, rounds):
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        times.append((time.perf_counter() - started) / loops)
+    return times
+
+
+def measure(cases, passes=3, rounds=10):
+    """{key: {'median': seconds per call, 'iqr': interquartile range}} for cases [(key, func, loops)].
+
+    The rounds are spread over several interleaved passes through every case, so
+    a burst of load on the machine lands in a few rounds of each benchmark
+    instead of all rounds of one.
+    """
+    times = {key: [] for key, _, _ in cases}
+    for _ in range(passes):
+        for key, func, loops in cases:
+            times[key].extend(time_rounds(func, loops, rounds))
+    results = {}
+    for key, samples in times.items():
+        quartiles = statistics.quantiles(samples, n=4)
+        results[key] = {'median': statistics.median(samples), 'iqr': quartiles[2] - quartiles[0]}
+    return results
+
+
+def machine_speed(results, baseline):
+    """How much slower this run's reference workload was than the baseline's, never below 1.
+
+    A faster reference doesn't tighten the limit; a tiny loop speeds up in ways
+    the benchmarks don't.
+    """
+    if REFERENCE not in baseline:
+        return 1.0
+    return max(1.0, results[REFERENCE]['median'] / baseline[REFERENCE]['median'])
+
+
+def allowed_ratio(result, baseline, threshold):
+    """threshold, widened by the relative spread of both measurements, up to 1.1x threshold.
+
+    The cap keeps the gate meaningful on a noisy machine. Noise is handled by
+    the reference workload and by confirming a suspected regression instead.
+    """
+    noise = min(0.1, max(result['iqr'] / result['median'], baseline['iqr'] / baseline['median']))
+    return threshold * (1 + noise)
+
+
+def format_time(seconds):
+    for unit, factor in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds >= 1 / factor:
+            return f"{seconds * factor:.2f}{unit}"
+    return f"{seconds * 1e9:.0f}ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', dest='filter', help="only run benchmarks whose name contains this")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=1.25, help="fail when slower than baseline by this factor")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as file:
+            # Older baselines stored the fastest round as a bare number; they can't be compared to medians
+            baseline = {key: value for key, value in json.load(file).items() if isinstance(value, dict)}
+
+    reference = (REFERENCE, reference_workload, calibrate(reference_workload))
+    cases = []
+    for name, factory in BENCHMARKS:
+        for label, size in (("prod", 1), (f"{SCALE}x", SCALE)):
+            key = f"{name}[{label}]"
+            if args.filter and args.filter not in key:
+                continue
+            run = factory(size)
+            cases.append((key, run, calibrate(run)))
+    results = measure([reference] + cases)
+    speed = machine_speed(results, baseline)
+    ratios = {key: results[key]['median'] / baseline[key]['median'] / speed for key, _, _ in cases if key in baseline}
+
+    def over_limit(key):
+        return key in ratios and ratios[key] > allowed_ratio(results[key], baseline[key], args.threshold)
+
+    suspects = [case for case in cases if over_limit(case[0])]
+    if suspects and not args.save:
+        # Confirm before failing: measure the suspects again, with the reference, and keep the better ratio
+        retry = measure([reference] + suspects)
+        retry_speed = machine_speed(retry, baseline)
+        for key, _, _ in suspects:
+            retry_ratio = retry[key]['median'] / baseline[key]['median'] / retry_speed
+            if retry_ratio < ratios[key]:
+                results[key], ratios[key] = retry[key], retry_ratio
+
+    print(f"{REFERENCE:<42}{format_time(results[REFERENCE]['median']):>12}  machine speed {speed:.2f}x baseline")
+    regressions = []
+    for key, _, _ in cases:
+        result = results[key]
+        line = f"{key:<42}{format_time(result['median']):>12} ±{format_time(result['iqr'] / 2):<9}"
+        if key in ratios:
+            line += f"{ratios[key]:>6.2f}x baseline (limit {allowed_ratio(result, baseline[key], args.threshold):.2f}x)"
+            if over_limit(key):
+                regressions.append(key)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump({**baseline, **results}, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"FAILED: {len(regressions)} benchmark(s) slower than baseline beyond their limit: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#export_matches.py
+"""Incremental columnar export of match history (duels, duos, lts_matches).
+
+Rows are streamed through a server-side cursor in batches. Each batch is
+written as a row group, so memory holds one batch per month being written,
+not a whole table. Output is partitioned by month, hive-style, so pyarrow,
+DuckDB or Spark can read a table directory as one dataset:
+
+    <out>/duels/month=2024-03/part-000000912.parquet
+
+A run only exports rows above the high-water mark stored in <out>/_state.json
+and advances the mark once all files are closed. Each run adds new part files
+named after their first id. A crashed run is repeated from the same mark and
+overwrites its own partial files.
+
+Ids come from sequences, and concurrent transactions can commit out of id
+order. A row committed after a higher id was exported would fall below the
+mark for good. So a run stops before the first row newer than a cutoff:
+--settle-minutes ago, or the start of the oldest transaction still writing,
+whichever is earlier. Rows are stamped with their transaction's start time.
+An uncommitted row stamped before the cutoff would belong to a transaction
+that is still writing, and such a transaction moves the cutoff back to its own
+start.
+
+lts_matches rows are exported once settled: confirmed, denied or expired.
+The mark stops below the oldest pending match, so a match confirmed later is
+not skipped. The bot expires unanswered submissions after a week (see
+LTSCog.expire_pending_matches), which bounds that wait. Expired rows are
+unconfirmed and have no confirming_discordid.
+
+    python tools/export_matches.py --out /srv/chivstats/exports
+    python tools/export_matches.py --out exports --format arrow --tables duels,duos
+
+Requires pyarrow (pip install pyarrow). Runs in one read-only repeatable-read
+transaction, so the export is a consistent snapshot.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncpg
+
+from bot import DATABASE, USER, HOST
+
+STATE_FILE = "_state.json"
+EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+# table -> (timestamp column, [(column, arrow type name)], extra WHERE clause)
+TABLES = {
+    'duels': ('timestamp', [
+        ('id', 'int32'), ('timestamp', 'timestamp'), ('submitting_playfabid', 'string'),
+        ('winner_playfabid', 'string'), ('winner_score', 'int32'), ('winner_elo', 'float64'),
+        ('loser_playfabid', 'string'), ('loser_score', 'int32'), ('loser_elo', 'float64'),
+    ], ''),
+    'duos': ('timestamp', [
+        ('id', 'int32'), ('timestamp', 'timestamp'), ('submitting_playfabid', 'string'),
+        ('winner_team_id', 'int32'), ('winner_score', 'int32'), ('winner_elo', 'float64'),
+        ('loser_team_id', 'int32'), ('loser_score', 'int32'), ('loser_elo', 'float64'),
+    ], ''),
+    'lts_matches': ('match_timestamp', [
+        ('id', 'int32'), ('match_timestamp', 'timestamp'), ('submitting_discordid', 'int64'),
+        ('confirming_discordid', 'int64'), ('winner_team_id', 'int32'), ('winner_score', 'int32'),
+        ('winner_elo', 'int64'), ('loser_team_id', 'int32'), ('loser_score', 'int32'),
+        ('loser_elo', 'int64'), ('match_purse', 'int64'), ('confirmed', 'bool'),
+    ], "AND id < COALESCE((SELECT MIN(id) FROM lts_matches WHERE confirmed = FALSE AND confirming_discordid IS NULL AND expired = FALSE), 2147483647)"),
+}
+
+
+def arrow_schema(pa, columns):
+    types = {'int32': pa.int32(), 'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string(),
+             'bool': pa.bool_(), 'timestamp': pa.timestamp('us')}
+    return pa.schema([(name, types[type_name]) for name, type_name in columns])
+
+
+def load_state(out_dir):
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(out_dir, state):
+    # Written to a temporary file and renamed, so a crash never leaves a half-written mark
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+class MonthWriters:
+    """One open Parquet/Arrow IPC writer per month partition of a table."""
+
+    def __init__(self, pa, file_format, table_dir, schema):
+        self.pa = pa
+        self.file_format = file_format
+        self.table_dir = table_dir
+        self.schema = schema
+        self.writers = {}  # 'YYYY-MM' -> writer
+        self.paths = []
+
+    def write(self, month, columns):
+        writer = self.writers.get(month)
+        if writer is None:
+            month_dir = os.path.join(self.table_dir, f"month={month}")
+            os.makedirs(month_dir, exist_ok=True)
+            path = os.path.join(month_dir, f"part-{columns['id'][0]:09d}.{EXTENSIONS[self.file_format]}")
+            if self.file_format == 'parquet':
+                writer = self.pa.parquet.ParquetWriter(path, self.schema, compression='zstd')
+            else:
+                writer = self.pa.ipc.new_file(path, self.schema)
+            self.writers[month] = writer
+            self.paths.append(path)
+        batch = self.pa.record_batch([self.pa.array(columns[field.name], type=field.type) for field in self.schema],
+                                     schema=self.schema)
+        writer.write_batch(batch)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+
+async def export_table(conn, pa, table, out_dir, file_format, after_id, batch_size, cutoff):
+    """Streams rows of table with id > after_id, up to the first row stamped at or after cutoff, into
+    month partitions; returns (rows, last id, files)."""
+    timestamp_column, columns, where = TABLES[table]
+    names = [name for name, _ in columns]
+    query = f"""
+        SELECT {', '.join(f'"{name}"' for name in names)} FROM {table}
+        WHERE id > $1 {where}
+          AND id < COALESCE((SELECT MIN(id) FROM {table} WHERE id > $1 AND "{timestamp_column}" >= $2), 2147483647)
+        ORDER BY id
+    """
+    schema = arrow_schema(pa, columns)
+    writers = MonthWriters(pa, file_format, os.path.join(out_dir, table), schema)
+    pending = {}  # month -> {column: [values]}, flushed as a row group at batch_size rows
+    exported = 0
+    last_id = after_id
+    try:
+        async for row in conn.cursor(query, after_id, cutoff, prefetch=batch_size):
+            month = row[timestamp_column].strftime('%Y-%m')
+            month_columns = pending.get(month)
+            if month_columns is None:
+                month_columns = pending[month] = {name: [] for name in names}
+            for name in names:
+                month_columns[name].append(row[name])
+            if len(month_columns['id']) >= batch_size:
+                writers.write(month, pending.pop(month))
+            exported += 1
+            last_id = row['id']
+        for month, month_columns in pending.items():
+            writers.write(month, month_columns)
+    finally:
+        writers.close()
+    return exported, last_id, writers.paths
+
+
+async def export(out_dir, tables, file_format, batch_size, settle_minutes):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet  # noqa: F401 -- makes pa.parquet available
+    except ImportError:
+        raise SystemExit("export_matches needs pyarrow: pip install pyarrow")
+
+    os.makedirs(out_dir, exist_ok=True)
+    state = load_state(out_dir)
+    conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+    try:
+        async with conn.transaction(isolation='repeatable_read', readonly=True):
+            # pg_stat_activity only shows backend_xid for the same role, or with pg_read_all_stats
+            cutoff = await conn.fetchval("""
+                SELECT LEAST(LOCALTIMESTAMP - $1::interval,
+                             (SELECT MIN(xact_start)::timestamp FROM pg_stat_activity
+                              WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()))
+            """, timedelta(minutes=settle_minutes))
+            for table in tables:
+                mark = state.get(table, {}).get('last_id', 0)
+                exported, last_id, paths = await export_table(conn, pa, table, out_dir, file_format, mark, batch_size, cutoff)
+                state[table] = {'last_id': last_id, 'format': file_format}
+                print(f"{table}: {exported} rows after id {mark} in {len(paths)} files")
+    finally:
+        await conn.close()
+    # Only advance the marks once every table's files are complete
+    save_state(out_dir, state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', required=True, help="output directory; holds one subdirectory per table and _state.json")
+    parser.add_argument('--format', choices=sorted(EXTENSIONS), default='parquet')
+    parser.add_argument('--tables', default=",".join(TABLES), help="comma-separated subset of " + ", ".join(TABLES))
+    parser.add_argument('--batch-size', type=int, default=10000, help="rows per cursor fetch and per row group")
+    parser.add_argument('--settle-minutes', type=float, default=10,
+                        help="leave rows this recent for the next run, so slower concurrent commits below them are not skipped")
+    args = parser.parse_args()
+
+    tables = [table.strip() for table in args.tables.split(',') if table.strip()]
+    unknown = [table for table in tables if table not in TABLES]
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(unknown)}")
+    state = load_state(args.out)
+    mixed = [table for table in tables if state.get(table, {}).get('format', args.format) != args.format]
+    if mixed:
+        parser.error(f"{', '.join(mixed)} already exported as {state[mixed[0]]['format']}; use a separate --out for another format")
+    asyncio.run(export(args.out, tables, args.format, args.batch_size, args.settle_minutes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+#gen_dataset.py
+"""Synthetic ranked-combat dataset scaled up from ranked_combat.sql.
+
+The dump only holds about 140 ranked players and 900 duels, which is too small
+to show scaling problems. This tool reads the dump's COPY data and uses it as
+templates. Score lines, roster sizes, bets, retirement rates and the Elo and
+activity spread are bootstrapped from the template rows. Matches are then
+replayed through the bot's own Elo function, so ratings, match counts, kills
+and deaths agree with the match history. Everything is written with COPY.
+
+    CHIVBOT_DB_NAME=chivstats_load python tools/gen_dataset.py --scale 100 --create-schema
+
+--create-schema builds the schema on an empty database. It uses the DDL in the
+dump plus the tables and function the dump only references (players, duos,
+house_account_default_payout). Migrations are applied afterwards, as at bot
+startup. GlobalXp/experienceknight leaderboard data isn't in the dump and isn't
+generated.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncpg
+
+from bot import DATABASE, USER, HOST, MIGRATIONS_DIR, calculate_elo
+from startup import apply_migrations
+
+DEFAULT_DUMP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ranked_combat.sql")
+GENERATED_TABLES = ["challenges", "lts_matches", "lts_teams", "duos", "duo_teams", "duels", "duel_confirmations", "ranked_players", "players"]
+
+# Objects the dump references but doesn't contain
+SUPPORT_SQL = """
+CREATE TABLE IF NOT EXISTS public.players (
+    id integer PRIMARY KEY,
+    playfabid character varying UNIQUE,
+    discordid bigint,
+    alias_history text
+);
+
+CREATE TABLE IF NOT EXISTS public.duos (
+    id serial PRIMARY KEY,
+    "timestamp" timestamp without time zone DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    submitting_playfabid character varying,
+    winner_team_id integer NOT NULL,
+    winner_score integer NOT NULL,
+    winner_elo double precision NOT NULL,
+    loser_team_id integer NOT NULL,
+    loser_score integer NOT NULL,
+    loser_elo double precision NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION public.house_account_default_payout() RETURNS trigger AS $$
+BEGIN
+    NEW.payout_rate := COALESCE(NEW.payout_rate, 5.00);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+SKILL_SPREAD = 2.8
+
+_COPY_HEADER = re.compile(r'^COPY public\.(\w+) \((.*)\) FROM stdin;$')
+
+
+def parse_dump(path):
+    """Splits a pg_dump file into its DDL and the rows of each COPY block ({table: [dict]})."""
+    ddl, tables = [], {}
+    with open(path, 'r', encoding='utf-8') as file:
+        lines = iter(file.read().splitlines())
+    for line in lines:
+        header = _COPY_HEADER.match(line)
+        if header is None:
+            # Ownership and the emptied search_path don't apply to a local scratch database
+            if ' OWNER TO ' not in line and 'set_config(\'search_path\'' not in line:
+                ddl.append(line)
+            continue
+        table, columns = header.group(1), [column.strip().strip('"') for column in header.group(2).split(',')]
+        rows = tables.setdefault(table, [])
+        for data in lines:
+            if data == '\\.':
+                break
+            values = [None if value == '\\N' else value for value in data.split('\t')]
+            rows.append(dict(zip(columns, values)))
+    return "\n".join(ddl), tables
+
+
+class Generator:
+    def __init__(self, templates, scale, extra_players, seed):
+        self.templates = templates
+        self.scale = scale
+        self.extra_players = extra_players
+        self.random = random.Random(seed)
+        self.ids = {}
+        self.start, self.end = self._date_range()
+
+    # -- helpers
+
+    def _next_id(self, table):
+        counter = self.ids.setdefault(table, itertools.count(1))
+        return next(counter)
+
+    def _date_range(self):
+        stamps = sorted(row['timestamp'][:19] for row in self.templates.get('duels', []))
+        if not stamps:
+            end = datetime.now()
+            return end - timedelta(days=70), end
+        return datetime.fromisoformat(stamps[0]), datetime.fromisoformat(stamps[-1])
+
+    def _timestamps(self, count):
+        span = (self.end - self.start).total_seconds()
+        return sorted(self.start + timedelta(seconds=self.random.uniform(0, span)) for _ in range(count))
+
+    def _jitter(self, values, relative=0.15):
+        """Kernel-style resample: a random template value with multiplicative noise."""
+        value = float(self.random.choice(values))
+        return value * self.random.lognormvariate(0, relative) if value else value
+
+    def _name(self):
+        syllables = ["ka", "ro", "shi", "gan", "mor", "ul", "bel", "tor", "vin", "dra", "ek", "sa", "lith", "gar", "no"]
+        name = "".join(self.random.choice(syllables) for _ in range(self.random.randint(2, 4))).capitalize()
+        return name + (str(self.random.randint(1, 999)) if self.random.random() < 0.3 else "")
+
+    def _playfabid(self):
+        return "".join(self.random.choice("0123456789ABCDEF") for _ in range(16))
+
+    def _weighted_pick(self, cumulative, total):
+        return bisect.bisect_right(cumulative, self.random.uniform(0, total))
+
+    def _count(self, table, minimum=1):
+        return max(minimum, len(self.templates.get(table, [])) * self.scale)
+
+    # -- tables
+
+    def players(self):
+        """Ranked players (with a hidden skill and activity weight) plus unregistered players."""
+        templates = self.templates['ranked_players']
+        active = [row for row in templates if int(row['matches'] or 0) > 0]
+        skills = [float(row['elo_duelsx']) for row in active] or [1500.0]
+        activity = [int(row['matches']) for row in active] or [1]
+        inactive_share = 1 - len(active) / len(templates)
+        retired_share = sum(row['retired'] == 't' for row in templates) / len(templates)
+        gamename_share = sum(row['gamename'] is not None for row in templates) / len(templates)
+
+        discordids, playfabids = set(), set()
+        self.ranked = []
+        for _ in range(self._count('ranked_players')):
+            discordid = self.random.randint(10**17, 12 * 10**17)
+            while discordid in discordids:
+                discordid = self.random.randint(10**17, 12 * 10**17)
+            playfabid = self._playfabid()
+            while playfabid in playfabids:
+                playfabid = self._playfabid()
+            discordids.add(discordid)
+            playfabids.add(playfabid)
+            name = self._name()
+            self.ranked.append({
+                'player_id': self._next_id('players'),
+                'playfabid': playfabid,
+                'discordid': discordid,
+                'discord_username': name.lower(),
+                'common_name': name,
+                'gamename': name if self.random.random() < gamename_share else None,
+                'retired': self.random.random() < retired_share,
+                # Observed ratings are shrunk towards 1500 by K=32 noise; spread the hidden skill back out
+                'skill': 1500 + (self.random.choice(skills) - 1500) * SKILL_SPREAD + self.random.gauss(0, 25),
+                'activity': 0 if self.random.random() < inactive_share else self._jitter(activity, 0.3),
+                'elo': 1500.0, 'kills': 0, 'deaths': 0, 'matches': 0,
+                'coins': int(self._jitter([int(row['coins']) for row in templates], 0.1)),
+            })
+
+        self.unregistered = []
+        for _ in range(len(self.ranked) * self.extra_players):
+            playfabid = self._playfabid()
+            while playfabid in playfabids:
+                playfabid = self._playfabid()
+            playfabids.add(playfabid)
+            self.unregistered.append({'player_id': self._next_id('players'), 'playfabid': playfabid, 'common_name': self._name()})
+
+    def alias_history(self, common_name):
+        """{alias: times seen}, with the player's common name as the most frequent alias."""
+        history = {common_name: self.random.randint(20, 400)}
+        for _ in range(min(int(self.random.expovariate(0.6)), 12)):
+            history[self._name()] = self.random.randint(1, 19)
+        return json.dumps(history)
+
+    def simulate(self, count, pair, score_lines):
+        """Replays count matches between entities; pair() picks two, skill decides the winner."""
+        for timestamp in self._timestamps(count):
+            first, second = pair()
+            expected = 1 / (1 + 10 ** ((second['skill'] - first['skill']) / 400))
+            winner, loser = (first, second) if self.random.random() < expected else (second, first)
+            winner_score, loser_score = self.random.choice(score_lines)
+            winner_elo = calculate_elo(winner['elo'], 32, 1, 1, loser['elo'])
+            loser_elo = calculate_elo(loser['elo'], 32, 0, 1, winner['elo'])
+            winner['elo'], loser['elo'] = winner_elo, loser_elo
+            yield timestamp, winner, winner_score, loser, loser_score
+
+    def duels(self):
+        templates = self.templates['duels']
+        score_lines = [(int(row['winner_score']), int(row['loser_score'])) for row in templates]
+        submitted_by_winner = sum(row['submitting_playfabid'] == row['winner_playfabid'] for row in templates) / len(templates)
+
+        players = [player for player in self.ranked if player['activity'] > 0]
+        cumulative = list(itertools.accumulate(player['activity'] for player in players))
+        total = cumulative[-1]
+
+        def pair():
+            first = players[self._weighted_pick(cumulative, total)]
+            second = first
+            while second is first:
+                second = players[self._weighted_pick(cumulative, total)]
+            return first, second
+
+        rows = []
+        for timestamp, winner, winner_score, loser, loser_score in self.simulate(self._count('duels'), pair, score_lines):
+            for player, kills, deaths in ((winner, winner_score, loser_score), (loser, loser_score, winner_score)):
+                player['kills'] += kills
+                player['deaths'] += deaths
+                player['matches'] += 1
+            submitter = winner if self.random.random() < submitted_by_winner else loser
+            rows.append((self._next_id('duels'), timestamp, submitter['playfabid'], winner['playfabid'], winner_score,
+                         winner['elo'], loser['playfabid'], loser_score, loser['elo']))
+        return rows
+
+    def duo_teams(self):
+        templates = self.templates['duo_teams']
+        retired_share = sum(row['retired'] == 't' for row in templates) / len(templates)
+        players = [player for player in self.ranked if player['activity'] > 0] or self.ranked
+        pairs, self.teams = set(), []
+        for _ in range(self._count('duo_teams')):
+            first, second = self.random.sample(players, 2)
+            key = tuple(sorted((first['playfabid'], second['playfabid'])))
+            if key in pairs:
+                continue
+            pairs.add(key)
+            self.teams.append({
+                'id': self._next_id('duo_teams'), 'players': (first, second),
+                'name': first['common_name'][:4] + second['common_name'][:4],
+                'skill': (first['skill'] + second['skill']) / 2,
+                'activity': (first['activity'] + second['activity']) / 2,
+                'retired': self.random.random() < retired_share,
+                'elo': 1500.0, 'matches': 0,
+            })
+
+    def duos(self):
+        # Duo match history isn't in the dump; play each team about as often as its players duel
+        teams = [team for team in self.teams if team['activity'] > 0]
+        if len(teams) < 2:
+            return []
+        score_lines = [(int(row['winner_score']), int(row['loser_score'])) for row in self.templates['duels']]
+        cumulative = list(itertools.accumulate(team['activity'] for team in teams))
+        total = cumulative[-1]
+
+        def pair():
+            first = teams[self._weighted_pick(cumulative, total)]
+            second = first
+            # Teams sharing a player can't play each other
+            while second is first or {p['playfabid'] for p in first['players']} & {p['playfabid'] for p in second['players']}:
+                second = teams[self._weighted_pick(cumulative, total)]
+            return first, second
+
+        rows = []
+        for timestamp, winner, winner_score, loser, loser_score in self.simulate(self._count('duo_teams') * 2, pair, score_lines):
+            winner['matches'] += 1
+            loser['matches'] += 1
+            rows.append((self._next_id('duos'), timestamp, winner['players'][0]['playfabid'], winner['id'], winner_score,
+                         winner['elo'], loser['id'], loser_score, loser['elo']))
+        return rows
+
+    def lts(self):
+        templates = self.templates['lts_teams']
+        roster_sizes = [len(json.loads(row['roster'])) for row in templates]
+        # A player is on at most one LTS team
+        available = [player for player in self.ranked if not player['retired']]
+        self.random.shuffle(available)
+        self.lts_teams = []
+        for _ in range(self._count('lts_teams')):
+            size = self.random.choice(roster_sizes)
+            if len(available) < size:
+                break
+            roster = [available.pop() for _ in range(size)]
+            self.lts_teams.append({
+                'id': self._next_id('lts_teams'), 'name': self._name() + " " + self.random.choice(["Steppas", "Guard", "Company", "Order", "Band"]),
+                'roster': roster, 'skill': sum(p['skill'] for p in roster) / size, 'elo': 1500.0,
+                'matches': 0, 'wins': 0, 'losses': 0,
+            })
+
+        match_templates = self.templates.get('lts_matches', [])
+        if len(self.lts_teams) < 2 or not match_templates:
+            return []
+        score_lines = [(int(row['winner_score']), int(row['loser_score'])) for row in match_templates]
+        confirmed_share = sum(row['confirmed'] == 't' for row in match_templates) / len(match_templates)
+
+        rows = []
+        for timestamp, winner, winner_score, loser, loser_score in self.simulate(self._count('lts_matches'), lambda: self.random.sample(self.lts_teams, 2), score_lines):
+            winner['matches'] += 1
+            winner['wins'] += 1
+            loser['matches'] += 1
+            loser['losses'] += 1
+            rows.append((self._next_id('lts_matches'), timestamp, self.random.choice(winner['roster'])['discordid'],
+                         self.random.choice(loser['roster'])['discordid'], winner['id'], winner_score, round(winner['elo']),
+                         loser['id'], loser_score, round(loser['elo']), 0, self.random.random() < confirmed_share))
+        return rows
+
+    def challenges(self):
+        templates = self.templates.get('challenges', [])
+        if not templates:
+            return []
+        rows = []
+        for timestamp in self._timestamps(self._count('challenges')):
+            template = self.random.choice(templates)
+            challenger, challenged = self.random.sample(self.ranked, 2)
+            bet = int(template['bet_amount'])
+            rows.append((self._next_id('challenges'), challenger['discordid'], challenged['discordid'], bet, bet * 2,
+                         template['status'], timestamp.astimezone(), timestamp.astimezone()))
+        return rows
+
+
+async def load(conn, generator, create_schema, ddl, truncate):
+    if create_schema:
+        await conn.execute(SUPPORT_SQL)
+        await conn.execute(ddl)
+        await conn.execute("SET search_path TO public")
+    elif truncate:
+        existing = [table for table in GENERATED_TABLES if await conn.fetchval("SELECT to_regclass($1)", f"public.{table}")]
+        await conn.execute(f"TRUNCATE {', '.join(existing)} RESTART IDENTITY CASCADE")
+    elif await conn.fetchval("SELECT EXISTS (SELECT 1 FROM ranked_players)"):
+        raise SystemExit("ranked_players is not empty; use --truncate to replace its data.")
+
+    has_duos = await conn.fetchval("SELECT to_regclass('public.duos') IS NOT NULL")
+
+    started = time.perf_counter()
+    generator.players()
+    duels = generator.duels()
+    generator.duo_teams()
+    duos = generator.duos() if has_duos else []
+    lts_matches = generator.lts()
+    challenges = generator.challenges()
+    print(f"Generated in {time.perf_counter() - started:.1f}s")
+
+    async def copy(table, columns, records):
+        started = time.perf_counter()
+        await conn.copy_records_to_table(table, records=records, columns=columns, schema_name='public')
+        print(f"  {table:<16} {len(records):>10} rows in {time.perf_counter() - started:.1f}s")
+        if 'id' in columns:
+            await conn.execute(f"SELECT setval(pg_get_serial_sequence('public.{table}', 'id'), GREATEST(MAX(id), 1)) FROM public.{table}")
+
+    registered = generator.ranked
+    async with conn.transaction():
+        await copy('players', ['id', 'playfabid', 'discordid', 'alias_history'],
+                   [(p['player_id'], p['playfabid'], p['discordid'], generator.alias_history(p['common_name'])) for p in registered]
+                   + [(p['player_id'], p['playfabid'], None, generator.alias_history(p['common_name'])) for p in generator.unregistered])
+        await copy('ranked_players', ['id', 'player_id', 'discord_username', 'kills', 'deaths', 'common_name', 'playfabid', 'discordid',
+                                      'matches', 'retired', 'gamename', 'elo_duelsx', 'coins'],
+                   [(index, p['player_id'], p['discord_username'], p['kills'], p['deaths'], p['common_name'], p['playfabid'], p['discordid'],
+                     p['matches'], p['retired'], p['gamename'], p['elo'], p['coins'] + 3 * p['matches']) for index, p in enumerate(registered, 1)])
+        await copy('duels', ['id', 'timestamp', 'submitting_playfabid', 'winner_playfabid', 'winner_score', 'winner_elo',
+                             'loser_playfabid', 'loser_score', 'loser_elo'], duels)
+        await copy('duo_teams', ['id', 'player1_id', 'player2_id', 'elo_rating', 'matches_played', 'team_name', 'retired'],
+                   [(t['id'], t['players'][0]['playfabid'], t['players'][1]['playfabid'], round(t['elo']), t['matches'], t['name'], t['retired'])
+                    for t in generator.teams])
+        if has_duos:
+            await copy('duos', ['id', 'timestamp', 'submitting_playfabid', 'winner_team_id', 'winner_score', 'winner_elo',
+                                'loser_team_id', 'loser_score', 'loser_elo'], duos)
+        await copy('lts_teams', ['id', 'team_name', 'team_owner', 'roster', 'elo_rating', 'matches_played', 'wins', 'losses'],
+                   [(t['id'], t['name'], t['roster'][0]['discordid'], json.dumps([str(p['discordid']) for p in t['roster']]),
+                     round(t['elo']), t['matches'], t['wins'], t['losses']) for t in generator.lts_teams])
+        await copy('lts_matches', ['id', 'match_timestamp', 'submitting_discordid', 'confirming_discordid', 'winner_team_id', 'winner_score',
+                                   'winner_elo', 'loser_team_id', 'loser_score', 'loser_elo', 'match_purse', 'confirmed'], lts_matches)
+        await copy('challenges', ['id', 'challenger_id', 'challenged_id', 'bet_amount', 'purse', 'status', 'created_at', 'updated_at'], challenges)
+        if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM house_account)"):
+            await conn.execute("INSERT INTO house_account (balance, payout_rate) VALUES (10, 5.00)")
+
+    await apply_migrations(conn, MIGRATIONS_DIR)
+    await conn.execute("ANALYZE")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=10, help="multiple of the dump's row counts, e.g. 10, 100 or 1000")
+    parser.add_argument('--extra-players', type=int, default=4, help="unregistered players (players rows only) per ranked player")
+    parser.add_argument('--dump', default=DEFAULT_DUMP)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--create-schema', action='store_true', help="create the schema first (empty database)")
+    parser.add_argument('--truncate', action='store_true', help="replace existing data in the generated tables")
+    args = parser.parse_args()
+
+    ddl, templates = parse_dump(args.dump)
+    generator = Generator(templates, args.scale, args.extra_players, args.seed)
+    conn = await asyncpg.connect(database=DATABASE, user=USER, host=HOST)
+    try:
+        await load(conn, generator, args.create_schema, ddl, args.truncate)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,416 @@
+#loadtest.py
+"""Offline load test: drives the bot's command callbacks through stub Discord objects.
+
+No gateway or Discord token is needed. Guilds, channels, members and interactions
+are stubs whose REST calls (send, defer, edit, ...) sleep for a configurable
+simulated latency. Commands run against the database named by CHIVBOT_DB_NAME /
+CHIVBOT_DB_USER / CHIVBOT_DB_HOST. That can be a local load of ranked_combat.sql
+or a synthetic scale-up. Match scenarios write results, so point it at a scratch
+database.
+
+    CHIVBOT_DB_NAME=chivstats_load python tools/loadtest.py --users 50 --duration 60
+
+Reports throughput, per-command latency percentiles, DB statements per command,
+pool acquire waits and peak connections in use. It exits non-zero on command
+errors or when --max-p95-ms is exceeded, so it can gate CI.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+
+import bot as chivbot
+import metrics
+from querytrace import ACQUIRE
+
+_ids = itertools.count(10**17)
+ERROR_MARKERS = ("error occurred", "not registered", "not found")
+
+
+class FakeREST:
+    """Simulated Discord REST latency; every call is also counted by metrics for the running command."""
+
+    def __init__(self, latency, jitter):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+    async def call(self, is_interaction_callback=False):
+        self.calls += 1
+        metrics._count_rest_call(is_interaction_callback)
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+
+class FakeMessage:
+    def __init__(self, rest, channel, author, content=None, embed=None, view=None):
+        self.id = next(_ids)
+        self.rest = rest
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.embeds = [embed] if embed else []
+        self.view = view
+
+    async def edit(self, content=None, embed=None, view=discord.utils.MISSING, **kwargs):
+        await self.rest.call()
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        if view is not discord.utils.MISSING:
+            self.view = view
+        return self
+
+    async def delete(self, **kwargs):
+        await self.rest.call()
+
+
+class FakeHistory:
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def flatten(self):
+        return self.messages
+
+
+class FakeChannel:
+    def __init__(self, rest, guild, name, channel_id=None):
+        self.id = channel_id or next(_ids)
+        self.rest = rest
+        self.guild = guild
+        self.name = name
+        self.last_message = None
+
+    async def send(self, content=None, embed=None, view=None, **kwargs):
+        await self.rest.call()
+        self.last_message = FakeMessage(self.rest, self, chivbot.bot.user, content, embed, view)
+        return self.last_message
+
+    def history(self, limit=1):
+        return FakeHistory([self.last_message] if self.last_message else [])
+
+
+class FakeMember:
+    def __init__(self, rest, member_id, name):
+        self.id = member_id
+        self.rest = rest
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{member_id}>"
+        self.roles = []
+        self.display_avatar = SimpleNamespace(url="https://cdn.discordapp.com/embed/avatars/0.png")
+
+    async def add_roles(self, *roles, **kwargs):
+        await self.rest.call()
+        self.roles.extend(roles)
+
+    async def remove_roles(self, *roles, **kwargs):
+        await self.rest.call()
+        self.roles = [role for role in self.roles if role not in roles]
+
+
+class FakeGuild:
+    def __init__(self, rest, guild_id, name, members, extra_channels=()):
+        self.id = guild_id
+        self.name = name
+        self.members = members
+        self.text_channels = [FakeChannel(rest, self, channel_name) for channel_name in ("chivstats-ranked", "ranked-audit", "ranked-leaderboards")]
+        self.text_channels += [FakeChannel(rest, self, channel_name, channel_id) for channel_id, channel_name in extra_channels]
+        self.roles = []
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+    def get_channel(self, channel_id):
+        return discord.utils.get(self.text_channels, id=channel_id)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **kwargs):
+        await self.interaction.rest.call(is_interaction_callback=True)
+        self._done = True
+
+    async def send_message(self, content=None, embed=None, view=None, ephemeral=False, **kwargs):
+        if self._done:
+            raise discord.InteractionResponded(self.interaction)
+        await self.interaction.rest.call(is_interaction_callback=True)
+        self._done = True
+        self.interaction.record(content, embed)
+        message = FakeMessage(self.interaction.rest, self.interaction.channel, chivbot.bot.user, content, embed, view)
+        self.interaction.sent.append(message)
+        return self.interaction
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, embed=None, view=None, ephemeral=False, **kwargs):
+        await self.interaction.rest.call()
+        self.interaction.record(content, embed)
+        message = FakeMessage(self.interaction.rest, self.interaction.channel, chivbot.bot.user, content, embed, view)
+        self.interaction.sent.append(message)
+        return message
+
+
+class FakeInteraction:
+    def __init__(self, rest, user, guild, channel, message=None):
+        self.rest = rest
+        self.user = user
+        self.guild = guild
+        self.channel = channel
+        self.message = message
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.sent = []
+        self.errors = []
+        self.command = None
+        self.options = []
+
+    def record(self, content, embed):
+        text = content or (embed.title if embed else "") or ""
+        if any(marker in text for marker in ERROR_MARKERS):
+            self.errors.append(text)
+
+    def view(self):
+        """The view the command attached to a message, if any (edits included)."""
+        for message in reversed(self.sent):
+            if message.view is not None:
+                return message, message.view
+        return None, None
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.rest = FakeREST(args.rest_latency_ms / 1000, args.rest_jitter_ms / 1000)
+        self.latencies = {}  # command -> [seconds]
+        self.errors = {}  # command -> count
+        self.operations = 0
+        self.peak_in_use = 0
+        self.duel_players = []
+        self.lts_teams = []
+        self.guilds = []
+
+    async def setup(self):
+        config = {
+            'slow_query_ms': self.args.slow_query_ms,
+            'pool_min_size': self.args.pool_min,
+            'pool_max_size': self.args.pool_max,
+        }
+        chivbot.bot.db_pool = await chivbot.create_pool(config)
+        chivbot.bot.config = config
+
+        async with chivbot.bot.db_pool.acquire() as conn:
+            players = await conn.fetch("""
+                SELECT discordid, playfabid, COALESCE(discord_username, common_name, playfabid) AS name
+                FROM ranked_players
+                WHERE retired = FALSE AND discordid IS NOT NULL AND playfabid IS NOT NULL
+                ORDER BY random()
+                LIMIT $1
+                """, self.args.players)
+            teams = await conn.fetch("SELECT roster FROM lts_teams WHERE jsonb_array_length(roster::jsonb) > 0 LIMIT 50")
+            await chivbot.profiles.load(conn)  # as in prepare_startup
+        if len(players) < 4:
+            raise SystemExit("Need at least 4 registered, active ranked_players to run the load test.")
+
+        members = {row['discordid']: FakeMember(self.rest, row['discordid'], row['name']) for row in players}
+        self.duel_players = list(members.values())
+        for team in teams:
+            roster = [int(member_id) for member_id in json.loads(team['roster'])]
+            for member_id in roster:
+                members.setdefault(member_id, FakeMember(self.rest, member_id, f"lts-{member_id}"))
+            self.lts_teams.append([members[member_id] for member_id in roster])
+
+        # Every stub guild sees every member; the audit guild also has the audit channel
+        guild_ids = chivbot.GUILD_IDS[:self.args.guilds] or [chivbot.target_guild_id]
+        guilds = []
+        for guild_id in guild_ids:
+            extra = [(chivbot.audit_channel_id, "chivstats-audit")] if guild_id == chivbot.target_guild_id else []
+            guilds.append(FakeGuild(self.rest, guild_id, f"guild-{guild_id}", members, extra))
+        chivbot.bot._connection._guilds = {guild.id: guild for guild in guilds}
+        chivbot.bot._connection.user = FakeMember(self.rest, next(_ids), "chivbot")
+        self.guilds = guilds
+
+        if self.args.lts:
+            chivbot.bot.load_extension("lts")
+
+    def interaction(self, user, message=None):
+        guild = random.choice(self.guilds)
+        channel = message.channel if message else guild.text_channels[0]
+        return FakeInteraction(self.rest, user, channel.guild, channel, message)
+
+    async def measure(self, name, callback, *args):
+        """Runs one callback as a measured command invocation, like the bot's invoke hooks."""
+        interaction = args[0]
+        ctx = SimpleNamespace(command=SimpleNamespace(qualified_name=name))
+        await metrics.command_started(ctx)
+        started = time.perf_counter()
+        try:
+            await callback(*args)
+        except Exception as e:
+            interaction.errors.append(repr(e))
+        finally:
+            self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+            await metrics.command_finished(ctx)
+            self.operations += 1
+            self.sample_pool()
+        if interaction.errors:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return interaction
+
+    def sample_pool(self):
+        pool = chivbot.bot.db_pool
+        self.peak_in_use = max(self.peak_in_use, pool.get_size() - pool.get_idle_size())
+
+    async def duel(self):
+        submitter, opponent = random.sample(self.duel_players, 2)
+        interaction = await self.measure("submit_duel", chivbot.submit_duel.callback, self.interaction(submitter), random.randint(0, 10), opponent, random.randint(0, 10))
+        message, view = interaction.view()
+        if view is not None:
+            await self.measure("submit_duel:confirm", view.confirm_button_clicked, self.interaction(opponent, message))
+
+    async def duo(self):
+        submitter, team_member, enemy1, enemy2 = random.sample(self.duel_players, 4)
+        interaction = await self.measure("submit_duo", chivbot.submit_duo.callback, self.interaction(submitter), team_member, random.randint(0, 10), enemy1, enemy2, random.randint(0, 10))
+        message, view = interaction.view()
+        if view is not None:
+            await self.measure("submit_duo:confirm", view.confirm_button_clicked, self.interaction(enemy1, message))
+
+    async def lts(self):
+        if len(self.lts_teams) < 2:
+            return
+        team1, team2 = random.sample(self.lts_teams, 2)
+        cog = chivbot.bot.get_cog("LTSCog")
+        interaction = await self.measure("submit_lts", cog.submit_lts.callback, cog, self.interaction(team1[0]), random.randint(0, 10), team2[0], random.randint(0, 10))
+        message, view = interaction.view()
+        if view is not None:
+            await self.measure("submit_lts:confirm", view.confirm_button_clicked, self.interaction(team2[0], message))
+
+    async def rank(self):
+        await self.measure("rank", chivbot.rank.callback, self.interaction(random.choice(self.duel_players)), None)
+
+    async def leaderboard(self):
+        await self.measure("leaderboard", chivbot.leaderboard.callback, self.interaction(random.choice(self.duel_players)), random.choice(["duels", "duos"]))
+
+    async def odds(self):
+        player1, player2 = random.sample(self.duel_players, 2)
+        await self.measure("odds", chivbot.odds.callback, self.interaction(player1), player1, player2)
+
+    async def user(self, deadline):
+        # Weighted towards reads, the way the bot is used
+        scenarios = [self.rank] * 4 + [self.leaderboard] * 3 + [self.odds] * 2 + [self.duel] * 2 + [self.duo]
+        if self.args.lts:
+            scenarios.append(self.lts)
+        while time.perf_counter() < deadline:
+            await random.choice(scenarios)()
+            if self.args.think_ms:
+                await asyncio.sleep(random.expovariate(1000 / self.args.think_ms))
+
+    async def run(self):
+        await self.setup()
+        output = io.StringIO() if not self.args.verbose else sys.stdout
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        with contextlib.redirect_stdout(output):
+            await asyncio.gather(*(self.user(deadline) for _ in range(self.args.users)))
+        elapsed = time.perf_counter() - started
+        await chivbot.bot.db_pool.close()
+        return elapsed
+
+    def report(self, elapsed):
+        def percentile(ordered, q):
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+        acquire = metrics.query_tracer.statements.get(ACQUIRE)
+        acquire_p99 = acquire.percentiles()[2] * 1000 if acquire else 0.0
+        result = {
+            'users': self.args.users,
+            'duration_s': round(elapsed, 2),
+            'operations': self.operations,
+            'throughput_per_s': round(self.operations / elapsed, 2),
+            'rest_calls': self.rest.calls,
+            'pool_max_size': self.args.pool_max,
+            'peak_connections_in_use': self.peak_in_use,
+            'acquire_p99_ms': round(acquire_p99, 2),
+            'commands': {},
+        }
+        for name, samples in sorted(self.latencies.items()):
+            ordered = sorted(samples)
+            statements = metrics.command_metrics.db_statements.get(name)
+            result['commands'][name] = {
+                'count': len(ordered),
+                'errors': self.errors.get(name, 0),
+                'p50_ms': round(percentile(ordered, 0.50), 1),
+                'p95_ms': round(percentile(ordered, 0.95), 1),
+                'p99_ms': round(percentile(ordered, 0.99), 1),
+                'max_ms': round(ordered[-1] * 1000, 1),
+                'db_statements_avg': round(statements.sum / statements.count, 1) if statements else 0,
+            }
+        return result
+
+
+def print_report(result):
+    print(f"{result['users']} users for {result['duration_s']}s: {result['operations']} operations, "
+          f"{result['throughput_per_s']}/s, {result['rest_calls']} simulated REST calls")
+    print(f"DB: peak {result['peak_connections_in_use']}/{result['pool_max_size']} pooled connections in use, "
+          f"acquire p99 {result['acquire_p99_ms']}ms")
+    print(f"{'command':<22}{'n':>7}{'err':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'stmts':>7}")
+    for name, row in result['commands'].items():
+        print(f"{name:<22}{row['count']:>7}{row['errors']:>6}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}{row['max_ms']:>9}{row['db_statements_avg']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10, help="concurrent simulated users")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to run")
+    parser.add_argument('--players', type=int, default=500, help="registered players to sample as members")
+    parser.add_argument('--guilds', type=int, default=len(chivbot.GUILD_IDS), help="stub guilds the bot is in")
+    parser.add_argument('--rest-latency-ms', type=float, default=80, help="mean simulated Discord REST latency")
+    parser.add_argument('--rest-jitter-ms', type=float, default=20)
+    parser.add_argument('--think-ms', type=float, default=0, help="mean pause between a user's commands")
+    parser.add_argument('--pool-min', type=int, default=2)
+    parser.add_argument('--pool-max', type=int, default=10)
+    parser.add_argument('--slow-query-ms', type=float, default=250)
+    parser.add_argument('--lts', action='store_true', help="also drive submit_lts (loads the LTS cog)")
+    parser.add_argument('--json', help="write the report to this file as JSON")
+    parser.add_argument('--max-p95-ms', type=float, help="fail if any command's p95 exceeds this")
+    parser.add_argument('--verbose', action='store_true', help="show the bot's own output")
+    args = parser.parse_args()
+
+    load_test = LoadTest(args)
+    elapsed = asyncio.run(load_test.run())
+    result = load_test.report(elapsed)
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(result, file, indent=2)
+
+    failed = [name for name, row in result['commands'].items() if row['errors']]
+    if args.max_p95_ms is not None:
+        failed += [name for name, row in result['commands'].items() if row['p95_ms'] > args.max_p95_ms]
+    if failed:
+        print(f"FAILED: {', '.join(sorted(set(failed)))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()